@@ -0,0 +1,96 @@
+"""
+Counts the server round trips of every psycopg2 connection opened in the process.
+
+install() wraps psycopg2.connect, so the connection pool, the standby collector and
+anything else opening connections through it are counted without being changed.
+A round trip is a statement sent with execute, executemany or callproc, a fetch
+from a named server-side cursor, a commit or a rollback.
+"""
+import threading
+import psycopg2
+import psycopg2.extensions
+
+_lock = threading.Lock()
+_round_trips = 0
+
+
+def _count():
+    global _round_trips
+    with _lock:
+        _round_trips += 1
+
+
+def round_trips():
+    """Returns the number of round trips counted since the process started."""
+    return _round_trips
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    """A cursor counting its statements and, when named, its fetches."""
+
+    def execute(self, query, vars=None):
+        _count()
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        _count()
+        return super().executemany(query, vars_list)
+
+    def callproc(self, procname, parameters=None):
+        _count()
+        return super().callproc(procname, parameters)
+
+    def fetchone(self):
+        if self.name is not None:
+            _count()
+        return super().fetchone()
+
+    def fetchmany(self, size=None):
+        if self.name is not None:
+            _count()
+        return super().fetchmany(size) if size is not None else super().fetchmany()
+
+    def fetchall(self):
+        if self.name is not None:
+            _count()
+        return super().fetchall()
+
+    def __iter__(self):
+        if self.name is None:
+            return super().__iter__()
+        return self._iter_named()
+
+    def _iter_named(self):
+        while True:
+            rows = self.fetchmany(self.itersize)
+            if not rows:
+                return
+            for row in rows:
+                yield row
+
+
+class CountingConnection(psycopg2.extensions.connection):
+    """A connection whose cursors are CountingCursors, counting its commits and rollbacks."""
+
+    def cursor(self, *args, **kwargs):
+        kwargs.setdefault("cursor_factory", CountingCursor)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self):
+        _count()
+        return super().commit()
+
+    def rollback(self):
+        _count()
+        return super().rollback()
+
+
+def install():
+    """Makes every connection opened through psycopg2.connect a CountingConnection."""
+    connect = psycopg2.connect
+
+    def counting_connect(*args, **kwargs):
+        kwargs.setdefault("connection_factory", CountingConnection)
+        return connect(*args, **kwargs)
+
+    psycopg2.connect = counting_connect
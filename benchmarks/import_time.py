@@ -0,0 +1,98 @@
+"""
+Startup benchmark of the pgindexinsight CLI.
+
+Runs `pgindexinsight --help` in fresh interpreters and fails when the median wall time
+exceeds the budget, or when the CLI module loads a dependency that only commands need.
+The slowest imports, from python -X importtime, are printed to point at a regression.
+
+Usage:
+    python benchmarks/import_time.py [--runs 10] [--budget-ms 150]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HELP_COMMAND = "import sys; sys.argv = ['pgindexinsight', '--help']; from pg_index_insight.cli import main; main()"
+DEFERRED_MODULES = (
+    "psycopg2",
+    "yaml",
+    "tabulate",
+    "sqlite3",
+    "pg_index_insight.database",
+    "pg_index_insight.snapshot",
+    "pg_index_insight.executor",
+)
+
+
+def run_python(code, *options):
+    """Runs code in a fresh interpreter importing the package from the repository, returning the finished process."""
+    environment = dict(os.environ, PYTHONPATH=REPOSITORY + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    return subprocess.run([sys.executable, *options, "-c", code], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          env=environment, universal_newlines=True)
+
+
+def help_wall_times(runs):
+    """Returns the wall time in milliseconds of runs executions of pgindexinsight --help."""
+    wall_times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        process = run_python(HELP_COMMAND)
+        wall_times.append((time.perf_counter() - started) * 1000)
+        if process.returncode != 0:
+            raise RuntimeError(f"pgindexinsight --help failed: {process.stderr}")
+    return wall_times
+
+
+def loaded_deferred_modules():
+    """Returns the deferred modules loaded by importing the CLI module."""
+    process = run_python(
+        "import sys, pg_index_insight.cli; "
+        f"print('\\n'.join(name for name in {DEFERRED_MODULES!r} if name in sys.modules))")
+    if process.returncode != 0:
+        raise RuntimeError(f"Importing pg_index_insight.cli failed: {process.stderr}")
+    return process.stdout.split()
+
+
+def slowest_imports(limit=10):
+    """Returns (cumulative microseconds, module) of the limit slowest imports of the CLI module."""
+    process = run_python("import pg_index_insight.cli", "-X", "importtime")
+    imports = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        imports.append((int(cumulative), module.strip()))
+    return sorted(imports, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10, help="Executions of pgindexinsight --help timed.")
+    parser.add_argument("--budget-ms", type=float, default=150.0, help="Budget of the median wall time.")
+    arguments = parser.parse_args()
+
+    wall_times = help_wall_times(arguments.runs)
+    median = statistics.median(wall_times)
+    print(f"pgindexinsight --help: median {median:.1f} ms, min {min(wall_times):.1f} ms, "
+          f"max {max(wall_times):.1f} ms over {arguments.runs} runs (budget {arguments.budget_ms:.0f} ms)")
+    print("Slowest imports (cumulative):")
+    for cumulative, module in slowest_imports():
+        print(f"  {cumulative / 1000:8.1f} ms  {module}")
+
+    failures = []
+    if median > arguments.budget_ms:
+        failures.append(f"median startup {median:.1f} ms exceeds the {arguments.budget_ms:.0f} ms budget")
+    loaded = loaded_deferred_modules()
+    if loaded:
+        failures.append(f"importing the CLI loads {', '.join(loaded)}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
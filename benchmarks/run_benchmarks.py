@@ -0,0 +1,274 @@
+"""
+Times every DatabaseManager detector and every CLI command on synthetic schemas of several sizes.
+
+For each scale, a database is filled with the synthetic_schema generator, then every
+target runs in a fresh interpreter, so its wall time, server round trips and peak RSS
+are its own. Results are written as JSON, and a previous result file can be given to
+print the change of every measurement.
+
+By default, a throwaway PostgreSQL cluster is created with initdb in a temporary
+directory and removed afterwards. --host, --port and --user point the benchmark at an
+existing server instead, whose role must be a superuser to mark indexes invalid.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--scales 1000,10000,100000] [--output bench_results.json]
+                                        [--compare previous.json] [--pg-bin /usr/lib/postgresql/16/bin]
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY = os.path.dirname(BENCHMARKS)
+BENCHMARK_DATABASE = "pgindexinsight_bench"
+BLOAT_THRESHOLD = 50
+
+DETECTORS = {
+    "fetch_unused_indexes": lambda manager: manager.fetch_unused_indexes(),
+    "fetch_invalid_indexes": lambda manager: manager.fetch_invalid_indexes(),
+    "fetch_duplicate_unique_indexes": lambda manager: manager.fetch_duplicate_unique_indexes(),
+    "fetch_duplicate_indexes": lambda manager: manager.fetch_duplicate_indexes(),
+    "get_unused_and_invalid_indexes": lambda manager: manager.get_unused_and_invalid_indexes(),
+    "get_bloated_indexes": lambda manager: manager.get_bloated_indexes(BLOAT_THRESHOLD),
+    "fetch_inefficient_indexes": lambda manager: manager.fetch_inefficient_indexes(BLOAT_THRESHOLD),
+}
+
+COMMANDS = {
+    "list-unused-indexes": ["list-unused-indexes", "--db-name", "bench"],
+    "list-invalid-indexes": ["list-invalid-indexes", "--db-name", "bench"],
+    "list-unemployed-indexes": ["list-unemployed-indexes", "--db-name", "bench"],
+    "list-bloated-btree-indexes": ["list-bloated-btree-indexes", "--db-name", "bench"],
+    "list-duplicate-indexes": ["list-duplicate-indexes", "--db-name", "bench"],
+    "plan-remediation": ["plan-remediation", "--db-name", "bench", "--window-minutes", "60"],
+    "scan-fleet": ["scan-fleet"],
+}
+
+
+def database_config(host, port, user, password):
+    return {"name": "bench", "host": host, "port": str(port), "dbname": BENCHMARK_DATABASE, "user": user,
+            "password": password or "bench", "max_connections": 4}
+
+
+def measure(kind, name, config_path, result_path):
+    """
+    Runs one target in this interpreter and writes its measurements to result_path.
+
+    Output goes to a file next to result_path, so printing does not add to the peak RSS.
+    Commands report their errors as an Error: line and not as an exception, so that line
+    is picked up as the error of the target.
+    """
+    import resource
+    sys.path.insert(0, REPOSITORY)
+    sys.path.insert(0, BENCHMARKS)
+    import counting
+    counting.install()
+    os.environ["CONFIG_FILE"] = config_path
+    error = None
+    output_path = result_path + ".out"
+    started = time.perf_counter()
+    with open(output_path, "w") as output, contextlib.redirect_stdout(output):
+        try:
+            if kind == "detector":
+                from pg_index_insight.database import DatabaseManager
+                with DatabaseManager(db_name="bench") as manager:
+                    DETECTORS[name](manager)
+            else:
+                from pg_index_insight.cli import main
+                try:
+                    main.main(args=COMMANDS[name], prog_name="pgindexinsight", standalone_mode=False)
+                except SystemExit as e:
+                    if e.code not in (None, 0):
+                        error = f"exit status {e.code}"
+        except Exception as e:
+            error = str(e)
+    wall_seconds = time.perf_counter() - started
+    with open(output_path) as output:
+        for line in output:
+            if error is None and line.startswith("Error: "):
+                error = line[len("Error: "):].strip()
+    os.unlink(output_path)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with open(result_path, "w") as result_file:
+        json.dump({
+            "wall_seconds": wall_seconds,
+            "round_trips": counting.round_trips(),
+            "peak_rss_bytes": peak_rss if sys.platform == "darwin" else peak_rss * 1024,
+            "error": error,
+        }, result_file)
+
+
+def run_target(kind, name, config_path):
+    """Measures one target in a fresh interpreter and returns its measurements."""
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as result_file:
+        result_path = result_file.name
+    try:
+        process = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--measure", kind, name, config_path, result_path],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        try:
+            with open(result_path) as result_file:
+                return json.load(result_file)
+        except ValueError:
+            return {"wall_seconds": None, "round_trips": None, "peak_rss_bytes": None,
+                    "error": process.stderr.strip().splitlines()[-1] if process.stderr.strip() else "no result"}
+    finally:
+        os.unlink(result_path)
+
+
+@contextlib.contextmanager
+def throwaway_cluster(pg_bin):
+    """Starts a temporary PostgreSQL cluster listening on a unix socket and yields (host, port, user)."""
+    initdb = os.path.join(pg_bin, "initdb") if pg_bin else shutil.which("initdb")
+    pg_ctl = os.path.join(pg_bin, "pg_ctl") if pg_bin else shutil.which("pg_ctl")
+    if not initdb or not pg_ctl:
+        raise RuntimeError("initdb and pg_ctl were not found. Pass --pg-bin, or --host to use an existing server.")
+    directory = tempfile.mkdtemp(prefix="pgindexinsight_bench_")
+    data_directory = os.path.join(directory, "data")
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    try:
+        subprocess.run([initdb, "-D", data_directory, "-U", "bench", "--auth=trust"], check=True,
+                       stdout=subprocess.DEVNULL)
+        options = (f"-p {port} -k {directory} -c listen_addresses='' -c fsync=off -c synchronous_commit=off "
+                   f"-c full_page_writes=off -c max_locks_per_transaction=1024 -c log_statement=none")
+        subprocess.run([pg_ctl, "-D", data_directory, "-o", options, "-l", os.path.join(directory, "server.log"),
+                        "-w", "start"], check=True, stdout=subprocess.DEVNULL)
+        try:
+            yield directory, port, "bench"
+        finally:
+            subprocess.run([pg_ctl, "-D", data_directory, "-m", "immediate", "-w", "stop"],
+                           stdout=subprocess.DEVNULL)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def build_database(config, spec):
+    """Creates the benchmark database again and builds the synthetic schema of spec in it."""
+    import psycopg2
+    import synthetic_schema
+    connection_kwargs = {key: config[key] for key in ("host", "port", "user", "password")}
+    connection = psycopg2.connect(dbname="postgres", **connection_kwargs)
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP DATABASE IF EXISTS {BENCHMARK_DATABASE}")
+        cursor.execute(f"CREATE DATABASE {BENCHMARK_DATABASE}")
+    connection.close()
+    connection = psycopg2.connect(dbname=BENCHMARK_DATABASE, **connection_kwargs)
+    try:
+        synthetic_schema.build(connection, spec, echo=print)
+    finally:
+        connection.close()
+
+
+def git_revision():
+    process = subprocess.run(["git", "-C", REPOSITORY, "rev-parse", "HEAD"], stdout=subprocess.PIPE,
+                             stderr=subprocess.DEVNULL, universal_newlines=True)
+    return process.stdout.strip() or None
+
+
+def run(scales, host, port, user, password, indexes_per_table):
+    """Builds every scale and measures every target on it, returning the result document."""
+    import synthetic_schema
+    results = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scales": [],
+    }
+    config = database_config(host, port, user, password)
+    with tempfile.TemporaryDirectory() as directory:
+        config_path = os.path.join(directory, "db_config.yaml")
+        with open(config_path, "w") as config_file:
+            # JSON is valid YAML, so the configuration loaders read it as is.
+            json.dump({"databases": [config]}, config_file)
+        for index_count in scales:
+            spec = synthetic_schema.default_spec(index_count, indexes_per_table)
+            print(f"Building the schema with {index_count} indexes.")
+            build_started = time.perf_counter()
+            build_database(config, spec)
+            scale = {"index_count": index_count, "spec": spec._asdict(),
+                     "build_seconds": time.perf_counter() - build_started, "targets": {}}
+            for kind, names in (("detector", DETECTORS), ("command", COMMANDS)):
+                for name in names:
+                    measurement = run_target(kind, name, config_path)
+                    scale["targets"][f"{kind}:{name}"] = measurement
+                    print(f"  {kind}:{name}: {format_measurement(measurement)}")
+            results["scales"].append(scale)
+    return results
+
+
+def format_measurement(measurement):
+    if measurement["error"]:
+        return f'error: {measurement["error"]}'
+    return (f'{measurement["wall_seconds"]:.2f}s, {measurement["round_trips"]} round trips, '
+            f'{measurement["peak_rss_bytes"] / 2 ** 20:.0f} MB peak RSS')
+
+
+def compare(previous, current):
+    """Prints the change of every measurement present in both result documents."""
+    previous_scales = {scale["index_count"]: scale for scale in previous["scales"]}
+    for scale in current["scales"]:
+        previous_scale = previous_scales.get(scale["index_count"])
+        if previous_scale is None:
+            continue
+        print(f'Compared with {previous.get("revision")} at {scale["index_count"]} indexes:')
+        for target, measurement in scale["targets"].items():
+            before = previous_scale["targets"].get(target)
+            if before is None or before["error"] or measurement["error"]:
+                continue
+            changes = []
+            for key in ("wall_seconds", "round_trips", "peak_rss_bytes"):
+                if before[key]:
+                    changes.append(f'{key} {(measurement[key] / before[key] - 1) * 100:+.0f}%')
+            print(f'  {target}: {", ".join(changes)}')
+
+
+def main():
+    if len(sys.argv) == 6 and sys.argv[1] == "--measure":
+        measure(*sys.argv[2:])
+        return 0
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", default="1000,10000,100000", help="Comma separated numbers of indexes.")
+    parser.add_argument("--indexes-per-table", type=int, default=10, help="Indexes of every synthetic table.")
+    parser.add_argument("--output", default="bench_results.json", help="Result file written.")
+    parser.add_argument("--compare", default=None, help="Previous result file to compare with.")
+    parser.add_argument("--pg-bin", default=None, help="Directory of initdb and pg_ctl for the throwaway cluster.")
+    parser.add_argument("--host", default=None, help="Existing server to use instead of a throwaway cluster.")
+    parser.add_argument("--port", type=int, default=5432)
+    parser.add_argument("--user", default="postgres")
+    parser.add_argument("--password", default=os.getenv("PGPASSWORD"))
+    arguments = parser.parse_args()
+    sys.path.insert(0, BENCHMARKS)
+    scales = [int(scale) for scale in arguments.scales.split(",")]
+    if not arguments.host and hasattr(os, "geteuid") and os.geteuid() == 0:
+        parser.error("initdb refuses to run as root. Run the benchmark as an unprivileged user, "
+                     "or pass --host to use an existing server.")
+
+    if arguments.host:
+        results = run(scales, arguments.host, arguments.port, arguments.user, arguments.password,
+                      arguments.indexes_per_table)
+    else:
+        with throwaway_cluster(arguments.pg_bin) as (host, port, user):
+            results = run(scales, host, port, user, None, arguments.indexes_per_table)
+    with open(arguments.output, "w") as output:
+        json.dump(results, output, indent=2)
+    print(f"Results written to {arguments.output}")
+    if arguments.compare:
+        with open(arguments.compare) as previous:
+            compare(json.load(previous), results)
+    return 1 if any(measurement["error"] for scale in results["scales"]
+                    for measurement in scale["targets"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""
+Builds a reproducible synthetic schema for the detector benchmarks.
+
+Every table gets indexes_per_table indexes drawn, in a fixed order, from a cycle of
+index shapes that covers what the detectors look for:
+
+- a primary key, plain single column and multi column indexes;
+- left-prefix redundancies, an index on (c1) next to one on (c1, c2);
+- exact duplicates, unique and non-unique;
+- partial and expression indexes, which must not be matched with plain ones.
+
+On top of that, one table out of invalid_every has an index marked invalid. One out of
+bloat_every is filled with bloat_rows rows, of which 80% are then deleted, leaving its
+btree indexes bloated. One out of partition_every is replaced by a table with
+partitions_per_table partitions, so its indexes are counted once per partition. One
+index of every table, on c1, is scanned, so not every index is unused.
+
+The same scale and options always produce the same schema.
+"""
+from collections import namedtuple
+
+SchemaSpec = namedtuple("SchemaSpec", [
+    "index_count", "indexes_per_table", "invalid_every", "bloat_every", "bloat_rows", "partition_every",
+    "partitions_per_table", "schema_name",
+])
+
+INDEX_SHAPES = (
+    ("single", "(c1)"),
+    ("prefix", "(c1, c2)"),
+    ("duplicate", "(c2)"),
+    ("duplicate", "(c2)"),
+    ("unique", "(c3)"),
+    ("unique", "(c3)"),
+    ("multi", "(c4, c5, c6)"),
+    ("partial", "(c4) WHERE c6 > 0"),
+    ("expression", "(lower(t1))"),
+    ("single", "(c5)"),
+    ("prefix", "(c5, c6, t1)"),
+    ("single", "(t1)"),
+)
+
+
+def default_spec(index_count, indexes_per_table=10, schema_name="bench"):
+    """Returns the benchmark SchemaSpec of a scale, in total number of indexes."""
+    return SchemaSpec(index_count=index_count, indexes_per_table=indexes_per_table, invalid_every=7,
+                      bloat_every=50, bloat_rows=20000, partition_every=100, partitions_per_table=4,
+                      schema_name=schema_name)
+
+
+def table_count(spec):
+    """Returns the number of tables holding spec.index_count indexes."""
+    return max(1, spec.index_count // spec.indexes_per_table)
+
+
+def _table_statements(spec, position):
+    """Returns the statements creating one table and its indexes."""
+    table = f"{spec.schema_name}.t{position:06d}"
+    partitioned = spec.partition_every and position % spec.partition_every == spec.partition_every - 1
+    columns = "id bigint NOT NULL, c1 int, c2 int, c3 int, c4 int, c5 int, c6 int, t1 text"
+    statements = []
+    if partitioned:
+        statements.append(f"CREATE TABLE {table} ({columns}) PARTITION BY RANGE (id)")
+        step = max(1, spec.bloat_rows // spec.partitions_per_table)
+        for partition in range(spec.partitions_per_table):
+            statements.append(
+                f"CREATE TABLE {table}_p{partition} PARTITION OF {table} "
+                f"FOR VALUES FROM ({partition * step}) TO ({(partition + 1) * step})")
+    else:
+        statements.append(f"CREATE TABLE {table} ({columns})")
+    index_definitions = ["PRIMARY KEY (id)"]
+    for shape_position in range(spec.indexes_per_table - 1):
+        index_definitions.append(INDEX_SHAPES[shape_position % len(INDEX_SHAPES)])
+    for index_position, definition in enumerate(index_definitions):
+        if definition == "PRIMARY KEY (id)":
+            statements.append(f"ALTER TABLE {table} ADD PRIMARY KEY (id)")
+            continue
+        shape, columns_and_predicate = definition
+        if partitioned and shape == "unique":
+            shape, columns_and_predicate = "single", "(c6)"
+        unique = "UNIQUE " if shape == "unique" else ""
+        statements.append(
+            f"CREATE {unique}INDEX t{position:06d}_i{index_position:02d} ON {table} {columns_and_predicate}")
+    return statements
+
+
+def _data_statements(spec, position):
+    """Returns the statements filling a table, and bloating the ones out of bloat_every."""
+    table = f"{spec.schema_name}.t{position:06d}"
+    bloated = spec.bloat_every and position % spec.bloat_every == 0
+    rows = spec.bloat_rows if bloated else 100
+    statements = [
+        f"INSERT INTO {table} SELECT g, g % 97, g % 89, g, g % 83, g % 79, g % 5, 'v' || g "
+        f"FROM generate_series(0, {rows - 1}) AS g"
+    ]
+    if bloated:
+        statements.append(f"DELETE FROM {table} WHERE id % 5 <> 0")
+    return statements
+
+
+def schema_statements(spec, tables_per_batch=50):
+    """
+    Yields batches of statements building the schema, one multi-statement string per batch.
+
+    Each batch runs in its own transaction, which keeps the number of locks held at once
+    below max_locks_per_transaction.
+    """
+    yield f"DROP SCHEMA IF EXISTS {spec.schema_name} CASCADE; CREATE SCHEMA {spec.schema_name}"
+    batch = []
+    for position in range(table_count(spec)):
+        batch.extend(_table_statements(spec, position))
+        batch.extend(_data_statements(spec, position))
+        if (position + 1) % tables_per_batch == 0:
+            yield ";\n".join(batch)
+            batch = []
+    if batch:
+        yield ";\n".join(batch)
+
+
+def finishing_statements(spec):
+    """
+    Returns the statements run once the tables exist: marking indexes invalid, scanning one
+    index per table and collecting statistics.
+
+    Marking an index invalid updates pg_index directly, so the benchmark role must be a
+    superuser. This only ever runs against the throwaway benchmark database.
+    """
+    statements = []
+    if spec.invalid_every:
+        statements.append(
+            f"""UPDATE pg_index SET indisvalid = false
+                WHERE indexrelid IN (
+                    SELECT c.oid FROM pg_class AS c JOIN pg_namespace AS n ON n.oid = c.relnamespace
+                    WHERE n.nspname = '{spec.schema_name}' AND c.relkind = 'i'
+                      AND c.relname ~ '^t[0-9]+_i01$'
+                      AND substring(c.relname from 2 for 6)::int % {spec.invalid_every} = 0
+                )""")
+    statements.append("SET enable_seqscan = off")
+    scans = [f"SELECT count(*) FROM {spec.schema_name}.t{position:06d} WHERE c1 = 1"
+             for position in range(table_count(spec))]
+    for start in range(0, len(scans), 500):
+        statements.append(";\n".join(scans[start:start + 500]))
+    statements.append("RESET enable_seqscan")
+    statements.append("ANALYZE")
+    return statements
+
+
+def build(connection, spec, echo=None):
+    """Builds the schema of spec on an open psycopg2 connection."""
+    connection.autocommit = False
+    with connection.cursor() as cursor:
+        for batch_position, batch in enumerate(schema_statements(spec)):
+            cursor.execute(batch)
+            connection.commit()
+            if echo is not None and batch_position % 20 == 0:
+                echo(f"Built batch {batch_position} of the {spec.index_count} index schema.")
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        for statement in finishing_statements(spec):
+            cursor.execute(statement)
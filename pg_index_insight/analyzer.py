@@ -0,0 +1,396 @@
+import math
+
+PAGE_HEADER_SIZE = 24
+BTREE_PAGE_OPAQUE_SIZE = 16
+
+
+def index_signature(record):
+    """
+    Returns the canonical structural signature of an index.
+
+    Two indexes with the same signature are interchangeable: they are on the same table,
+    use the same access method, cover the same key and INCLUDE columns with the same
+    operator classes, collations and sort options, and have the same expressions,
+    predicate and uniqueness.
+    """
+    return (
+        record.table_oid,
+        record.index_type,
+        record.is_unique,
+        tuple(record.column_numbers),
+        record.key_column_count,
+        tuple(record.operator_classes),
+        tuple(record.collations),
+        tuple(record.column_options),
+        record.expressions,
+        record.predicate,
+    )
+
+
+def duplicate_winner_order(record):
+    """
+    Sort key placing the index to keep first: primary keys, then indexes attached to a partitioned
+    index, which cannot be dropped on their own, then the most scanned, then the oldest.
+    """
+    return (not record.is_primary, record.parent_index_oid is None, -(record.index_scans or 0), record.index_oid)
+
+
+def key_path(record):
+    """Returns the key columns of an index as (column number, operator class, collation, sort option) steps."""
+    count = record.key_column_count
+    return tuple(zip(
+        record.column_numbers[:count],
+        record.operator_classes[:count],
+        record.collations[:count],
+        record.column_options[:count],
+    ))
+
+
+class PrefixTrie:
+    """
+    A trie of index key paths where every node remembers one index extending past it.
+
+    Inserting every index of a table and looking up every candidate costs time linear in
+    the total number of key columns, instead of comparing every pair of indexes.
+    """
+    __slots__ = ("children", "extended_by")
+
+    def __init__(self):
+        self.children = {}
+        self.extended_by = None
+
+    def insert(self, path, record):
+        """Adds the key path of an index, marking every proper prefix as extended by it."""
+        node = self
+        for step in path:
+            if node.extended_by is None:
+                node.extended_by = record
+            node = node.children.setdefault(step, PrefixTrie())
+
+    def find_extending(self, path):
+        """Returns an index whose key path strictly extends the given path, or None."""
+        node = self
+        for step in path:
+            node = node.children.get(step)
+            if node is None:
+                return None
+        return node.extended_by
+
+
+def estimate_btree_bloat(record, columns, block_size, max_align):
+    """
+    Estimates the bloat of a btree index from its size and column statistics.
+
+    This is the statistical estimate of the well known btree bloat query: the expected
+    number of leaf pages is derived from reltuples, the average key width from pg_stats
+    and the fillfactor, and compared against relpages.
+
+    Returns:
+        tuple: (bloat_pct, bloat_bytes), or None when the index cannot be estimated.
+    """
+    if not columns or not record.relpages:
+        return None
+    if max(column.null_frac for column in columns) == 0:
+        index_tuple_hdr_bm = 8
+    else:
+        index_tuple_hdr_bm = 8 + ((32 + 8 - 1) // 8)
+    null_data_width = sum((1 - column.null_frac) * column.avg_width for column in columns)
+    hdr_remainder = index_tuple_hdr_bm % max_align
+    null_data_hdr_width = index_tuple_hdr_bm + max_align - (max_align if hdr_remainder == 0 else hdr_remainder)
+    width_remainder = int(round(null_data_width)) % max_align
+    if null_data_width == 0:
+        width_padding = 0
+    elif width_remainder == 0:
+        width_padding = max_align
+    else:
+        width_padding = width_remainder
+    null_data_hdr_width += null_data_width + max_align - width_padding
+
+    usable_space = block_size - BTREE_PAGE_OPAQUE_SIZE - PAGE_HEADER_SIZE
+    tuples_per_page = math.floor(usable_space * record.fillfactor / (100 * (4 + null_data_hdr_width)))
+    if tuples_per_page <= 0:
+        return None
+    estimated_pages = 1 + math.ceil(max(record.reltuples, 0) / tuples_per_page)
+    bloat_pct = 100 * (record.relpages - estimated_pages) / record.relpages
+    bloat_bytes = block_size * (record.relpages - estimated_pages) if record.relpages > estimated_pages else 0
+    return bloat_pct, bloat_bytes
+
+
+class PartitionRollup:
+    """
+    Sums the size and usage of partition indexes into the partitioned indexes they are attached to.
+
+    Every leaf partition index adds its size and scans to the partitioned index it is
+    attached to, and through it to every partitioned index above, following the pg_inherits
+    links of the catalog. A partitioned index is unused only when it has partitions and
+    every one of them is unused. One entry is kept per partitioned index, whatever the
+    number of partitions, and tables can be added in any order.
+    """
+
+    def __init__(self, is_unused):
+        self.is_unused = is_unused
+        self._parent_index_oids = {}
+        self._leaf_totals = {}
+
+    def add(self, records):
+        """Adds the IndexRecords of one table."""
+        for record in records:
+            if record.parent_index_oid is None:
+                continue
+            if record.is_partitioned:
+                self._parent_index_oids[record.index_oid] = record.parent_index_oid
+                continue
+            totals = self._leaf_totals.setdefault(record.parent_index_oid, [0, 0, 0, True])
+            totals[0] += 1
+            totals[1] += record.index_size_bytes or 0
+            totals[2] += record.index_scans or 0
+            totals[3] = totals[3] and self.is_unused(record)
+
+    def totals(self):
+        """Returns partitioned index oid to [partitions, size bytes, scans, all unused] over its leaf partitions."""
+        totals = {}
+        for parent_index_oid, (partitions, size_bytes, scans, unused) in self._leaf_totals.items():
+            index_oid = parent_index_oid
+            while index_oid is not None:
+                index_totals = totals.setdefault(index_oid, [0, 0, 0, True])
+                index_totals[0] += partitions
+                index_totals[1] += size_bytes
+                index_totals[2] += scans
+                index_totals[3] = index_totals[3] and unused
+                index_oid = self._parent_index_oids.get(index_oid)
+        return totals
+
+
+class IndexAnalyzer:
+    """
+    Evaluates the unused, invalid, duplicate, redundant and bloat rules table by table.
+
+    The source is a CatalogSnapshot held in memory or a CatalogStream read from server-side
+    cursors. Every rule only looks at the indexes of one table at a time, so evaluate runs
+    all requested rules in a single pass without holding the whole catalog in memory.
+
+    An index is unused when idx_scan is zero, or, when unused_index_oids from a
+    UsageHistory window is given, when its oid is in that set.
+
+    Indexes of partitioned tables are reported once per partitioned index instead of once
+    per partition. The unused, duplicate and redundant rules never report an index attached
+    to a partitioned index, which cannot be dropped on its own, and evaluate the partitioned
+    index instead, with the size and scans of all its partitions summed by a PartitionRollup.
+    As partitions may come after their partitioned table, partitioned tables are evaluated
+    at the end of the pass. The invalid and bloat rules still report partition indexes,
+    which are rebuilt one by one.
+
+    Attributes:
+        partition_counts (dict): Partitioned index oid to its number of leaf partitions, filled by evaluate.
+    """
+
+    RULES = ("unused", "invalid", "duplicate", "duplicate_unique", "redundant", "bloat")
+
+    def __init__(self, snapshot, bloat_cache=None, unused_index_oids=None):
+        self.snapshot = snapshot
+        self.bloat_cache = bloat_cache
+        self.unused_index_oids = unused_index_oids
+        self.partition_counts = {}
+        self._unused_partitioned_oids = set()
+
+    def evaluate(self, rules, bloat_threshold=None):
+        """
+        Yields (rule, record, related) for every index matching one of the rules, in one pass over the tables.
+
+        related is the index kept for duplicate rules, the covering index for redundant,
+        (bloat_pct, bloat_bytes) for bloat and None otherwise. Bloat estimates above
+        bloat_threshold are yielded, or all of them when it is None. The records of
+        partitioned indexes carry the summed size and scans of their partitions.
+        """
+        unknown = set(rules) - set(self.RULES)
+        if unknown:
+            raise ValueError(f"Unknown rules: {', '.join(sorted(unknown))}")
+        relfilenodes = {}
+        rollup = PartitionRollup(self._is_unused)
+        partitioned_groups = []
+        for group in self.snapshot.iter_tables():
+            rollup.add(group.indexes)
+            for record in group.indexes:
+                relfilenodes[record.index_oid] = record.relfilenode
+            if any(record.is_partitioned for record in group.indexes):
+                partitioned_groups.append(group)
+                continue
+            for match in self._evaluate_group(group, rules, bloat_threshold):
+                yield match
+        if partitioned_groups:
+            totals = rollup.totals()
+            self.partition_counts = {index_oid: index_totals[0] for index_oid, index_totals in totals.items()}
+            self._unused_partitioned_oids = {
+                index_oid for index_oid, index_totals in totals.items() if index_totals[0] and index_totals[3]
+            }
+            for group in partitioned_groups:
+                indexes = [
+                    record._replace(index_size_bytes=totals[record.index_oid][1],
+                                    index_scans=totals[record.index_oid][2])
+                    if record.index_oid in totals else record
+                    for record in group.indexes
+                ]
+                for match in self._evaluate_group(group._replace(indexes=indexes), rules, bloat_threshold):
+                    yield match
+        if "bloat" in rules and self.bloat_cache is not None:
+            self.bloat_cache.evict_missing(relfilenodes)
+
+    def _evaluate_group(self, group, rules, bloat_threshold):
+        """Yields (rule, record, related) for every index of one table matching one of the rules."""
+        if "unused" in rules:
+            for record in self._unused(group):
+                yield "unused", record, None
+        if "invalid" in rules:
+            for record in self._invalid(group):
+                yield "invalid", record, None
+        if "duplicate_unique" in rules:
+            for loser, winner in self._duplicates(group, True):
+                yield "duplicate_unique", loser, winner
+        if "duplicate" in rules:
+            for loser, winner in self._duplicates(group, False):
+                yield "duplicate", loser, winner
+        if "redundant" in rules:
+            for record, covering in self._redundant(group):
+                yield "redundant", record, covering
+        if "bloat" in rules:
+            for record, bloat_pct, bloat_bytes in self._bloat_estimates(group):
+                if bloat_threshold is None or bloat_pct > bloat_threshold:
+                    yield "bloat", record, (bloat_pct, bloat_bytes)
+
+    def unused_indexes(self):
+        """Returns indexes that were never scanned and do not back a primary key or unique constraint."""
+        return [record for _, record, _ in self.evaluate(("unused",))]
+
+    def invalid_indexes(self):
+        """Returns indexes left invalid, for example by a failed concurrent build."""
+        return [record for _, record, _ in self.evaluate(("invalid",))]
+
+    def duplicate_index_groups(self, unique):
+        """
+        Groups valid indexes, unique or not, sharing a structural signature.
+
+        Returns:
+            list: (winner, losers) tuples, where winner is the index to keep and losers its duplicates.
+        """
+        return [
+            duplicate_group
+            for group in self.snapshot.iter_tables()
+            for duplicate_group in self._duplicate_groups(group, unique)
+        ]
+
+    def duplicate_indexes(self, unique):
+        """Returns (loser, winner) for every valid index, unique or not, duplicating another index on its table."""
+        rule = "duplicate_unique" if unique else "duplicate"
+        return [(loser, winner) for _, loser, winner in self.evaluate((rule,))]
+
+    def unused_redundant_indexes(self):
+        """Returns (record, covering index) for unused btree indexes whose key is a left prefix of another index."""
+        return [(record, covering) for _, record, covering in self.evaluate(("redundant",))]
+
+    def btree_bloat_estimates(self):
+        """
+        Returns (record, bloat_pct, bloat_bytes) for every btree index that can be estimated.
+
+        With a BloatCache, unchanged indexes reuse their cached estimate, new estimates are
+        stored and entries of dropped or rewritten indexes are evicted.
+        """
+        return [(record,) + estimate for _, record, estimate in self.evaluate(("bloat",))]
+
+    def bloated_indexes(self, bloat_threshold):
+        """Returns (record, bloat_pct, bloat_bytes) for every btree index whose estimated bloat exceeds the threshold."""
+        return [(record,) + estimate for _, record, estimate in self.evaluate(("bloat",), bloat_threshold)]
+
+    def _is_unused(self, record):
+        if record.is_partitioned:
+            return record.index_oid in self._unused_partitioned_oids
+        if self.unused_index_oids is not None:
+            return record.index_oid in self.unused_index_oids
+        return record.index_scans == 0
+
+    def _unused(self, group):
+        return [
+            record for record in group.indexes
+            if self._is_unused(record) and not record.is_primary and not record.is_unique
+            and record.parent_index_oid is None
+        ]
+
+    @staticmethod
+    def _invalid(group):
+        return [record for record in group.indexes if not record.is_valid]
+
+    @staticmethod
+    def _duplicate_groups(group, unique):
+        """
+        Returns (winner, losers) for the indexes of one table sharing a structural signature.
+
+        Indexes attached to a partitioned index are never losers, their partitioned index is.
+        """
+        signatures = {}
+        for record in group.indexes:
+            if record.is_unique != unique or not (record.is_valid and record.is_ready):
+                continue
+            signatures.setdefault(index_signature(record), []).append(record)
+        duplicate_groups = []
+        for records in signatures.values():
+            if len(records) > 1:
+                records.sort(key=duplicate_winner_order)
+                losers = [record for record in records[1:] if record.parent_index_oid is None]
+                if losers:
+                    duplicate_groups.append((records[0], losers))
+        return duplicate_groups
+
+    def _duplicates(self, group, unique):
+        return [
+            (loser, winner)
+            for winner, losers in self._duplicate_groups(group, unique)
+            for loser in losers
+        ]
+
+    def _redundant(self, group):
+        """
+        Returns (record, covering index) for unused btree indexes of one table whose key is a left prefix of another.
+
+        Key columns only match with the same operator class, collation and sort option, and
+        the covering index must be a valid btree with the same predicate. Unique, primary key
+        and expression indexes are never reported, so a unique or partial index is not
+        reported as redundant to a plain one.
+        """
+        tries = {}
+        for record in group.indexes:
+            if record.index_type == "btree" and record.is_valid:
+                tries.setdefault(record.predicate, PrefixTrie()).insert(key_path(record), record)
+        redundant = []
+        for record in group.indexes:
+            if (not self._is_unused(record) or record.is_primary or record.is_unique
+                    or record.expressions is not None or record.index_type != "btree"
+                    or record.parent_index_oid is not None):
+                continue
+            trie = tries.get(record.predicate)
+            covering = trie.find_extending(key_path(record)) if trie is not None else None
+            if covering is not None:
+                redundant.append((record, covering))
+        return redundant
+
+    def _bloat_estimates(self, group):
+        estimates = []
+        for record in group.indexes:
+            if record.index_type != "btree" or not record.relpages:
+                continue
+            if record.index_oid in self.snapshot.unread_index_oids:
+                # Its column statistics could not be read, so no estimate is made or cached.
+                continue
+            estimate = self._bloat_estimate(record, group.columns.get(record.index_oid))
+            if estimate is not None:
+                estimates.append((record,) + estimate)
+        return estimates
+
+    def _bloat_estimate(self, record, columns):
+        """Returns the bloat estimate of a btree index, from the cache when its inputs are unchanged."""
+        if self.bloat_cache is not None:
+            hit, estimate = self.bloat_cache.get(record)
+            if hit:
+                return estimate
+        estimate = estimate_btree_bloat(record, columns, self.snapshot.block_size, self.snapshot.max_align)
+        if self.bloat_cache is not None:
+            self.bloat_cache.put(record, estimate)
+        return estimate
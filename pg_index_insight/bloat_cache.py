@@ -0,0 +1,91 @@
+import json
+import os
+import re
+
+CACHE_FORMAT_VERSION = 1
+
+
+class BloatCache:
+    """
+    A local on-disk cache of btree bloat estimates, keyed by index oid and relfilenode.
+
+    An entry is reused only while the inputs of the estimate are unchanged: the index
+    relfilenode, relpages, reltuples and fillfactor, and the last analyze time of its
+    table, which is when the pg_stats rows the estimate reads can change. Entries of
+    dropped or rewritten indexes are evicted.
+
+    Attributes:
+        path (str): Cache file location.
+        hits (int): Lookups answered from the cache during this run.
+        misses (int): Lookups that required a new estimate during this run.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as cache_file:
+                    cache = json.load(cache_file)
+                if cache.get("version") == CACHE_FORMAT_VERSION:
+                    self._entries = cache.get("entries", {})
+            except (OSError, ValueError):
+                self._entries = {}
+
+    @classmethod
+    def for_database(cls, cache_dir, config):
+        """Opens the cache file of a configured database inside cache_dir."""
+        os.makedirs(cache_dir, exist_ok=True)
+        name = f'{config.get("host", "localhost")}_{config.get("port", "5432")}_{config.get("dbname")}'
+        return cls(os.path.join(cache_dir, re.sub(r'[^A-Za-z0-9_.-]', '_', name) + '.json'))
+
+    @staticmethod
+    def _inputs(record):
+        """Returns the estimate inputs an entry is valid for."""
+        last_analyzed = record.table_last_analyzed.isoformat() if record.table_last_analyzed else None
+        return [record.relfilenode, record.relpages, record.reltuples, record.fillfactor, last_analyzed]
+
+    def contains(self, record):
+        """Returns True when a still valid estimate of the index is cached, without counting a lookup."""
+        entry = self._entries.get(str(record.index_oid))
+        return entry is not None and entry["inputs"] == self._inputs(record)
+
+    def get(self, record):
+        """Returns (True, estimate) on a hit, where estimate may be None for indexes that cannot be estimated."""
+        if self.contains(record):
+            self.hits += 1
+            estimate = self._entries[str(record.index_oid)]["estimate"]
+            return True, tuple(estimate) if estimate is not None else None
+        self.misses += 1
+        return False, None
+
+    def put(self, record, estimate):
+        """Stores the estimate computed for an index."""
+        self._entries[str(record.index_oid)] = {
+            "inputs": self._inputs(record),
+            "estimate": list(estimate) if estimate is not None else None,
+        }
+
+    def evict_missing(self, relfilenodes):
+        """Drops entries of indexes no longer present, or rewritten since they were cached, given index oid to relfilenode."""
+        for index_oid in list(self._entries):
+            relfilenode = relfilenodes.get(int(index_oid))
+            if relfilenode is None or self._entries[index_oid]["inputs"][0] != relfilenode:
+                del self._entries[index_oid]
+                self.evicted += 1
+
+    @property
+    def hit_rate(self):
+        """Share of lookups answered from the cache, between 0 and 1."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def save(self):
+        """Writes the cache atomically, so an interrupted run never leaves a corrupt file behind."""
+        temporary_path = f'{self.path}.tmp'
+        with open(temporary_path, 'w') as cache_file:
+            json.dump({"version": CACHE_FORMAT_VERSION, "entries": self._entries}, cache_file)
+        os.replace(temporary_path, self.path)
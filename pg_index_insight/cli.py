@@ -1,16 +1,392 @@
 import click
-from tabulate import tabulate
+import functools
+import heapq
+import logging
 import time
-from .utils import generate_index_report
-from .utils import generate_command
-from .database import DatabaseManager as DatabaseManager
+from .sinks import SINK_FORMATS, DEFAULT_SINK_BATCH_SIZE, open_sink
+from .utils import generate_command, qualified_name
+from .utils import write_rollback_script
+from .utils import parse_size, pretty_size, pretty_duration, configure_logging, LOGGER_NAME
+import os
+import json as json_module
+
+# Commands import tabulate, psycopg2, yaml and the modules built on them when they run,
+# so --help and option errors return without loading them.
+
+BYTE_SIZE_HEADERS = ["Index Size Bytes", "Reclaimable Bytes"]
+
+EXPORT_OPTIONS = (
+    click.option("--export", type=click.Choice(sorted(SINK_FORMATS)), default=None,
+                 help="Export output to a file in this format. --json is the same as --export json."),
+    click.option("--top", type=int, default=None,
+                 help="Only print the N indexes with the most reclaimable space. All of them are exported."),
+)
+REMEDIATION_OPTIONS = (
+    click.option('--execute-workers', type=int, default=2, show_default=True,
+                 help="Number of tables remediated concurrently. Statements on one table run one after the other."),
+    click.option('--checkpoint', type=str, default=None,
+                 help="Checkpoint file of finished statements. Running again with it skips the statements already done."),
+    click.option('--max-retries', type=int, default=5, show_default=True,
+                 help="Retries of a statement failing on lock_timeout, with an exponential backoff."),
+    click.option('--max-replay-lag', type=int, default=60, show_default=True,
+                 help="Pause remediation while a standby replays more than this many seconds behind."),
+    click.option('--max-wal-rate', type=str, default=None,
+                 help="Pause remediation while WAL is written faster than this size per second, such as 64MB."),
+    click.option('--no-throttle', is_flag=True, help="Do not watch replication lag and WAL rate during remediation."),
+)
+REMEDIATION_SETTINGS = ("execute_workers", "checkpoint", "max_retries", "max_replay_lag", "max_wal_rate", "no_throttle")
+
+
+def export_options(command):
+    """Adds --export and --top to a command."""
+    for option in reversed(EXPORT_OPTIONS):
+        command = option(command)
+    return command
+
+
+def remediation_options(command):
+    """
+    Adds the options controlling how --execute runs the statements to a command.
+
+    The command receives them in a single remediation_settings dict, which remediate passes
+    on to run_remediation, so it must be the decorator closest to the function.
+    """
+    @functools.wraps(command)
+    def command_with_settings(**options):
+        options["remediation_settings"] = {name: options.pop(name) for name in REMEDIATION_SETTINGS}
+        return command(**options)
+
+    for option in reversed(REMEDIATION_OPTIONS):
+        command_with_settings = option(command_with_settings)
+    return command_with_settings
+
+
+def report_sink(json, export, db_name, filename, output_path, headers, json_headers=None,
+                batch_size=DEFAULT_SINK_BATCH_SIZE):
+    """
+    Returns a factory opening the report sink chosen with --json or --export, or None when nothing is exported.
+
+    The JSON report keeps its historical keys, json_headers, while the other formats
+    carry every column of the printed table followed by the index size and the
+    reclaimable size in bytes.
+    """
+    export_format = export or ("json" if json else None)
+    if export_format is None:
+        return None
+    sink_headers = json_headers if export_format == "json" else list(headers) + BYTE_SIZE_HEADERS
+    return lambda: open_sink(export_format, db_name, filename=filename, report_path=output_path,
+                             headers=sink_headers, batch_size=batch_size)
+
+
+def echo_index_table(items, to_row, headers, page_size=DEFAULT_SINK_BATCH_SIZE, report=None, top=None,
+                     summary=None):
+    """
+    Echoes index results as tables of page_size rows while they are produced, so output never needs the full result.
+
+    Parameters:
+        items (iterable of dicts): Index results carrying reclaimable_bytes, consumed in a single pass.
+        to_row (callable): Builds the table row of a result.
+        headers (list): Table headers.
+        page_size (int): Rows per printed table.
+        report (callable): Optional factory of a ReportSink, opened on the first row, receiving every row
+            followed by its byte sizes.
+        top (int): Only print the top indexes with the most reclaimable bytes, kept in a bounded heap.
+            Every row is still exported.
+        summary (ReclaimableSummary): Optional summary every result is added to.
+
+    Returns:
+        int: Number of rows produced.
+    """
+    from tabulate import tabulate
+    from .profiling import span
+    page = []
+    largest = []
+    row_count = 0
+    sink = None
+    export_seconds = 0.0
+    try:
+        for item in items:
+            row = to_row(item)
+            if report is not None:
+                if sink is None:
+                    sink = report()
+                export_started = time.perf_counter()
+                sink.write(row + [item.get("index_size_bytes"), item.get("reclaimable_bytes")])
+                export_seconds += time.perf_counter() - export_started
+            if summary is not None:
+                summary.add(item)
+            row_count += 1
+            if top is not None:
+                entry = (item.get("reclaimable_bytes") or 0, -row_count, row)
+                if len(largest) < top:
+                    heapq.heappush(largest, entry)
+                elif top:
+                    heapq.heappushpop(largest, entry)
+                continue
+            page.append(row)
+            if len(page) >= page_size:
+                with span("tabulate", rows=len(page)):
+                    click.echo(tabulate(page, headers, tablefmt="psql"))
+                page = []
+        if largest:
+            page = [row for _, _, row in sorted(largest, reverse=True)]
+        if page:
+            with span("tabulate", rows=len(page)):
+                click.echo(tabulate(page, headers, tablefmt="psql"))
+    finally:
+        if sink is not None:
+            with span("export", rows=sink.row_count, write_seconds=export_seconds):
+                sink.close()
+    if sink is not None:
+        click.echo(f'Exported {sink.row_count} index(es) to {sink.path}')
+    if top is not None and row_count > top:
+        click.echo(f'Showing the {top} of {row_count} indexes with the most reclaimable space.')
+    return row_count
+
+
+def echo_reclaimable_summary(summary, table_limit=20):
+    """Echoes the reclaimable bytes per category, per schema and of the tables with the most of them."""
+    from tabulate import tabulate
+    if not summary.index_count:
+        return
+    click.echo(tabulate(
+        [[category, index_count, pretty_size(reclaimable_bytes), reclaimable_bytes]
+         for category, index_count, reclaimable_bytes in summary.ranked(summary.categories)],
+        ["Category", "Index Count", "Reclaimable Size", "Reclaimable Bytes"], tablefmt="psql"))
+    click.echo(tabulate(
+        [[database_name, schema_name, index_count, pretty_size(reclaimable_bytes), reclaimable_bytes]
+         for (database_name, schema_name), index_count, reclaimable_bytes in summary.ranked(summary.schemas)],
+        ["Database Name", "Schema Name", "Index Count", "Reclaimable Size", "Reclaimable Bytes"], tablefmt="psql"))
+    click.echo(tabulate(
+        [[database_name, schema_name, table_name, index_count, pretty_size(reclaimable_bytes), reclaimable_bytes]
+         for (database_name, schema_name, table_name), index_count, reclaimable_bytes
+         in summary.ranked(summary.tables, table_limit)],
+        ["Database Name", "Schema Name", "Table Name", "Index Count", "Reclaimable Size", "Reclaimable Bytes"],
+        tablefmt="psql"))
+    if len(summary.tables) > table_limit:
+        click.echo(f'Showing the {table_limit} of {len(summary.tables)} tables with the most reclaimable space.')
+    click.echo(f'Total reclaimable: {pretty_size(summary.total_bytes)} ({summary.total_bytes} bytes) '
+               f'over {summary.index_count} index(es).')
+
+
+def echo_replica_usage(database_manager):
+    """Echoes the latency and status of every node the index usage was read from, when standbys are configured."""
+    from tabulate import tabulate
+    replica_usage = database_manager.replica_usage
+    if replica_usage is None:
+        return
+    click.echo(tabulate(
+        [[node.name, f'{node.host}:{node.port}', node.status, len(node.index_scans),
+          format(node.elapsed * 1000, ".0f"), node.error or ""] for node in replica_usage.nodes],
+        ["Node", "Host", "Status", "Index Count", "Latency (ms)", "Error"], tablefmt="psql"))
+    if not replica_usage.complete:
+        click.echo('Index usage could not be read from every node, so no index is reported as unused.')
+
+
+def echo_chunk_progress(completed, submitted, failed):
+    """Echoes the progress of the column statistics chunks of a catalog snapshot read in more than one chunk."""
+    if submitted > 1:
+        click.echo(f'Column statistics: {completed}/{submitted} chunk(s) done, {failed} failed.')
+
+
+def echo_failed_chunks(database_manager):
+    """Echoes the column statistics chunks that could not be read, whose indexes have no bloat estimate."""
+    failed_chunks = database_manager.snapshot().failed_chunks
+    for chunk in failed_chunks:
+        click.echo(f'Column statistics of {len(chunk.index_oids)} index(es) of tables {chunk.first_table_oid} to '
+                   f'{chunk.last_table_oid} could not be read: {chunk.error}')
+    if failed_chunks:
+        click.echo(f'The bloat of {sum(len(chunk.index_oids) for chunk in failed_chunks)} index(es) was not '
+                   f'estimated, the results are partial.')
+
+
+def open_throughput_history():
+    """Opens the throughput history in COST_HISTORY_DIR, or returns None when it cannot be opened."""
+    from .costs import ThroughputHistory, DEFAULT_COST_HISTORY_DIR
+    history_dir = os.getenv("COST_HISTORY_DIR", DEFAULT_COST_HISTORY_DIR)
+    try:
+        return ThroughputHistory.for_directory(history_dir)
+    except Exception as e:
+        logging.getLogger(LOGGER_NAME).warning(f"Remediation throughput history in {history_dir} not available: {e}")
+        return None
+
+
+def open_database_manager(db_name, snapshot_path=None):
+    """Returns a DatabaseManager connecting to the configured database, or analyzing a snapshot file offline."""
+    from .database import DatabaseManager
+    if snapshot_path:
+        return DatabaseManager.from_snapshot_file(snapshot_path)
+    if not db_name:
+        raise ValueError("--db-name or --snapshot is required.")
+    return DatabaseManager(db_name=db_name)
+
+
+def check_offline_options(snapshot_path, **options):
+    """
+    Raises ValueError when options needing the database are combined with --snapshot.
+
+    Rollback scripts, remediation statements and exact measurements all read the live
+    database, so they are rejected before any output is printed.
+    """
+    online_options = [f'--{name.replace("_", "-")}' for name, value in options.items() if value]
+    if snapshot_path and online_options:
+        raise ValueError(f'{" and ".join(online_options)} {"need" if len(online_options) > 1 else "needs"} a '
+                         f'connection to the database and cannot be used with --snapshot.')
+
+
+def remediation_indexes(items):
+    """
+    Returns (category, schema name, table name, index name, index oid) of the results remediation can run on.
+
+    Results marked report_only, partitioned indexes and indexes attached to them, are left
+    out of the statements and the rollback script, with a message.
+    """
+    indexes = []
+    report_only_count = 0
+    for item in items:
+        if item.get("report_only"):
+            report_only_count += 1
+            continue
+        indexes.append((item["category"], item["schema_name"], item["table_name"], item["index_name"],
+                        item["index_oid"]))
+    if report_only_count:
+        click.echo(f'{report_only_count} index(es) of partitioned tables are reported only, without statements: '
+                   f'PostgreSQL cannot drop a partitioned index concurrently, nor an index attached to one on its own.')
+    return indexes
+
+
+def run_remediation(database_manager, indexes, output_path, report_name, execute_workers=2, checkpoint=None,
+                    max_retries=5, max_replay_lag=None, max_wal_rate=None, no_throttle=False):
+    """
+    Writes the rollback script, then runs the remediation statement of every index through a RemediationExecutor.
+
+    Unless no_throttle is set, the job pauses while a standby replays more than
+    max_replay_lag seconds behind or WAL is written faster than max_wal_rate, and runs one
+    statement at a time while either is above half its threshold.
+
+    Parameters:
+        indexes (list): (category, schema name, table name, index name, index oid) tuples.
+        max_wal_rate (str): Size per second such as 64MB, or None.
+
+    Returns:
+        bool: True when every statement is done or was already done according to the checkpoint.
+    """
+    from .costs import RemediationCostModel, ThroughputHistory, statement_operation
+    from .executor import RemediationExecutor, RemediationTask
+    from .throttle import ReplicationThrottle
+    if not indexes:
+        click.echo(f'No statement to run on database: {database_manager.dbname}')
+        return True
+    rollback_script_path = write_rollback_script(
+        (statement for _, statement in database_manager.get_index_create_statements(
+            index_oid for _, _, _, _, index_oid in indexes)),
+        filename=f'''{report_name}_rollback''', report_path=output_path
+    )
+    click.echo(f'Rollback script written to {rollback_script_path}')
+    tasks = [
+        RemediationTask(qualified_name(schema_name, table_name), generate_command(category, schema_name, index_name), index_oid)
+        for category, schema_name, table_name, index_name, index_oid in indexes
+    ]
+    index_sizes = database_manager.get_remediation_sizes(index_oid for _, _, _, _, index_oid in indexes)
+    statement_sizes = {
+        task.statement: index_sizes[index_oid]
+        for task, (_, _, _, _, index_oid) in zip(tasks, indexes) if index_oid in index_sizes
+    }
+    throughput_history = open_throughput_history()
+    host = ThroughputHistory.host_key(database_manager.config)
+    cost_model = RemediationCostModel(host, throughput_history)
+    estimated_duration = sum(
+        cost_model.estimate(task.table, task.statement, statement_sizes[task.statement], 0).duration
+        for task in tasks if task.statement in statement_sizes)
+    click.echo(f'''Running {len(tasks)} statement(s) on database: {database_manager.dbname}, estimated to take '''
+               f'''{pretty_duration(estimated_duration)} of statement time.''')
+
+    def echo_result(result):
+        error = f' ({result.error.strip()})' if result.error else ''
+        click.echo(f'[{len(executor.results)}/{len(tasks)}] {result.status} {result.duration:.1f}s '
+                   f'{result.statement}{error}')
+
+    def echo_throttle(allowed, status):
+        if allowed == 0:
+            click.echo(f'Pausing remediation: {status}.')
+        else:
+            click.echo(f'Running up to {allowed} statement(s) at once: {status}.')
+
+    throttle = None
+    if not no_throttle:
+        throttle = ReplicationThrottle(database_manager, max_replay_lag=max_replay_lag,
+                                       max_wal_rate=parse_size(max_wal_rate) if max_wal_rate else None,
+                                       on_change=echo_throttle)
+    executor = RemediationExecutor(database_manager, workers=execute_workers, max_retries=max_retries,
+                                   checkpoint_path=checkpoint, on_result=echo_result, throttle=throttle)
+    results = executor.run(tasks)
+    if throughput_history is not None:
+        for result in results:
+            if result.status == "done" and result.attempts == 1 and result.statement in statement_sizes:
+                operation = statement_operation(result.statement)
+                throughput_history.record(host, operation,
+                                          cost_model.work_bytes(operation, statement_sizes[result.statement]),
+                                          result.duration)
+        throughput_history.close()
+    if throttle is not None and throttle.paused_seconds:
+        click.echo(f'Statements waited {throttle.paused_seconds:.0f}s for the standbys to catch up.')
+    statuses = {}
+    for result in results:
+        statuses[result.status] = statuses.get(result.status, 0) + 1
+    click.echo(', '.join(f'{count} {status}' for status, count in sorted(statuses.items())) +
+               f' in {sum(result.duration for result in results):.1f}s of statement time.')
+    return all(result.status in ("done", "skipped") for result in results)
+
+
+def remediate(database_manager, items, dry_run, execute, output_path, report_name, remediation_settings, purpose=''):
+    """
+    Prints the remediation statements of the results and their rollback script with --dry-run, or runs them with --execute.
+
+    Parameters:
+        items (list): Results of a detector, as printed.
+        remediation_settings (dict): Values of the options added by remediation_options.
+        purpose (str): End of the sentence introducing the statements, such as ' to remove invalid indexes'.
+
+    Returns:
+        bool: False when --execute left a statement failed or rejected.
+    """
+    if not dry_run and not execute:
+        return True
+    indexes = remediation_indexes(items)
+    if not dry_run:
+        return run_remediation(database_manager, indexes, output_path, report_name, **remediation_settings)
+    database_name = database_manager.dbname
+    click.echo(f'''The following statements can be executed on {database_name}{purpose}. Think twice before executing them.''')
+    for category, schema_name, _, index_name, _ in indexes:
+        click.echo(generate_command(category, schema_name, index_name))
+
+    click.echo(
+        f'''The following statements can be executed on {database_name} to recreate the index in case of emergency after the drop operation..'''
+    )
+    rollback_script_path = write_rollback_script(
+        (statement for _, statement in database_manager.get_index_create_statements(
+            index_oid for _, _, _, _, index_oid in indexes)),
+        filename=f'''{report_name}_rollback''', report_path=output_path, echo=click.echo
+    )
+    click.echo(f'Rollback script written to {rollback_script_path}')
+    return True
 
 
 @click.command()
-@click.option('--db-name', required=True, help='The name of the database to connect to.')
+@click.option('--db-name', default=None, help='The name of the database to connect to. Not needed with --snapshot.')
+@click.option('--snapshot', 'snapshot_path', type=str, default=None,
+              help='Analyze this file written by export-snapshot offline instead of connecting to the database.')
 @click.option("--json", is_flag=True, help="Export output to JSON file.")
 @click.option("--output-path", type=str, default='/tmp/', show_default=True, help="Output file directory")
-def list_unused_indexes(json, output_path, db_name):
+@click.option('--batch-size', type=int, default=1000, show_default=True,
+              help='Catalog rows fetched per round trip, and rows per printed table.')
+@export_options
+@click.option('--history-dir', type=str, default=None,
+              help='Directory of the usage history written by record-usage.')
+@click.option('--window-days', type=int, default=None,
+              help='Report indexes without scans over the last N days of the usage history instead of idx_scan = 0.')
+def list_unused_indexes(json, output_path, db_name, snapshot_path, batch_size, export, top, history_dir,
+                        window_days):
     """
     Connects to the PostgreSQL database and retrieves unused or redundant indexes.
     This function queries the database for indexes that are not frequently scanned
@@ -19,20 +395,23 @@ def list_unused_indexes(json, output_path, db_name):
     schema name, index name, size, scan count, last scan date, and other related
     attributes such as replica status and recovery mode.
 
+    Indexes are streamed from server-side cursors and printed in tables of batch-size
+    rows, so memory use does not grow with the size of the catalog.
+
     If no unused or redundant indexes are found, the function informs the user
     and exits gracefully.
     """
+    from .summary import ReclaimableSummary
     try:
-        database_instance = DatabaseManager( db_name=db_name)
-        unused_index_list = database_instance.fetch_unused_indexes()
-        database_name = database_instance.dbname
-        report_time = str.replace(str(time.time()), ".", "_")
-        json_report_name = f'''{database_name}_unused_old_index_{report_time}'''
-        if not len(unused_index_list) > 0:
-            click.echo(f'No unused or old index found for database: {database_name}')
-            exit(0)
-        unused_index_data_to_be_tabulated = [
-            [
+        if window_days is not None and history_dir is None:
+            raise ValueError("--window-days requires --history-dir.")
+        with open_database_manager(db_name, snapshot_path) as database_instance:
+            if history_dir:
+                database_instance.use_usage_history(history_dir, window_days)
+            database_name = database_instance.dbname
+            report_time = str.replace(str(time.time()), ".", "_")
+            json_report_name = f'''{database_name}_unused_old_index_{report_time}'''
+            unused_index_data_to_be_tabulated = lambda item: [
                 item["database_name"],
                 item["schema_name"],
                 item["index_name"],
@@ -42,44 +421,46 @@ def list_unused_indexes(json, output_path, db_name):
                 database_instance.replica_node_exists,
                 database_instance.recovery_status,
             ]
-            for item in unused_index_list
-        ]
-        index_table_headers = [
-            "Database Name",
-            "Schema Name",
-            "Index Name",
-            "Index Type",
-            "Index Size",
-            "Category",
-            "Physical Replication Exists",
-            "Database Recovery Enabled"
-        ]
-        unused_index_result_table = tabulate(
-            unused_index_data_to_be_tabulated, index_table_headers, tablefmt="psql"
-        )
-        click.echo(unused_index_result_table)
-        if json:
-            try:
-                jsonReport = generate_index_report(
-                    unused_index_data_to_be_tabulated, filename=json_report_name, report_path=output_path, db_name=db_name
-                )
-                if not jsonReport:
-                    click.echo(f"Failed to export json.")
-                    exit(1)
-            except Exception as e:
-                click.echo(f"Failed to export json, error: {str(e)} ")
+            index_table_headers = [
+                "Database Name",
+                "Schema Name",
+                "Index Name",
+                "Index Type",
+                "Index Size",
+                "Category",
+                "Physical Replication Exists",
+                "Database Recovery Enabled"
+            ]
+            report = report_sink(json, export, database_instance.config.get("name"), json_report_name, output_path, index_table_headers,
+                                 batch_size=batch_size)
+            summary = ReclaimableSummary()
+            index_count = echo_index_table(
+                database_instance.iter_index_results(("unused",), batch_size=batch_size),
+                unused_index_data_to_be_tabulated, index_table_headers, batch_size, report, top, summary)
+            echo_reclaimable_summary(summary)
+            echo_replica_usage(database_instance)
+            if not index_count:
+                click.echo(f'No unused or old index found for database: {database_name}')
+                exit(0)
     except Exception as e:
         click.echo(f"Error: {str(e)}")
 
 
 @click.command()
-@click.option('--db-name', required=True, help='The name of the database to connect to.')
+@click.option('--db-name', default=None, help='The name of the database to connect to. Not needed with --snapshot.')
+@click.option('--snapshot', 'snapshot_path', type=str, default=None,
+              help='Analyze this file written by export-snapshot offline instead of connecting to the database.')
 @click.option('--dry-run', is_flag=True, help="Perform a dry run without making any changes.")
 @click.option("--json", is_flag=True, help="Export output to JSON file.")
 @click.option("--output-path", type=str, default='/tmp/', show_default=True, help="Output file directory")
-@click.option("--drop-force", is_flag=True,
-              help="Drop all invalid indexes. User must be the owner or have superuser privileges.")
-def list_invalid_indexes(dry_run, json, drop_force, output_path, db_name):
+@click.option('--execute', is_flag=True,
+              help="Drop the invalid indexes after writing the rollback script. Ignored with --dry-run. "
+                   "User must be the owner or have superuser privileges.")
+@click.option("--drop-force", is_flag=True, hidden=True, help="Deprecated alias of --execute.")
+@export_options
+@remediation_options
+def list_invalid_indexes(dry_run, json, execute, drop_force, output_path, db_name, snapshot_path, export, top,
+                         remediation_settings):
     """
     Connects to the PostgreSQL database and retrieves invalid indexes.
     Invalid indexes typically refer to indexes that are misconfigured,
@@ -91,21 +472,26 @@ def list_invalid_indexes(dry_run, json, drop_force, output_path, db_name):
 
     If no invalid indexes are found, the function informs the user and exits.
     """
+    from .summary import ReclaimableSummary
 
     try:
-        database_query = DatabaseManager( db_name=db_name)
-        invalid_indexes = database_query.fetch_invalid_indexes()
-        database_name = database_query.dbname
-        report_time = str.replace(str(time.time()), ".", "_")
-        json_report_name = f'''{database_name}_invalid_index_{report_time}'''
-        if not len(invalid_indexes) > 0:
-            click.echo(f'No invalid index found for database: {database_name}')
-            exit(0)
+        if drop_force:
+            logging.getLogger(LOGGER_NAME).warning("--drop-force is deprecated, use --execute.")
+            execute = True
+        check_offline_options(snapshot_path, dry_run=dry_run, execute=execute)
+        with open_database_manager(db_name, snapshot_path) as database_query:
+            invalid_indexes = database_query.fetch_invalid_indexes()
+            database_name = database_query.dbname
+            report_time = str.replace(str(time.time()), ".", "_")
+            json_report_name = f'''{database_name}_invalid_index_{report_time}'''
+            if not len(invalid_indexes) > 0:
+                click.echo(f'No invalid index found for database: {database_name}')
+                exit(0)
 
-        if not len(invalid_indexes) == 0:
+            if not len(invalid_indexes) == 0:
 
-            invalid_index_data_to_be_tabulated = [
-                [
+                invalid_indexes.sort(key=lambda item: item["reclaimable_bytes"], reverse=True)
+                invalid_index_data_to_be_tabulated = lambda item: [
                     item["database_name"],
                     item["schema_name"],
                     item["index_name"],
@@ -114,71 +500,49 @@ def list_invalid_indexes(dry_run, json, drop_force, output_path, db_name):
                     item["category"],
                     database_query.replica_node_exists,
                     database_query.recovery_status,
-
                 ]
-                for item in invalid_indexes
-            ]
-            index_table_headers = [
-                "Database Name",
-                "Schema Name",
-                "Index Name",
-                "Index Type",
-                "Index Size",
-                "Category",
-                "Physical Replication Exists",
-                "Database Recovery Enabled"
-            ]
-            invalid_index_result_table = tabulate(
-                invalid_index_data_to_be_tabulated, index_table_headers, tablefmt="psql"
-            )
-            click.echo(invalid_index_result_table)
-            if json:
-                try:
-                    jsonReport = generate_index_report(
-                        invalid_index_data_to_be_tabulated, filename=json_report_name, report_path=output_path,
-                        db_name=db_name
-                    )
-                    if not jsonReport:
-                        click.echo(f"Failed to export json.")
-                        exit(1)
-                except Exception as e:
-                    click.echo(f"Failed to export json, error: {str(e)} ")
-            if dry_run:
-                click.echo(
-                    f'''The following statements can be executed on {database_name} to remove invalid indexes. Think twice before executing them.''')
-                drop_force = False
-                for index in invalid_indexes:
-                    command_executed = generate_command(index['category'], index['schema_name'], index['index_name'])
-                    click.echo(command_executed)
-
-                click.echo(
-                    f'''The following statements can be executed on {database_name} to recreate the index in case of emergency after the drop operation..'''
-                )
-                for index in invalid_indexes:
-                    create_command = database_query.get_index_create_statement(index['schema_name'],index['index_name'])
-                    click.echo(create_command)
-
-            if drop_force:
-                click.echo(f'''Following queries are running on database: {database_name}.''')
-                commands_for_execute = []
-                for index in invalid_indexes:
-                    commands_for_execute.append(
-                        generate_command(index['category'], index['schema_name'], index['index_name']))
-                click.echo('\n'.join(commands_for_execute))
-                try:
-                    database_query.run_query(commands_for_execute)
-                except Exception as e:
-                    click.echo(f"Error: {str(e)}")
+                index_table_headers = [
+                    "Database Name",
+                    "Schema Name",
+                    "Index Name",
+                    "Index Type",
+                    "Index Size",
+                    "Category",
+                    "Physical Replication Exists",
+                    "Database Recovery Enabled"
+                ]
+                summary = ReclaimableSummary()
+                echo_index_table(invalid_indexes, invalid_index_data_to_be_tabulated, index_table_headers,
+                                 report=report_sink(json, export, database_query.config.get("name"), json_report_name, output_path,
+                                                    index_table_headers),
+                                 top=top, summary=summary)
+                echo_reclaimable_summary(summary)
+                if not remediate(database_query, invalid_indexes, dry_run, execute, output_path, json_report_name,
+                                 remediation_settings, purpose=' to remove invalid indexes'):
+                    exit(1)
     except Exception as e:
         click.echo(f"Error: {str(e)}")
 
 
 @click.command()
-@click.option('--db-name', required=True, help='The name of the database to connect to.')
+@click.option('--db-name', default=None, help='The name of the database to connect to. Not needed with --snapshot.')
+@click.option('--snapshot', 'snapshot_path', type=str, default=None,
+              help='Analyze this file written by export-snapshot offline instead of connecting to the database.')
 @click.option("--json", is_flag=True, help="Export output to JSON file.")
 @click.option("--output-path", type=str, default='/tmp/', show_default=True, help="Output file directory")
 @click.option('--dry-run', is_flag=True, help="Perform a dry run without making any changes.")
-def list_unemployed_indexes(json, dry_run, output_path, db_name):
+@click.option('--batch-size', type=int, default=1000, show_default=True,
+              help='Catalog rows fetched per round trip, and rows per printed table.')
+@export_options
+@click.option('--history-dir', type=str, default=None,
+              help='Directory of the usage history written by record-usage.')
+@click.option('--window-days', type=int, default=None,
+              help='Report indexes without scans over the last N days of the usage history instead of idx_scan = 0.')
+@click.option('--execute', is_flag=True,
+              help="Run the statements after writing the rollback script. Ignored with --dry-run.")
+@remediation_options
+def list_unemployed_indexes(json, dry_run, output_path, db_name, snapshot_path, batch_size, export, top, history_dir,
+                            window_days, execute, remediation_settings):
     """
     Connects to the PostgreSQL database and identifies inefficient indexes,
     which may include unused or invalid indexes that do not contribute to query
@@ -189,95 +553,83 @@ def list_unemployed_indexes(json, dry_run, output_path, db_name):
     If the user requests a JSON export, the function generates a report with
     the results, naming the file based on the current time and database name.
 
+    Every rule is evaluated in a single pass over the catalog, streamed from
+    server-side cursors, and results are printed in tables of batch-size rows.
+
     If no inefficient indexes are found, the function informs the user and exits.
     If the JSON report generation fails, a corresponding error message is displayed.
 
     Parameters:
         json (bool): A flag indicating whether to export the results as a JSON report.
     """
+    from .summary import ReclaimableSummary
     try:
-        database_query = DatabaseManager( db_name=db_name)
-        unused_invalid_index_list = database_query.get_unused_and_invalid_indexes()
-        duplicate_unique_index_list = database_query.fetch_duplicate_unique_indexes()
-        duplicate_btree_index_list = database_query.fetch_duplicate_indexes()
-        database_name = database_query.dbname
-        if len(unused_invalid_index_list) == 0 and len(duplicate_unique_index_list) == 0 and len(
-                duplicate_btree_index_list) == 0:
-            click.echo(f'No inefficient index found for database: {database_name}')
-            exit(0)
-        unemployed_index_data_to_be_tabulated = [
-            [item["database_name"], item["schema_name"], item["index_name"],item['index_type'], item["index_size"], item["category"],
-             database_query.replica_node_exists, database_query.recovery_status]
-            for item in unused_invalid_index_list
-        ]
-        # append duplicate unique indexes
-        for unique_index in duplicate_unique_index_list:
-            unemployed_index_data_to_be_tabulated.append([
-                database_name,
-                unique_index[0],
-                unique_index[2],
-                unique_index[5],
-                unique_index[4],
-                "Duplicate Unique Index",
-                database_query.replica_node_exists,
-                database_query.recovery_status
-            ])
-
-        # append Duplicate Indexes
-        for btree_index in duplicate_btree_index_list:
-            unemployed_index_data_to_be_tabulated.append([
-                database_name,
-                btree_index[0],
-                btree_index[2],
-                btree_index[5],
-                btree_index[4],
-                "Duplicate Index",
-                database_query.replica_node_exists,
-                database_query.recovery_status
-            ])
-        index_table_headers = ["Database Name", "Schema Name", "Index Name","Index Type", "Index Size", "Category",
-                               "Physical Replication Exists", "Database Recovery Enabled"]
-        report_time = str.replace(str(time.time()), ".", "_")
-        json_report_name = f'''{database_name}_inefficient_index_{report_time}'''
-        sorted_desc_index_list = sorted(unemployed_index_data_to_be_tabulated, key=lambda x: x[3], reverse=True)
-        unemployed_index_result_table = tabulate(
-            sorted_desc_index_list, index_table_headers, tablefmt="psql"
-        )
-        click.echo(unemployed_index_result_table)
-        if json:
-            try:
-                jsonReport = generate_index_report(
-                    unemployed_index_data_to_be_tabulated, filename=json_report_name, report_path=output_path, db_name=db_name
-                )
-                if not jsonReport:
-                    click.echo(f"Failed to export json.")
-                    exit(1)
-            except Exception as e:
-                click.echo(f"Failed to export json, error: {str(e)} ")
-        if dry_run:
-            click.echo(
-                f'''The following statements can be executed on {database_name}. Think twice before executing them.''')
-            for index in sorted_desc_index_list:
-                command_executed = generate_command(index[0], index[1], index[2])
-                click.echo(command_executed)
+        if window_days is not None and history_dir is None:
+            raise ValueError("--window-days requires --history-dir.")
+        check_offline_options(snapshot_path, dry_run=dry_run, execute=execute)
+        with open_database_manager(db_name, snapshot_path) as database_query:
+            if history_dir:
+                database_query.use_usage_history(history_dir, window_days)
+            database_name = database_query.dbname
+            report_time = str.replace(str(time.time()), ".", "_")
+            json_report_name = f'''{database_name}_inefficient_index_{report_time}'''
+            dry_run_indexes = []
 
-            click.echo(
-                f'''The following statements can be executed on {database_name} to recreate the index in case of emergency after the drop operation..'''
-                )
-            for index in sorted_desc_index_list:
-                create_command = database_query.get_index_create_statement(index[1], index[2])
-                click.echo(create_command)
+            def unemployed_index_data_to_be_tabulated(item):
+                if dry_run or execute:
+                    dry_run_indexes.append(item)
+                return [item["database_name"], item["schema_name"], item["index_name"], item['index_type'],
+                        item["index_size"], item["category"],
+                        database_query.replica_node_exists, database_query.recovery_status]
+
+            index_table_headers = ["Database Name", "Schema Name", "Index Name","Index Type", "Index Size", "Category",
+                                   "Physical Replication Exists", "Database Recovery Enabled"]
+            report = report_sink(json, export, database_query.config.get("name"), json_report_name, output_path, index_table_headers,
+                                 batch_size=batch_size)
+            summary = ReclaimableSummary()
+            index_count = echo_index_table(
+                database_query.iter_index_results(
+                    ("redundant", "invalid", "duplicate_unique", "duplicate"), batch_size=batch_size),
+                unemployed_index_data_to_be_tabulated, index_table_headers, batch_size, report, top, summary)
+            echo_reclaimable_summary(summary)
+            echo_replica_usage(database_query)
+            if not index_count:
+                click.echo(f'No inefficient index found for database: {database_name}')
+                exit(0)
+            if not remediate(database_query, dry_run_indexes, dry_run, execute, output_path, json_report_name,
+                             remediation_settings):
+                exit(1)
     except Exception as e:
         click.echo(f"Error: {str(e)}")
 
 
 @click.command()
-@click.option('--db-name', required=True, help='The name of the database to connect to.')
+@click.option('--db-name', default=None, help='The name of the database to connect to. Not needed with --snapshot.')
+@click.option('--snapshot', 'snapshot_path', type=str, default=None,
+              help='Analyze this file written by export-snapshot offline instead of connecting to the database.')
 @click.option("--json", is_flag=True, help="Export output to JSON file.")
 @click.option("--output-path", type=str, default='/tmp/', show_default=True, help="Output file directory")
 @click.option('--dry-run', is_flag=True, help="Perform a dry run without making any changes.")
 @click.option('--bloat-threshold', type=int, default=50, help="Set the bloat threshold percentage for indexes.")
-def list_bloated_btree_indexes(json, dry_run, bloat_threshold, output_path, db_name):
+@click.option('--cache-dir', type=str, default=None,
+              help="Reuse bloat estimates of unchanged indexes from a cache kept in this directory.")
+@click.option('--measure', is_flag=True,
+              help="Measure the bloat of the top estimated candidates exactly with the pgstattuple extension.")
+@click.option('--measure-workers', type=int, default=2, show_default=True,
+              help="Number of indexes measured concurrently.")
+@click.option('--time-budget', type=int, default=300, show_default=True,
+              help="Seconds all exact measurements together may take.")
+@click.option('--io-budget', type=str, default=None,
+              help="Maximum index size read by exact measurements, such as 20GB. Unlimited by default.")
+@click.option('--max-measured', type=int, default=50, show_default=True,
+              help="Maximum number of indexes measured exactly, among those with a positive estimated bloat.")
+@export_options
+@click.option('--execute', is_flag=True,
+              help="Run the statements after writing the rollback script. Ignored with --dry-run.")
+@remediation_options
+def list_bloated_btree_indexes(json, dry_run, bloat_threshold, output_path, db_name, snapshot_path, cache_dir, measure,
+                               measure_workers, time_budget, io_budget, max_measured, export, top, execute,
+                               remediation_settings):
     """
     Connects to the PostgreSQL database and identifies bloated B-tree indexes.
     Bloated indexes occur when the index structure has a significant amount of
@@ -295,57 +647,375 @@ def list_bloated_btree_indexes(json, dry_run, bloat_threshold, output_path, db_n
     Parameters:
         json (bool): A flag indicating whether to export the results as a JSON report.
     """
+    from .summary import ReclaimableSummary
     try:
-        databaseConnection = DatabaseManager(db_name=db_name)
-        bloated_index_list = databaseConnection.get_bloated_indexes(bloat_threshold)
-        database_name = databaseConnection.dbname
-        if not len(bloated_index_list) > 0:
-            click.echo(f'No bloated index found for database: {database_name}')
-            exit(0)
-        bloated_index_data_to_be_tabulated = [
-            [item["database_name"], item["schema_name"], item["index_name"],item['index_type'], item["bloat_ratio"], item["category"],
-             databaseConnection.replica_node_exists, databaseConnection.recovery_status]
-            for item in bloated_index_list
-        ]
-        index_table_headers = ["Database Name", "Schema Name", "Index Name","Index Type", "Bloat Ratio", "Category",
-                               "Physical Replication Exists", "Database Recovery Enabled"]
-        report_time = str.replace(str(time.time()), ".", "_")
-        json_report_name = f'''{database_name}_bloated_index_{report_time}'''
-        bloated_index_result_table = tabulate(
-            bloated_index_data_to_be_tabulated, index_table_headers, tablefmt="psql"
-        )
-        click.echo(bloated_index_result_table)
-        if json:
-            try:
-                jsonReport = generate_index_report(
-                    bloated_index_data_to_be_tabulated, filename=json_report_name, report_path=output_path, db_name=db_name
+        check_offline_options(snapshot_path, dry_run=dry_run, measure=measure, execute=execute)
+        with open_database_manager(db_name, snapshot_path) as databaseConnection:
+            databaseConnection.on_chunk = echo_chunk_progress
+            bloat_cache = databaseConnection.use_bloat_cache(cache_dir) if cache_dir else None
+            if measure:
+                bloated_index_list, measurer = databaseConnection.measure_bloated_indexes(
+                    bloat_threshold, workers=measure_workers, time_budget=time_budget,
+                    io_budget=parse_size(io_budget) if io_budget else None, max_candidates=max_measured
                 )
-                if not jsonReport:
-                    click.echo(f"Failed to export json.")
-                    exit(1)
-            except Exception as e:
-                click.echo(f"Failed to export json, Error: {str(e)} ")
+                click.echo(
+                    f'Measured {measurer.measured} index(es) exactly, reading {pretty_size(measurer.bytes_read)} in '
+                    f'{measurer.elapsed:.1f}s; {measurer.skipped} skipped by budget, {measurer.failed} failed.')
+            else:
+                bloated_index_list = databaseConnection.get_bloated_indexes(bloat_threshold)
+            echo_failed_chunks(databaseConnection)
+            if bloat_cache is not None:
+                bloat_cache.save()
+                click.echo(
+                    f'Bloat cache: {bloat_cache.hits} hits, {bloat_cache.misses} misses, '
+                    f'{bloat_cache.evicted} evicted ({bloat_cache.hit_rate:.0%} hit rate).')
+            database_name = databaseConnection.dbname
+            if not len(bloated_index_list) > 0:
+                click.echo(f'No bloated index found for database: {database_name}')
+                exit(0)
+            bloated_index_list.sort(key=lambda item: item["reclaimable_bytes"], reverse=True)
+            if measure:
+                bloated_index_data_to_be_tabulated = lambda item: [
+                    item["database_name"], item["schema_name"], item["index_name"],item['index_type'], item["bloat_ratio"], item["category"],
+                    pretty_size(item["reclaimable_bytes"]), item["estimated_bloat_ratio"], item["measured_bloat_ratio"],
+                    databaseConnection.replica_node_exists, databaseConnection.recovery_status]
+                index_table_headers = ["Database Name", "Schema Name", "Index Name","Index Type", "Bloat Ratio", "Category",
+                                       "Reclaimable Size", "Estimated Bloat", "Measured Bloat",
+                                       "Physical Replication Exists", "Database Recovery Enabled"]
+            else:
+                bloated_index_data_to_be_tabulated = lambda item: [
+                    item["database_name"], item["schema_name"], item["index_name"],item['index_type'], item["bloat_ratio"], item["category"],
+                    pretty_size(item["reclaimable_bytes"]),
+                    databaseConnection.replica_node_exists, databaseConnection.recovery_status]
+                index_table_headers = ["Database Name", "Schema Name", "Index Name","Index Type", "Bloat Ratio", "Category",
+                                       "Reclaimable Size", "Physical Replication Exists", "Database Recovery Enabled"]
+            report_time = str.replace(str(time.time()), ".", "_")
+            json_report_name = f'''{database_name}_bloated_index_{report_time}'''
+            summary = ReclaimableSummary()
+            echo_index_table(bloated_index_list, bloated_index_data_to_be_tabulated, index_table_headers,
+                             report=report_sink(json, export, databaseConnection.config.get("name"), json_report_name,
+                                                output_path, index_table_headers),
+                             top=top, summary=summary)
+            echo_reclaimable_summary(summary)
 
-        if dry_run:
-            click.echo(
-                f'''The following statements can be executed on {database_name}. Think twice before executing them.''')
-            for index in bloated_index_list:
-                command_executed = generate_command(index['category'], index['schema_name'], index['index_name'])
-                click.echo(command_executed)
+            if not remediate(databaseConnection, bloated_index_list, dry_run, execute, output_path, json_report_name,
+                             remediation_settings):
+                exit(1)
+
+    except Exception as e:
+        click.echo(f"Error: {str(e)}")
 
+
+@click.command()
+@click.option('--db-name', default=None, help='The name of the database to connect to. Not needed with --snapshot.')
+@click.option('--snapshot', 'snapshot_path', type=str, default=None,
+              help='Analyze this file written by export-snapshot offline instead of connecting to the database.')
+@click.option("--json", is_flag=True, help="Export output to JSON file.")
+@click.option("--output-path", type=str, default='/tmp/', show_default=True, help="Output file directory")
+@click.option('--dry-run', is_flag=True, help="Perform a dry run without making any changes.")
+@export_options
+@click.option('--execute', is_flag=True,
+              help="Run the statements after writing the rollback script. Ignored with --dry-run.")
+@remediation_options
+def list_duplicate_indexes(json, dry_run, output_path, db_name, snapshot_path, export, top, execute,
+                           remediation_settings):
+    """
+    Connects to the PostgreSQL database and groups structurally identical indexes.
+    Two indexes are duplicates when they share table, access method, key and
+    INCLUDE columns, operator classes, collations, sort options, expressions,
+    predicate and uniqueness.
+
+    Each duplicate is listed next to the index of its group that is kept: the
+    primary key if there is one, otherwise the most scanned and then the oldest
+    index. With --dry-run, the statements dropping the duplicates and a rollback
+    script recreating them are generated.
+    """
+    from .summary import ReclaimableSummary
+    try:
+        check_offline_options(snapshot_path, dry_run=dry_run, execute=execute)
+        with open_database_manager(db_name, snapshot_path) as database_query:
+            duplicate_index_list = (
+                database_query.fetch_duplicate_unique_indexes() + database_query.fetch_duplicate_indexes()
+            )
+            database_name = database_query.dbname
+            if not len(duplicate_index_list) > 0:
+                click.echo(f'No duplicate index found for database: {database_name}')
+                exit(0)
+            duplicate_index_list.sort(key=lambda item: item["reclaimable_bytes"], reverse=True)
+            duplicate_index_data_to_be_tabulated = lambda item: [
+                item["database_name"], item["schema_name"], item["table_name"], item["duplicate_of"],
+                item["index_name"], item["index_type"], item["index_size"], item["category"]]
+            index_table_headers = ["Database Name", "Schema Name", "Table Name", "Kept Index", "Duplicate Index",
+                                   "Index Type", "Index Size", "Category"]
+            report_time = str.replace(str(time.time()), ".", "_")
+            json_report_name = f'''{database_name}_duplicate_index_{report_time}'''
+            summary = ReclaimableSummary()
+            echo_index_table(duplicate_index_list, duplicate_index_data_to_be_tabulated, index_table_headers,
+                             report=report_sink(json, export, database_query.config.get("name"), json_report_name, output_path,
+                                                index_table_headers, json_headers=index_table_headers),
+                             top=top, summary=summary)
+            echo_reclaimable_summary(summary)
+            if not remediate(database_query, duplicate_index_list, dry_run, execute, output_path, json_report_name,
+                             remediation_settings):
+                exit(1)
+    except Exception as e:
+        click.echo(f"Error: {str(e)}")
+
+
+@click.command()
+@click.option('--db-name', required=True, help='The name of the database to connect to.')
+@click.option('--window-minutes', type=int, required=True, help='Length of the maintenance window in minutes.')
+@click.option('--wal-budget', type=str, default=None,
+              help='Maximum WAL the planned statements may write, such as 50GB. Unlimited by default.')
+@click.option('--bloat-threshold', type=int, default=50, help="Set the bloat threshold percentage for indexes.")
+@click.option('--execute-workers', type=int, default=2, show_default=True,
+              help="Number of tables remediated concurrently. Statements on one table run one after the other.")
+@click.option("--output-path", type=str, default='/tmp/', show_default=True, help="Output file directory")
+def plan_remediation(db_name, window_minutes, wal_budget, bloat_threshold, execute_workers, output_path):
+    """
+    Estimates the duration, WAL volume and disk usage of the statement that
+    would remediate every inefficient index, and packs the statements into a
+    maintenance window.
+
+    Durations are predicted from the size of each index and its table and the
+    throughput measured on earlier --execute runs on the same host, kept in
+    COST_HISTORY_DIR. Statements reclaiming the most bytes per second are
+    planned first, and the planned ones are written to a SQL script.
+    """
+    from tabulate import tabulate
+    from .database import DatabaseManager
+    from .costs import RemediationCostModel, ThroughputHistory
+    try:
+        with DatabaseManager(db_name=db_name) as database_query:
+            database_query.on_chunk = echo_chunk_progress
+            database_name = database_query.dbname
+            indexes = {}
+            for item in database_query.fetch_inefficient_indexes(bloat_threshold):
+                indexes.setdefault(item["index_oid"], item)
+            echo_failed_chunks(database_query)
+            if not indexes:
+                click.echo(f'No inefficient index found for database: {database_name}')
+                exit(0)
+            remediable_index_oids = {index_oid for _, _, _, _, index_oid in remediation_indexes(indexes.values())}
+            index_sizes = database_query.get_remediation_sizes(remediable_index_oids)
+            throughput_history = open_throughput_history()
+            cost_model = RemediationCostModel(ThroughputHistory.host_key(database_query.config), throughput_history)
+            if throughput_history is not None:
+                throughput_history.close()
+            estimates = [
+                cost_model.estimate(qualified_name(item["schema_name"], item["table_name"]),
+                                    generate_command(item["category"], item["schema_name"], item["index_name"]),
+                                    index_sizes[index_oid], item["reclaimable_bytes"])
+                for index_oid, item in indexes.items() if index_oid in index_sizes
+            ]
+            plan = RemediationCostModel.plan(estimates, window_minutes * 60,
+                                             parse_size(wal_budget) if wal_budget else None, execute_workers)
+            click.echo(tabulate(
+                [[action.worker + 1 if action.worker is not None else "",
+                  pretty_duration(action.start) if action.start is not None else "",
+                  indexes[action.estimate.index_oid]["schema_name"], indexes[action.estimate.index_oid]["table_name"],
+                  indexes[action.estimate.index_oid]["index_name"], indexes[action.estimate.index_oid]["category"],
+                  action.estimate.operation, pretty_duration(action.estimate.duration),
+                  pretty_size(action.estimate.wal_bytes), pretty_size(action.estimate.temp_bytes),
+                  pretty_size(action.estimate.disk_bytes), pretty_size(action.estimate.reclaimable_bytes),
+                  action.status]
+                 for action in plan],
+                ["Worker", "Start", "Schema Name", "Table Name", "Index Name", "Category", "Operation",
+                 "Est. Duration", "Est. WAL", "Temp Files", "Extra Disk", "Reclaimable Size", "Status"],
+                tablefmt="psql"))
+            planned = [action for action in plan if action.status == "planned"]
             click.echo(
-                f'''The following statements can be executed on {database_name} to recreate the index in case of emergency after the drop operation..'''
-                )
-            for index in bloated_index_list:
-                create_command = databaseConnection.get_index_create_statement(index['schema_name'],index['index_name'])
-                click.echo(create_command)
+                f'Planned {len(planned)} of {len(plan)} statement(s) reclaiming '
+                f'{pretty_size(sum(action.estimate.reclaimable_bytes for action in planned))} in '
+                f'{pretty_duration(max([action.start + action.estimate.duration for action in planned] or [0]))} '
+                f'of the {pretty_duration(window_minutes * 60)} window, writing about '
+                f'{pretty_size(sum(action.estimate.wal_bytes for action in planned))} of WAL.')
+            if not any(action.estimate.measured for action in plan):
+                click.echo('No statement was measured on this host yet, so durations use the default throughput. '
+                           'Runs with --execute record it.')
+            if planned:
+                report_time = str.replace(str(time.time()), ".", "_")
+                plan_script_path = write_rollback_script(
+                    (action.estimate.statement for action in planned),
+                    filename=f'{database_name}_remediation_plan_{report_time}', report_path=output_path)
+                click.echo(f'Planned statements written to {plan_script_path}')
+    except Exception as e:
+        click.echo(f"Error: {str(e)}")
+
+
+@click.command()
+@click.option('--db-name', required=True, help='The name of the database to connect to.')
+@click.option('--output-path', type=str, required=True, help='Snapshot file written.')
+def export_snapshot(db_name, output_path):
+    """
+    Writes the catalog and statistics inputs of the detectors to a snapshot file.
+
+    The index catalog, usage counters, btree column statistics and database facts are
+    read in one consistent snapshot and saved compressed. Every list command accepts
+    the file with --snapshot and then runs offline, without connecting to the database.
+    """
+    from .database import DatabaseManager
+    try:
+        with DatabaseManager(db_name=db_name) as database_instance:
+            started = time.perf_counter()
+            file_size = database_instance.export_snapshot_file(output_path)
+            click.echo(f'Snapshot of {len(database_instance.snapshot().indexes)} index(es) of database: '
+                       f'{database_instance.dbname} written to {output_path} ({pretty_size(file_size)}) in '
+                       f'{time.perf_counter() - started:.1f}s.')
+    except Exception as e:
+        click.echo(f"Error: {str(e)}")
+
+
+@click.command()
+@click.option('--db-name', required=True, help='The name of the database to connect to.')
+@click.option('--history-dir', type=str, required=True, help='Directory of the usage history.')
+@click.option('--hourly-retention-days', type=int, default=7, show_default=True,
+              help='Days hourly buckets are kept before they are merged into daily buckets.')
+@click.option('--retention-days', type=int, default=400, show_default=True,
+              help='Days of usage history kept.')
+def record_usage(db_name, history_dir, hourly_retention_days, retention_days):
+    """
+    Stores a sample of the scan counter of every index in a local usage history.
+
+    Run it periodically, for example hourly from cron. Only the scans between two
+    samples are kept, statistics resets and failovers are detected, and old hourly
+    buckets are downsampled to daily ones. list-unused-indexes --window-days then
+    reports indexes that were not scanned over the last N days.
+    """
+    from .database import DatabaseManager
+    try:
+        with DatabaseManager(db_name=db_name) as database_instance:
+            usage_history = database_instance.use_usage_history(history_dir)
+            sample_count = database_instance.record_usage_sample()
+            merged, dropped = usage_history.compact(hourly_retention_days, retention_days)
+            click.echo(f'Recorded the scan counters of {sample_count} index(es) in {usage_history.path}.')
+            if usage_history.resets_detected:
+                click.echo('A statistics reset was detected since the previous sample.')
+            DatabaseManager.logger.info(f'Merged {merged} hourly bucket(s) into daily ones, dropped {dropped}.')
+    except Exception as e:
+        click.echo(f"Error: {str(e)}")
 
+
+@click.command()
+@click.option('--db-name', required=True, help='The name of the database to connect to.')
+@click.option('--interval', type=int, default=60, show_default=True, help='Seconds between two samples.')
+@click.option('--count', type=int, default=None, help='Stop after this many samples. Runs until interrupted by default.')
+@click.option('--bloat-threshold', type=int, default=50, help="Set the bloat threshold percentage for indexes.")
+@click.option('--ndjson', is_flag=True, help='Print events as newline-delimited JSON.')
+def watch(db_name, interval, count, bloat_threshold, ndjson):
+    """
+    Keeps one connection open and reports indexes changing category while the
+    database runs.
+
+    Every interval, a catalog change marker and the usage and size counters of
+    the indexes are read with prepared statements. The rules are evaluated again
+    only for tables whose indexes changed, and the full catalog is read again
+    only after DDL. An event is printed whenever an index enters or leaves a
+    category, or is dropped.
+    """
+    from .database import DatabaseManager
+    from .watch import IndexWatcher
+    try:
+        with DatabaseManager(db_name=db_name) as database_instance:
+            watcher = IndexWatcher(database_instance, bloat_threshold=bloat_threshold)
+            while count is None or watcher.samples < count:
+                for event in watcher.sample():
+                    if ndjson:
+                        click.echo(json_module.dumps(event))
+                    else:
+                        click.echo(f'{event["time"]} {event["schema_name"]}.{event["index_name"]} '
+                                   f'{event["change"]} {event["category"]}')
+                DatabaseManager.logger.info(
+                    f'Sample {watcher.samples} took {watcher.last_sample_ms:.1f} ms, '
+                    f'{watcher.reloads} catalog read(s) so far.')
+                if count is None or watcher.samples < count:
+                    time.sleep(max(0.0, interval - watcher.last_sample_ms / 1000))
+    except KeyboardInterrupt:
+        pass
     except Exception as e:
         click.echo(f"Error: {str(e)}")
 
 
+@click.command()
+@click.option('--tag', 'tags', multiple=True, help='Only scan databases with this tag. Can be repeated.')
+@click.option('--workers', type=int, default=8, show_default=True, help='Maximum number of databases scanned concurrently.')
+@click.option('--per-host', type=int, default=2, show_default=True, help='Maximum number of concurrent scans per host.')
+@click.option('--timeout', type=int, default=300, show_default=True, help='Seconds allowed for a single database scan.')
+@click.option('--bloat-threshold', type=int, default=50, help="Set the bloat threshold percentage for indexes.")
+@click.option("--json", is_flag=True, help="Export output to JSON file.")
+@click.option("--output-path", type=str, default='/tmp/', show_default=True, help="Output file directory")
+@export_options
+def scan_fleet(tags, workers, per_host, timeout, bloat_threshold, json, output_path, export, top):
+    """
+    Scans every database in the configuration file, or the ones carrying one of
+    the given tags, concurrently and reports inefficient indexes of all categories
+    in a single merged table.
+
+    Scans are spread over a bounded worker pool with a per host concurrency cap,
+    each database has its own timeout, and a database that fails or times out is
+    reported separately without affecting the others.
+    """
+    from tabulate import tabulate
+    from .database import DatabaseManager
+    from .fleet import FleetScanner
+    from .summary import ReclaimableSummary
+    try:
+        configs = DatabaseManager.load_all_configs(os.getenv("CONFIG_FILE", "db_config.yaml"), tags)
+        if not configs:
+            click.echo('No database matched the given tags.')
+            exit(0)
+        scanner = FleetScanner(configs, max_workers=workers, per_host_limit=per_host, timeout=timeout,
+                               bloat_threshold=bloat_threshold)
+        scan_results = scanner.scan()
+        fleet_indexes = sorted(
+            (dict(item, config_name=result["name"]) for result in scan_results for item in result["indexes"]),
+            key=lambda item: item["reclaimable_bytes"], reverse=True)
+        fleet_index_data_to_be_tabulated = lambda item: [
+            item["config_name"], item["database_name"], item["schema_name"], item["index_name"], item["index_type"],
+            item["index_size"], item["category"]]
+        index_table_headers = ["Config Name", "Database Name", "Schema Name", "Index Name", "Index Type",
+                               "Index Size", "Category"]
+        report_time = str.replace(str(time.time()), ".", "_")
+        report = report_sink(json, export, "fleet", f'fleet_inefficient_index_{report_time}', output_path,
+                             index_table_headers, json_headers=index_table_headers)
+        summary = ReclaimableSummary()
+        if not echo_index_table(fleet_indexes, fleet_index_data_to_be_tabulated, index_table_headers, report=report,
+                                top=top, summary=summary):
+            click.echo('No inefficient index found in the scanned databases.')
+        echo_reclaimable_summary(summary)
+        scan_summary = [
+            [result["name"], f'{result["host"]}:{result["port"]}', result["status"], len(result["indexes"]),
+             format(result["elapsed"], ".1f"), result["error"] or ""]
+            for result in scan_results
+        ]
+        click.echo(tabulate(scan_summary, ["Config Name", "Host", "Status", "Index Count", "Elapsed (s)", "Error"],
+                            tablefmt="psql"))
+        if any(result["status"] != "ok" for result in scan_results):
+            exit(1)
+    except Exception as e:
+        click.echo(f"Error: {str(e)}")
+
+
+def echo_profile(profiler, limit=10):
+    """Writes the trace of a profiled run and echoes its slowest queries."""
+    from tabulate import tabulate
+    profiler.stop()
+    queries = profiler.summary()
+    if queries:
+        click.echo(tabulate(
+            [[name, calls, f"{seconds:.3f}", rows, pretty_size(size)]
+             for name, calls, seconds, rows, size in queries[:limit]],
+            ["Query", "Calls", "Seconds", "Rows", "Bytes"], tablefmt="psql"))
+    click.echo(f"Profile trace written to {profiler.path}")
+
+
 @click.group()
-def main():
+@click.option('--verbose', is_flag=True, help='Log informational messages, such as how many connections a run opened.')
+@click.option('--profile', 'profile_path', type=click.Path(dir_okay=False, writable=True), default=None,
+              help='Write a Chrome trace of the queries and steps of the run to this file.')
+@click.option('--profile-explain', is_flag=True,
+              help='With --profile, also capture EXPLAIN (ANALYZE, BUFFERS) of the heavy catalog queries.')
+def main(verbose, profile_path, profile_explain):
     """
     The main entry point for the pgindexinsight CLI Tool. 
 
@@ -356,19 +1026,34 @@ def main():
     Available commands include:
     - list_unused_indexes: Lists indexes that are no longer in use.
     - list_invalid_indexes: Identifies indexes that are misconfigured or corrupted.
-    - list_duplicate_indexes: Finds duplicate B-tree indexes.
+    - list_duplicate_indexes: Groups structurally identical indexes and the one to keep.
     - list_unemployed_indexes: Reports on indexes that are underperforming.
     - list_bloated_btree_indexes: Detects indexes with excessive unused space.
+    - scan_fleet: Scans every configured database concurrently.
+    - record_usage: Samples index scan counters into the local usage history.
+    - watch: Reports indexes changing category while the database runs.
+    - plan_remediation: Packs remediation statements into a maintenance window.
+    - export_snapshot: Saves the detector inputs to a file for offline analysis.
 
     To use this tool, invoke it from the command line and specify a command.
     """
-    pass
+    configure_logging(logging.INFO if verbose else logging.WARNING)
+    if profile_path:
+        from .profiling import Profiler
+        profiler = Profiler(profile_path, explain=profile_explain).start()
+        click.get_current_context().call_on_close(lambda: echo_profile(profiler))
 
 
 main.add_command(list_bloated_btree_indexes)
 main.add_command(list_unemployed_indexes)
 main.add_command(list_invalid_indexes)
 main.add_command(list_unused_indexes)
+main.add_command(list_duplicate_indexes)
+main.add_command(scan_fleet)
+main.add_command(record_usage)
+main.add_command(watch)
+main.add_command(plan_remediation)
+main.add_command(export_snapshot)
 
 if __name__ == '__main__':
     main()
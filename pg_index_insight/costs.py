@@ -0,0 +1,194 @@
+import os
+import sqlite3
+import time
+from collections import namedtuple
+
+DEFAULT_COST_HISTORY_DIR = os.path.join(os.path.expanduser("~"), ".pg_index_insight")
+
+ActionSizes = namedtuple("ActionSizes", [
+    "index_oid", "index_size_bytes", "table_size_bytes", "reltuples", "maintenance_work_mem_bytes"])
+ActionEstimate = namedtuple("ActionEstimate", [
+    "table", "statement", "operation", "index_oid", "duration", "wal_bytes", "temp_bytes", "disk_bytes",
+    "reclaimable_bytes", "measured"])
+PlannedAction = namedtuple("PlannedAction", ["estimate", "worker", "start", "status"])
+
+
+def statement_operation(statement):
+    """Returns REINDEX or DROP for a remediation statement."""
+    return "REINDEX" if statement.lstrip().upper().startswith("REINDEX") else "DROP"
+
+
+class ThroughputHistory:
+    """
+    A local SQLite store of the remediation statements run on every host, used to predict the next ones.
+
+    A REINDEX INDEX CONCURRENTLY scans its table twice and writes the new index, so its
+    work is counted as twice the table size plus the index size, and its throughput as
+    that work over its duration. A DROP INDEX CONCURRENTLY mostly waits for the
+    transactions using the table, so only its duration is kept. Statements that were
+    retried are not recorded, since their duration includes the backoff.
+
+    Attributes:
+        path (str): History file location.
+    """
+
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS executions (
+            host TEXT NOT NULL,
+            operation TEXT NOT NULL,
+            work_bytes INTEGER NOT NULL,
+            duration REAL NOT NULL,
+            executed_at INTEGER NOT NULL
+        )""",
+        """CREATE INDEX IF NOT EXISTS executions_host_operation ON executions (host, operation, executed_at)""",
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            for statement in self.SCHEMA:
+                self.connection.execute(statement)
+
+    @classmethod
+    def for_directory(cls, history_dir):
+        """Opens the throughput history file inside history_dir."""
+        os.makedirs(history_dir, exist_ok=True)
+        return cls(os.path.join(history_dir, 'remediation_throughput.sqlite'))
+
+    @staticmethod
+    def host_key(config):
+        """Returns the host key of a database configuration."""
+        return f'{config.get("host", "localhost")}:{config.get("port", "5432")}'
+
+    def record(self, host, operation, work_bytes, duration, executed_at=None):
+        """Stores one statement that ran without a retry."""
+        with self.connection:
+            self.connection.execute("INSERT INTO executions VALUES (?, ?, ?, ?, ?)",
+                                    (host, operation, int(work_bytes), float(duration),
+                                     int(executed_at if executed_at is not None else time.time())))
+
+    def observations(self, host, operation, limit=20):
+        """Returns (work bytes, duration) of the latest limit statements of an operation on a host."""
+        return self.connection.execute(
+            """SELECT work_bytes, duration FROM executions
+               WHERE host = ? AND operation = ?
+               ORDER BY executed_at DESC LIMIT ?""",
+            (host, operation, limit)).fetchall()
+
+    def close(self):
+        """Closes the history file."""
+        self.connection.close()
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+
+
+class RemediationCostModel:
+    """
+    Predicts the duration, WAL volume and disk usage of remediation statements and packs them into a window.
+
+    The duration of a REINDEX INDEX CONCURRENTLY is its work, twice the table size plus
+    the index size, over the median throughput of the latest ones run on the same host,
+    or over DEFAULT_REINDEX_THROUGHPUT when none was recorded. A DROP INDEX CONCURRENTLY
+    takes the median duration of the latest drops on the host.
+
+    The rebuilt index is the current index without its reclaimable bloat. Index builds
+    write every page of the new index to WAL, and the new index sits next to the old one
+    until the swap. The sort spills to temporary files when its tuples, about the new
+    index plus SORT_TUPLE_OVERHEAD bytes per tuple, do not fit in maintenance_work_mem.
+
+    Attributes:
+        host (str): Host key the throughput history is read for.
+        history (ThroughputHistory): Measured throughput, or None for the defaults only.
+    """
+
+    DEFAULT_REINDEX_THROUGHPUT = 32 * 1024 * 1024
+    DEFAULT_DROP_DURATION = 1.0
+    SORT_TUPLE_OVERHEAD = 24
+
+    def __init__(self, host, history=None):
+        self.host = host
+        self.history = history
+        self._reindex_throughput = None
+        self._drop_duration = None
+        if history is not None:
+            reindexes = [work_bytes / duration for work_bytes, duration in history.observations(host, "REINDEX")
+                         if duration > 0]
+            drops = [duration for _, duration in history.observations(host, "DROP")]
+            self._reindex_throughput = _median(reindexes) if reindexes else None
+            self._drop_duration = _median(drops) if drops else None
+
+    @staticmethod
+    def work_bytes(operation, sizes):
+        """Returns the bytes a statement reads and writes, the unit its throughput is measured in."""
+        if operation == "DROP":
+            return 0
+        return 2 * sizes.table_size_bytes + sizes.index_size_bytes
+
+    def estimate(self, table, statement, sizes, reclaimable_bytes):
+        """
+        Predicts the cost of one remediation statement.
+
+        Parameters:
+            table (str): Schema qualified table name.
+            statement (str): Statement generate_command produced.
+            sizes (ActionSizes): Current sizes of the index and its table.
+            reclaimable_bytes (int): Bytes the statement gives back.
+
+        Returns:
+            ActionEstimate: Duration in seconds, WAL, temporary file and additional disk bytes.
+        """
+        operation = statement_operation(statement)
+        if operation == "DROP":
+            duration = self._drop_duration if self._drop_duration is not None else self.DEFAULT_DROP_DURATION
+            return ActionEstimate(table, statement, operation, sizes.index_oid, duration, 0, 0, 0,
+                                  reclaimable_bytes, self._drop_duration is not None)
+        throughput = (self._reindex_throughput if self._reindex_throughput is not None
+                      else self.DEFAULT_REINDEX_THROUGHPUT)
+        new_index_bytes = max(0, sizes.index_size_bytes - reclaimable_bytes)
+        sort_bytes = new_index_bytes + int(sizes.reltuples) * self.SORT_TUPLE_OVERHEAD
+        temp_bytes = sort_bytes if sort_bytes > sizes.maintenance_work_mem_bytes else 0
+        return ActionEstimate(table, statement, operation, sizes.index_oid,
+                              self.work_bytes(operation, sizes) / throughput, new_index_bytes, temp_bytes,
+                              new_index_bytes + temp_bytes, reclaimable_bytes, self._reindex_throughput is not None)
+
+    @staticmethod
+    def plan(estimates, window_seconds, wal_budget=None, workers=2):
+        """
+        Packs estimated statements into a window run by workers, the most reclaimed bytes per second first.
+
+        Statements of one table run one after the other on the same worker, as the
+        RemediationExecutor runs them, and a table goes to the worker that is free first.
+        A statement that would end after the window or exceed the WAL budget is deferred.
+
+        Returns:
+            list: PlannedAction of every estimate, the planned ones in start order first.
+        """
+        workers = max(1, workers)
+        ranked = sorted(estimates, key=lambda estimate: estimate.reclaimable_bytes / max(estimate.duration, 1.0),
+                        reverse=True)
+        table_workers = {}
+        ends = [0.0] * workers
+        wal_total = 0
+        planned = []
+        deferred = []
+        for estimate in ranked:
+            worker = table_workers.get(estimate.table)
+            if worker is None:
+                worker = min(range(workers), key=ends.__getitem__)
+            start = ends[worker]
+            if start + estimate.duration > window_seconds:
+                deferred.append(PlannedAction(estimate, None, None, "over window"))
+            elif wal_budget is not None and wal_total + estimate.wal_bytes > wal_budget:
+                deferred.append(PlannedAction(estimate, None, None, "over WAL budget"))
+            else:
+                table_workers[estimate.table] = worker
+                ends[worker] = start + estimate.duration
+                wal_total += estimate.wal_bytes
+                planned.append(PlannedAction(estimate, worker, start, "planned"))
+        planned.sort(key=lambda action: (action.start, action.worker))
+        return planned + deferred
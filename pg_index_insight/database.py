@@ -1,8 +1,16 @@
 import os
-import yaml
-import psycopg2
-import re
+from contextlib import contextmanager
 from .queries import SqlQueries
+from .pool import ConnectionPool
+from .snapshot import CatalogSnapshot, CatalogStream, DEFAULT_BATCH_SIZE, DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_ATTEMPTS
+from .analyzer import IndexAnalyzer
+from .bloat_cache import BloatCache
+from .history import UsageHistory
+from .measure import ExactBloatMeasurer, DEFAULT_MAX_CANDIDATES
+from .replicas import ReplicaUsageCollector
+from .costs import ActionSizes
+from . import profiling
+from .utils import pretty_size, add_concurrently, LOGGER_NAME
 import logging
 
 class DatabaseManager:
@@ -15,40 +23,70 @@ class DatabaseManager:
 
     Attributes:
         connection (psycopg2.connection): The connection object for the PostgreSQL database.
+        pool (ConnectionPool): The pool all connections of this manager are checked out from.
+        connections_opened (int): Number of server connections opened during the run.
         replica_node_exists (bool): Indicates if a replica node exists.
         recovery_status (bool): The recovery status of the database.
+        snapshot_path (str): Snapshot file analyzed offline, or None when connected to the database.
+        on_chunk (callable): Called with (completed, submitted, failed) as column statistics chunks are read.
 
     Methods:
-        connect(): Establishes a database connection using environment variables.
-        close(): Closes the database connection.
-        run_query(): Executes a list of SQL queries on the connected PostgreSQL database.
-        collect_facts(): Collects and stores facts about the database's state.
+        connect(): Returns the shared pooled connection, opening it on first use.
+        pooled_connection(): Borrows an additional pooled connection for concurrent work.
+        close(): Closes every pooled connection. The manager is also a context manager.
+        collect_facts(): Collects and stores facts about the database's state, on first use of one of them.
         get_unused_and_invalid_indexes(): Retrieves unused, invalid, and duplicate indexes.
         get_bloated_indexes(): Identifies bloated B-tree indexes in the database.
+        measure_bloated_indexes(): Measures the bloat of the top candidates exactly with pgstattuple.
         fetch_invalid_indexes(): Identifies invalid indexes that require attention.
         fetch_unused_indexes(): Retrieves indexes that have not been used in a specified timeframe.
+        fetch_inefficient_indexes(): Retrieves indexes of every category at once.
+        snapshot(): Returns the per-run catalog snapshot the detectors are evaluated on.
+        stream(): Returns a catalog stream read table by table from server-side cursors.
+        from_snapshot_file(): Opens a manager analyzing a snapshot file offline.
+        export_snapshot_file(): Writes the catalog snapshot and database facts to a snapshot file.
+        iter_index_results(): Yields the result of every index matching the given rules.
+        use_bloat_cache(): Enables the on-disk cache of btree bloat estimates.
+        use_usage_history(): Judges unused indexes on their scans over a window of the usage history.
+        record_usage_sample(): Stores a sample of every index scan counter in the usage history.
+        collect_replica_usage(): Sums index scans over the primary and its configured standbys.
     """
-    logger = logging.getLogger("pgindexinsight")
-    logger.setLevel(logging.WARNING)
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.WARNING)
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    logger = logging.getLogger(LOGGER_NAME)
     MIN_SUPPORTED_VERSION = 13
+    DEFAULT_MAX_CONNECTIONS = 4
+    DEFAULT_CONNECT_TIMEOUT = 10
+    DEFAULT_QUERY_CONCURRENCY = 2
     SYSTEM_DATABASE_LIST = ['postgres', 'template0', 'template1']
+    RULE_CATEGORIES = {
+        "unused": "Unused Index",
+        "invalid": "Invalid Index",
+        "duplicate_unique": "Duplicate Unique Index",
+        "duplicate": "Duplicate Index",
+        "redundant": "Unused&Redundant Index",
+        "bloat": "Bloated",
+    }
 
-    def __init__(self, db_name=None):
+    def __init__(self, db_name=None, config=None):
         self.connection = None
-        self.replica_node_exists = None
-        self.recovery_status = None
-        self.database_version = None
-        self.config = self.load_config(os.getenv("CONFIG_FILE", "db_config.yaml"),db_name)
+        self.pool = None
+        self._superuser_checked = False
+        self._facts = None
+        self._snapshot = None
+        self.bloat_cache = None
+        self.usage_history = None
+        self.usage_window_days = None
+        self.replica_usage = None
+        self._cluster_scans = None
+        self.snapshot_path = None
+        self.on_chunk = None
+        if config is None:
+            config = self.load_config(os.getenv("CONFIG_FILE", "db_config.yaml"), db_name)
+        self.config = config
         self.dbname = self.config.get("dbname")
-        self.collect_facts()
 
     def load_config(self, config_file, db_name):
         """Loads database configuration for a specific database from a YAML file."""
+        import yaml
         try:
             with open(config_file, 'r') as file:
                 all_configs = yaml.safe_load(file)['databases']
@@ -59,36 +97,86 @@ class DatabaseManager:
         except Exception as e:
             raise FileNotFoundError(f"Failed to load configuration file {config_file}: {e}")
 
+    @staticmethod
+    def load_all_configs(config_file, tags=None):
+        """Loads every database configuration from a YAML file, optionally keeping only entries with one of the tags."""
+        import yaml
+        try:
+            with open(config_file, 'r') as file:
+                all_configs = yaml.safe_load(file)['databases']
+        except Exception as e:
+            raise FileNotFoundError(f"Failed to load configuration file {config_file}: {e}")
+        if tags:
+            all_configs = [db_config for db_config in all_configs if set(tags) & set(db_config.get('tags') or [])]
+        return all_configs
+
+    def connect_kwargs(self, config):
+        """Validates a node connection configuration and returns the psycopg2 connection parameters."""
+        dbname = config.get("dbname")
+        user = config.get("user")
+        password = config.get("password")
+        if not all([dbname, user, password]):
+            raise ValueError("Missing one or more required database configurations in the YAML file.")
+        if dbname in DatabaseManager.SYSTEM_DATABASE_LIST:
+            raise ValueError(f"System databases are not allowed to be analyzed: {dbname}")
+        connect_kwargs = dict(
+            host=config.get("host", "localhost"),
+            port=config.get("port", "5432"),
+            dbname=dbname,
+            user=user,
+            password=password,
+            connect_timeout=config.get("connect_timeout", DatabaseManager.DEFAULT_CONNECT_TIMEOUT),
+            options="-c statement_timeout=600s -c lock_timeout=5s -c log_statement=all",
+            application_name="pgindexinsight",
+        )
+        if profiling.current() is not None:
+            connect_kwargs["connection_factory"] = profiling.ProfilingConnection
+        return connect_kwargs
+
+    def _create_pool(self):
+        """Validates the connection configuration and creates the connection pool."""
+        return ConnectionPool(
+            self.connect_kwargs(self.config),
+            max_connections=self.config.get("max_connections", DatabaseManager.DEFAULT_MAX_CONNECTIONS),
+        )
+
     def connect(self):
-        """Initializes the DatabaseManager and collects database facts."""
+        """Returns the connection shared by the detectors, checking it out of the pool on first use."""
+        if self.snapshot_path is not None:
+            raise ConnectionError(
+                f"Analyzing the snapshot file {self.snapshot_path} offline, the database cannot be connected to.")
         if self.connection is None:
             try:
-                host = self.config.get("host", "localhost")
-                port = self.config.get("port", "5432")
-                dbname = self.config.get("dbname")
-                user = self.config.get("user")
-                password = self.config.get("password")
-                if not all([dbname, user, password]):
-                    raise ValueError("Missing one or more required database configurations in the YAML file.")
-                if dbname in DatabaseManager.SYSTEM_DATABASE_LIST:
-                    raise ValueError(f"System databases are not allowed to be analyzed: {dbname}")
-
-                self.connection = psycopg2.connect(
-                    host=host,
-                    port=port,
-                    dbname=dbname,
-                    user=user,
-                    password=password,
-                    connect_timeout=10,
-                    options="-c statement_timeout=600s -c lock_timeout=5s -c log_statement=all",
-                    application_name="pgindexinsight",
-                )
-                self.connection.autocommit = True
-                self.check_superuser()
+                if self.pool is None:
+                    self.pool = self._create_pool()
+                self.connection = self.pool.getconn()
+                if not self._superuser_checked:
+                    self.check_superuser()
+                    self._superuser_checked = True
             except Exception as e:
                 raise ConnectionError(f"Error connecting to the database: {str(e)}")
         return self.connection
 
+    @contextmanager
+    def pooled_connection(self):
+        """Context manager borrowing an additional pooled connection for work running next to the shared one."""
+        if self.pool is None:
+            self.connect()
+        with self.pool.connection() as connection:
+            yield connection
+
+    @property
+    def connections_opened(self):
+        """Number of server connections opened by this manager so far."""
+        return self.pool.connections_opened if self.pool is not None else 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
     def check_superuser(self):
         """Checks if the connected user is a superuser and logs a debug message."""
         try:
@@ -102,247 +190,358 @@ class DatabaseManager:
         except Exception as e:
             DatabaseManager.logger.error(f"Failed to check superuser status: {e}")
 
-    def run_query(self, queries):
-        """Run query against Postgresql database. It takes list of queries."""
-        for query in queries:
-            database_connection = self.connect()
-            with database_connection.cursor() as db_cursor:
-                try:
-                    pattern = r"^(DROP INDEX CONCURRENTLY|REINDEX INDEX CONCURRENTLY)\b"
-                    is_query_valid = bool(re.match(pattern, query.strip(), re.IGNORECASE))
-                    if not is_query_valid:
-                        DatabaseManager.logger.warning(
-                            "The query sent is not valid to be executed database.Please review the generated query.")
-                        DatabaseManager.logger.info(query)
-                        return False
-                    db_cursor.execute(query)
-                    self.close()
-                    DatabaseManager.logger.warning("Executed the query and closing connection")
-                except Exception as e:
-                    print(f"Error: {str(e)}")
-                    return False
+    def cancel(self):
+        """Cancels the statements currently running on the pooled connections. Safe to call from another thread."""
+        if self.pool is not None:
+            self.pool.cancel_all()
 
     def close(self):
-        """Closes the database connection."""
-        if self.connection:
-            self.connection.close()
-            self.connection = None
+        """Closes every pooled database connection and the usage history. Called once, at the end of the run."""
+        if self.usage_history is not None:
+            self.usage_history.close()
+            self.usage_history = None
+        if self.pool is not None:
+            self.pool.closeall()
+            DatabaseManager.logger.info(f"Opened {self.pool.connections_opened} database connection(s) during this run.")
+            self.pool = None
+        self.connection = None
 
     def collect_facts(self):
-        """Collects and sets database recovery and replication status."""
+        """Collects and returns the database recovery and replication status and the server version, in one round trip."""
         database_connection = self.connect()
         with database_connection.cursor() as db_cursor:
-            db_cursor.execute("select pg_is_in_recovery()")
-            recovery_status = db_cursor.fetchall()
-            recovery_status = recovery_status[0][0]
-            self.recovery_status = recovery_status
-            db_cursor.execute(
-                f"""select count(*) as physical_repl_count from pg_replication_slots where slot_type='physical' and active is true """
+            db_cursor.execute(SqlQueries.get_database_facts())
+            recovery_status, replica_count, database_version = db_cursor.fetchone()
+            database_version = float(str(database_version).split(' ')[1])
+        self._facts = {
+            "recovery_status": recovery_status,
+            "replica_node_exists": replica_count > 0,
+            "database_version": database_version,
+        }
+        return self._facts
+
+    @property
+    def recovery_status(self):
+        """True when the database is in recovery. Facts are collected on first use, not when the manager is created."""
+        return (self._facts or self.collect_facts())["recovery_status"]
+
+    @property
+    def replica_node_exists(self):
+        """True when an active physical replication slot exists."""
+        return (self._facts or self.collect_facts())["replica_node_exists"]
+
+    @property
+    def database_version(self):
+        """Major and minor server version, such as 16.2."""
+        return (self._facts or self.collect_facts())["database_version"]
+
+    @property
+    def query_concurrency(self):
+        """
+        Number of catalog queries a snapshot reads at once, from query_concurrency in the configuration.
+
+        The concurrent queries run on borrowed connections while the shared one holds the
+        snapshot, so it is capped to one less than max_connections.
+        """
+        max_connections = self.config.get("max_connections", DatabaseManager.DEFAULT_MAX_CONNECTIONS)
+        return max(1, min(self.config.get("query_concurrency", DatabaseManager.DEFAULT_QUERY_CONCURRENCY),
+                          max_connections - 1))
+
+    def _load_snapshot(self, bloat_cache=None):
+        """
+        Reads a catalog snapshot, with the column statistics in concurrent chunks when query_concurrency allows.
+
+        stats_chunk_size and stats_chunk_attempts in the configuration set the indexes per
+        chunk and the reads of a table before its chunk is reported in failed_chunks.
+        """
+        concurrency = self.query_concurrency
+        with profiling.span("load catalog snapshot", concurrency=concurrency):
+            snapshot = CatalogSnapshot.load(
+                self.connect(), bloat_cache=bloat_cache,
+                borrow_connection=self.pooled_connection if concurrency > 1 else None,
+                concurrency=concurrency, timeout=self.config.get("query_timeout"),
+                chunk_size=self.config.get("stats_chunk_size", DEFAULT_CHUNK_SIZE),
+                chunk_attempts=self.config.get("stats_chunk_attempts", DEFAULT_CHUNK_ATTEMPTS),
+                on_chunk=self.on_chunk)
+        for chunk in snapshot.failed_chunks:
+            DatabaseManager.logger.warning(
+                f"Column statistics of {len(chunk.index_oids)} index(es) of tables {chunk.first_table_oid} to "
+                f"{chunk.last_table_oid} could not be read, their bloat is not estimated: {chunk.error}")
+        return snapshot
+
+    def snapshot(self):
+        """Returns the catalog snapshot all detectors evaluate, loaded once per run."""
+        if self._snapshot is None:
+            self._snapshot = self._load_snapshot(self.bloat_cache)
+        return self._snapshot
+
+    @classmethod
+    def from_snapshot_file(cls, path):
+        """
+        Returns a manager evaluating the detectors on a snapshot file written by export_snapshot_file.
+
+        The manager never connects: its configuration, facts and catalog snapshot all come
+        from the file, and operations needing the database raise a ConnectionError.
+        """
+        from .snapshot_file import SnapshotFile
+        with profiling.span("load snapshot file", path=path):
+            with SnapshotFile(path) as snapshot_file:
+                manager = cls(config=dict(snapshot_file.database))
+                manager._facts = dict(snapshot_file.facts)
+                manager._snapshot = snapshot_file.load()
+                DatabaseManager.logger.info(f"Analyzing {snapshot_file.describe()} offline.")
+        manager.snapshot_path = path
+        return manager
+
+    def export_snapshot_file(self, path):
+        """
+        Reads a complete catalog snapshot and writes it with the database facts to path.
+
+        Column statistics of every btree index are included, whatever the bloat cache holds,
+        so any rule can be evaluated from the file later. The snapshot becomes the run
+        snapshot. Returns the file size in bytes.
+        """
+        from .snapshot_file import SnapshotFile
+        self._check_version_supported()
+        self._snapshot = self._load_snapshot()
+        if self._snapshot.failed_chunks:
+            raise ValueError(f"Column statistics of {len(self._snapshot.unread_index_oids)} index(es) could not be "
+                             f"read, so the snapshot file was not written.")
+        with profiling.span("write snapshot file", path=path):
+            return SnapshotFile.write(path, self._snapshot, self.config, dict(self._facts or self.collect_facts()))
+
+    def stream(self, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Returns a CatalogStream reading the detector inputs table by table, batch_size rows per round trip.
+
+        When query_concurrency allows, the column statistics are read ahead on a borrowed connection.
+        """
+        return CatalogStream(self.connect(), batch_size=batch_size,
+                             borrow_connection=self.pooled_connection if self.query_concurrency > 1 else None,
+                             timeout=self.config.get("query_timeout"))
+
+    def analyzer(self, streaming=False, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Returns an IndexAnalyzer sharing the bloat cache if one is in use.
+
+        The analyzer evaluates the run snapshot, or a catalog stream when streaming is set,
+        which keeps memory flat on catalogs too large to hold at once. A manager analyzing
+        a snapshot file always evaluates the snapshot it loaded.
+        """
+        source = self.stream(batch_size) if streaming and self.snapshot_path is None else self.snapshot()
+        unused_index_sets = []
+        if self.usage_history is not None and self.usage_window_days is not None:
+            unused_index_sets.append(self.usage_history.unused_index_oids(self.usage_window_days))
+        if self.config.get("standbys"):
+            if self.replica_usage is None:
+                self.collect_replica_usage()
+            unused_index_sets.append(self.replica_usage.unused_index_oids())
+        unused_index_oids = set.intersection(*unused_index_sets) if unused_index_sets else None
+        return IndexAnalyzer(source, bloat_cache=self.bloat_cache, unused_index_oids=unused_index_oids)
+
+    def iter_index_results(self, rules, bloat_threshold=None, streaming=True, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Yields the result dictionary of every index matching one of the rules, in a single pass over the catalog.
+
+        Results of partitioned indexes also hold partition_count, the number of leaf
+        partitions whose size and scans were summed into them.
+
+        Parameters:
+            rules (iterable of str): Rules of IndexAnalyzer.RULES to evaluate.
+            bloat_threshold (int): Minimum estimated bloat percentage reported by the bloat rule.
+            streaming (bool): Read the catalog from server-side cursors instead of the run snapshot.
+            batch_size (int): Rows fetched per round trip when streaming.
+        """
+        self._check_version_supported()
+        analyzer = self.analyzer(streaming=streaming, batch_size=batch_size)
+        with profiling.span("evaluate rules", rules=list(rules), streaming=streaming) as span_args:
+            result_count = 0
+            for rule, record, related in analyzer.evaluate(tuple(rules), bloat_threshold):
+                result_count += 1
+                result = self._rule_result(rule, record, related)
+                if record.is_partitioned:
+                    result["partition_count"] = analyzer.partition_counts.get(record.index_oid, 0)
+                yield result
+            if span_args is not None:
+                span_args["results"] = result_count
+
+    def _rule_result(self, rule, record, related):
+        """Builds the result dictionary of an index matched by a rule of IndexAnalyzer.evaluate."""
+        category = DatabaseManager.RULE_CATEGORIES[rule]
+        if rule == "redundant":
+            return self._redundant_result(record, related)
+        if rule in ("duplicate", "duplicate_unique"):
+            return self._duplicate_result(record, related, category)
+        result = self._index_result(record, category)
+        if rule == "unused":
+            result["index_scan"] = (
+                self._cluster_scans.get(record.index_oid, record.index_scans)
+                if self._cluster_scans is not None else record.index_scans
             )
-            replica_count = db_cursor.fetchall()
-            replica_count = replica_count[0][0]
-            if replica_count > 0:
-                self.replica_node_exists = True
-            else:
-                self.replica_node_exists = False
-            db_cursor.execute('select version()')
-            database_version = db_cursor.fetchall()
-            database_version = float(str(database_version[0][0]).split(' ')[1])
-            self.database_version = database_version
+        elif rule == "bloat":
+            result["bloat_ratio"] = float(format(related[0], ".1f"))
+            result["reclaimable_bytes"] = int(related[1])
+        return result
+
+    def use_bloat_cache(self, cache_dir):
+        """Enables the on-disk bloat estimate cache kept in cache_dir for this database."""
+        self.bloat_cache = BloatCache.for_database(cache_dir, self.config)
+        return self.bloat_cache
+
+    def collect_replica_usage(self):
+        """
+        Reads the index scan counters of the primary and every configured standby concurrently.
+
+        Indexes are then only reported unused when they are idle on every node, and on no
+        node at all when one of them did not answer.
+
+        Returns:
+            ReplicaUsageCollector: The collector holding the per node results.
+        """
+        self.replica_usage = ReplicaUsageCollector(self)
+        self.replica_usage.collect()
+        self._cluster_scans = self.replica_usage.total_scans()
+        if not self.replica_usage.complete:
+            DatabaseManager.logger.warning(
+                "Index usage could not be read from every node, so no index is reported as unused.")
+        return self.replica_usage
+
+    def use_usage_history(self, history_dir, window_days=None):
+        """
+        Opens the usage history kept in history_dir for this database.
+
+        With window_days, an index is unused when the history covers the whole window and
+        shows no scan in it, instead of when idx_scan is zero.
+        """
+        self.usage_history = UsageHistory.for_database(history_dir, self.config)
+        self.usage_window_days = window_days
+        return self.usage_history
+
+    def record_usage_sample(self):
+        """Stores a sample of the scan counter of every index in the usage history, returning the number sampled."""
+        database_connection = self.connect()
+        with database_connection.cursor() as database_cursor:
+            database_cursor.execute(SqlQueries.get_index_usage_sample())
+            rows = database_cursor.fetchall()
+        stats_reset = rows[0][2] if rows else None
+        return self.usage_history.record(((index_oid, index_scans) for index_oid, index_scans, _ in rows),
+                                         stats_reset=stats_reset)
 
     def _check_version_supported(self):
         """Ensures that the database version is supported."""
         if self.database_version < self.MIN_SUPPORTED_VERSION:
             raise ValueError(f"PostgreSQL version {self.MIN_SUPPORTED_VERSION}.0 and higher is supported.")
 
+    def _index_result(self, record, category):
+        """
+        Builds the result dictionary reported for an index.
+
+        report_only marks indexes no remediation statement can be generated for: a partitioned
+        index cannot be dropped or rebuilt concurrently, and an index attached to one cannot be
+        dropped on its own.
+        """
+        return {
+            "database_name": self.dbname,
+            "schema_name": record.schema_name,
+            "table_name": record.table_name,
+            "index_name": record.index_name,
+            "index_type": record.index_type,
+            "index_size": pretty_size(record.index_size_bytes),
+            "index_size_bytes": record.index_size_bytes,
+            "reclaimable_bytes": record.index_size_bytes,
+            "category": category,
+            "index_oid": record.index_oid,
+            "report_only": record.is_partitioned or (category != "Bloated" and record.parent_index_oid is not None),
+        }
+
+    def _redundant_result(self, record, covering):
+        """Builds the result dictionary of an unused redundant index, naming the index covering it."""
+        redundant_index = self._index_result(record, "Unused&Redundant Index")
+        redundant_index["redundant_to"] = covering.index_name
+        return redundant_index
+
     def get_unused_and_invalid_indexes(self):
         """Retrieves a list of unused, invalid, and duplicate indexes in the database."""
         self._check_version_supported()
-        try:
-            conn = self.connect()
-
-            with conn.cursor() as cur:
-                final_result = []
-                cur.execute(SqlQueries.find_unused_redundant_indexes())
-                unused_redundant_result = cur.fetchall()
-                for row in unused_redundant_result:
-                    cur.execute(SqlQueries.get_index_type_by_indexname(row[2]))
-                    index_type=cur.fetchone()[1]
-                    final_result.append(
-                        {
-                            "database_name": self.dbname,
-                            "schema_name": row[0],
-                            "index_name": row[2],
-                            "index_type": index_type,
-                            "index_size": row[4],
-                            "category": "Unused&Redundant Index",
-                        }
-                    )
-
-                cur.execute(SqlQueries.find_invalid_indexes())
-                invalid_result = cur.fetchall()
-                for row in invalid_result:
-                    cur.execute(SqlQueries.get_index_type_by_indexname(row[2]))
-                    index_type=cur.fetchone()[1]
-                    final_result.append(
-                        {
-                            "database_name": self.dbname,
-                            "schema_name": row[0],
-                            "index_name": row[2],
-                            "index_type": index_type,
-                            "index_size": row[4],
-                            "category": "Invalid Index",
-                        }
-                    )
-                if len(final_result) == 0:
-                    return []
-                return final_result
-
-        except Exception as e:
-            print(f"No Result, Failed due to: {e}")
-        finally:
-            self.close()
+        return list(self.iter_index_results(("redundant", "invalid"), streaming=False))
 
     def get_bloated_indexes(self, bloat_threshold):
         """Returns indxes which have bloat ratio is greater than bloat_threshold."""
         self._check_version_supported()
-        try:
-            conn = self.connect()
-            with conn.cursor() as cur:
-                cur.execute(SqlQueries.calculate_btree_bloat())
-                bloated_indexes = cur.fetchall()
-                bloatedIndexList = []
-                for index in bloated_indexes:
-                    cur.execute(SqlQueries.get_index_type_by_indexname(index[3]))
-                    index_type=cur.fetchone()[1]
-                    indexModel = {
-                        "database_name": index[0],
-                        "schema_name": index[1],
-                        "index_name": index[3],
-                        "index_type": index_type,
-                        "bloat_ratio": float(format(index[9], ".1f")),
-                        "category": "Bloated",
-                    }
-                    if indexModel.get("bloat_ratio") > bloat_threshold:
-                        bloatedIndexList.append(indexModel)
-                return bloatedIndexList
+        return list(self.iter_index_results(("bloat",), bloat_threshold, streaming=False))
 
-        except Exception as e:
-            print(f"No Result, Failed due to: {e}")
-        finally:
-            self.close()
+    def measure_bloated_indexes(self, bloat_threshold, workers=2, time_budget=300, io_budget=None,
+                                max_candidates=DEFAULT_MAX_CANDIDATES):
+        """
+        Measures the bloat of the top estimated btree indexes exactly with pgstatindex, within a time and I/O budget.
+
+        At most max_candidates indexes with a positive estimated bloat are measured.
+
+        Returns:
+            tuple: (bloated index list, ExactBloatMeasurer holding the budget usage). Indexes
+            that were measured are filtered on their measured bloat, the others on their estimate.
+        """
+        self._check_version_supported()
+        estimates = self.analyzer().btree_bloat_estimates()
+        measurer = ExactBloatMeasurer(self, workers=workers, time_budget=time_budget, io_budget=io_budget,
+                                      max_candidates=max_candidates)
+        measurements = measurer.measure(estimates)
+        bloated_index_list = []
+        for record, bloat_pct, bloat_bytes in estimates:
+            measurement = measurements.get(record.index_oid)
+            bloat_ratio = measurement.bloat_pct if measurement is not None else bloat_pct
+            if bloat_ratio > bloat_threshold:
+                indexModel = self._index_result(record, "Bloated")
+                indexModel["bloat_ratio"] = float(format(bloat_ratio, ".1f"))
+                indexModel["reclaimable_bytes"] = int(
+                    measurement.bloat_bytes if measurement is not None else bloat_bytes)
+                indexModel["estimated_bloat_ratio"] = float(format(bloat_pct, ".1f"))
+                indexModel["measured_bloat_ratio"] = (
+                    float(format(measurement.bloat_pct, ".1f")) if measurement is not None else None
+                )
+                bloated_index_list.append(indexModel)
+        return bloated_index_list, measurer
+
+    def fetch_inefficient_indexes(self, bloat_threshold):
+        """Retrieves indexes of every category from a single snapshot. Errors are raised, not printed."""
+        return list(self.iter_index_results(
+            ("redundant", "invalid", "duplicate_unique", "duplicate", "bloat"), bloat_threshold, streaming=False
+        ))
 
     def fetch_invalid_indexes(self):
         """Identifies invalid indexes that may need to be cleaned or rebuilt."""
-        self._check_version_supported()
-        database_connection = self.connect()
-        with database_connection.cursor() as database_cursor:
-            database_cursor.execute(SqlQueries.find_invalid_indexes())
-            invalid_indexes = database_cursor.fetchall()
-            invalid_index_list = []
-            for index in invalid_indexes:
-                database_cursor.execute(SqlQueries.get_index_type_by_indexname(index[2]))
-                index_type=database_cursor.fetchone()[1]
-                invalid_index_dict = {
-                    "database_name": self.dbname,
-                    "schema_name": index[0],
-                    "index_name": index[2],
-                    "index_type": index_type,
-                    "index_size": index[4],
-                    "category": "Invalid Index.",
-                }
-                invalid_index_list.append(invalid_index_dict)
-
-        return invalid_index_list
+        return list(self.iter_index_results(("invalid",), streaming=False))
 
     def fetch_unused_indexes(self):
         """Retrieves indexes that have not been used in over a specified timeframe."""
-        self._check_version_supported()
-        database_connection = self.connect()
-        with database_connection.cursor() as database_cursor:
-            database_cursor.execute(SqlQueries.find_unused_indexes())
-            old_indexes = database_cursor.fetchall()
-            old_index_list = []
-            for index in old_indexes:
-                database_cursor.execute(SqlQueries.get_index_type_by_indexname(index[2]))
-                index_type=database_cursor.fetchone()[1]
-                old_index_dict = {
-                    "database_name": self.dbname,
-                    "schema_name": index[0],
-                    "index_name": index[2],
-                    "index_type": index_type,
-                    "index_size": index[4],
-                    "index_scan": index[3],
-                    "category": "Unused Index",
-                }
-                old_index_list.append(old_index_dict)
-        return old_index_list
+        return list(self.iter_index_results(("unused",), streaming=False))
+
+    def _duplicate_result(self, record, winner, category):
+        """Builds the result dictionary of a duplicate index, naming the index it duplicates."""
+        duplicate_index = self._index_result(record, category)
+        duplicate_index["duplicate_of"] = winner.index_name
+        return duplicate_index
 
     def fetch_duplicate_unique_indexes(self):
         """Retrieves unique indexes have being duplicated"""
-        self._check_version_supported()
-        database_connection = self.connect()
-        current_indexes = set()
-        duplicate_unique_indexes = []
-        with database_connection.cursor() as database_cursor:
-            database_cursor.execute(SqlQueries.find_duplicate_constraints())
-            unique_indexes = database_cursor.fetchall()
-            for index in unique_indexes:
-                index_columns = str(index[3]).split(' ')[8]
-                schema_name = index[0]
-                table_name = index[1]
-                index_record = (schema_name, table_name, index_columns)
-                if index_record in current_indexes:
-                    # if index record has been found in current_indexes list append index to duplicate_unique_indexes list.
-                    database_cursor.execute(SqlQueries.get_index_type_by_indexname(index[2]))
-                    index_type=database_cursor.fetchone()[1]
-                    index=index+(index_type,)
-                    duplicate_unique_indexes.append(index)
-                else:
-                    # if index record has not been found in current indexes add index_record to current_indexes list to
-                    # compare later.
-                    current_indexes.add(index_record)
-        return duplicate_unique_indexes
+        return list(self.iter_index_results(("duplicate_unique",), streaming=False))
 
     def fetch_duplicate_indexes(self):
-        """Retrieves btree indexes have being duplicated"""
-        self._check_version_supported()
+        """Retrieves non-unique indexes have being duplicated"""
+        return list(self.iter_index_results(("duplicate",), streaming=False))
+
+    def get_remediation_sizes(self, index_oids):
+        """Returns index oid to the ActionSizes of every existing index in index_oids, using a single query."""
         database_connection = self.connect()
-        current_indexes = set()
-        duplicate_unique_indexes = []
         with database_connection.cursor() as database_cursor:
-            database_cursor.execute(SqlQueries.find_duplicate_btrees())
-            unique_indexes = database_cursor.fetchall()
-            for index in unique_indexes:
-                index_columns = str(index[3]).split(' ')[7]
-                schema_name = index[0]
-                table_name = index[1]
-                index_record = (schema_name, table_name, index_columns)
-                #print(index_record)
-                if index_record in current_indexes:
-                    # if index record has been found in current_indexes list append index to duplicate_unique_indexes list.
-                    database_cursor.execute(SqlQueries.get_index_type_by_indexname(index[2]))
-                    index_type=database_cursor.fetchone()[1]
-                    index=index+(index_type,)
-                    duplicate_unique_indexes.append(index)
-                else:
-                    # if index record has not been found in current indexes add index_record to current_indexes list to
-                    # compare later.
-                    current_indexes.add(index_record)
-        return duplicate_unique_indexes
-        
-    def get_index_create_statement(self,schema_name,index_name):
-        """Get Index create statement from pg_indexes view"""
+            database_cursor.execute(SqlQueries.get_remediation_sizes(), (list(index_oids),))
+            return {row[0]: ActionSizes(*row) for row in database_cursor}
+
+    def get_index_create_statements(self, index_oids):
+        """Yields (index oid, CREATE INDEX CONCURRENTLY statement) for every index oid, using a single query."""
         self._check_version_supported()
         database_connection = self.connect()
         with database_connection.cursor() as database_cursor:
-            database_cursor.execute(SqlQueries.get_index_ddl(schema_name,index_name))
-            index_create_ddl_list = database_cursor.fetchone()
-            index_create_definition=str(index_create_ddl_list[0]).split(" ")
-            if "UNIQUE" in index_create_definition:
-                index_create_definition.insert(3,"CONCURRENTLY")
-            else:
-                index_create_definition.insert(2,"CONCURRENTLY")
-
-            index_definition_to_be_suggested = " ".join(index_create_definition)
-        return index_definition_to_be_suggested
\ No newline at end of file
+            database_cursor.execute(SqlQueries.get_index_ddl_by_oids(), (list(index_oids),))
+            for index_oid, index_definition in database_cursor:
+                yield index_oid, add_concurrently(index_definition)
@@ -0,0 +1,189 @@
+import json
+import os
+import random
+import threading
+import time
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2
+import psycopg2.errors
+from .costs import statement_operation
+from .queries import SqlQueries
+from .utils import REMEDIATION_STATEMENT
+
+RemediationTask = namedtuple("RemediationTask", ["table", "statement", "index_oid"])
+RemediationTask.__new__.__defaults__ = (None,)
+StatementResult = namedtuple("StatementResult", ["table", "statement", "status", "attempts", "duration", "error"])
+
+
+class RemediationExecutor:
+    """
+    Runs DROP INDEX CONCURRENTLY and REINDEX INDEX CONCURRENTLY statements as one unattended job.
+
+    Tables are worked on in parallel, up to workers at a time, while the statements of one
+    table run one after the other, since concurrent index builds and drops on the same table
+    wait for each other anyway. A statement failing on lock_timeout is retried with an
+    exponential backoff. Every finished statement is appended to the checkpoint file, and a
+    job started again with the same checkpoint skips the statements already done.
+
+    With a ReplicationThrottle, a statement only starts when the throttle allows one more
+    to run, so the job pauses or slows down while the standbys fall behind.
+
+    A REINDEX INDEX CONCURRENTLY failing on lock_timeout after its build started leaves an
+    invalid <index>_ccnew index behind, and every retry would add another one. When the task
+    carries the oid of its index, the invalid _ccnew indexes the failed attempt left on the
+    table are dropped with DROP INDEX CONCURRENTLY before the statement is retried. Builds
+    interrupted otherwise still leave one, which list-invalid-indexes reports.
+
+    Attributes:
+        workers (int): Number of tables worked on concurrently.
+        max_retries (int): Retries of a statement failing on lock_timeout.
+        checkpoint_path (str): JSON lines file of finished statements, or None.
+        results (list): StatementResult of every statement of the last run.
+    """
+
+    def __init__(self, manager, workers=2, max_retries=5, backoff=2.0, max_backoff=60.0, checkpoint_path=None,
+                 on_result=None, throttle=None):
+        self.manager = manager
+        self.workers = max(1, workers)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.checkpoint_path = checkpoint_path
+        self.on_result = on_result
+        self.throttle = throttle
+        self.results = []
+        self._lock = threading.Lock()
+
+    def completed_statements(self):
+        """Returns the statements the checkpoint file records as done."""
+        completed = set()
+        if self.checkpoint_path is None or not os.path.exists(self.checkpoint_path):
+            return completed
+        with open(self.checkpoint_path, 'r') as checkpoint:
+            for line in checkpoint:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("status") == "done":
+                    completed.add(entry["statement"])
+        return completed
+
+    def _record(self, result):
+        """Keeps the result, appends it to the checkpoint file and reports it."""
+        with self._lock:
+            self.results.append(result)
+            if self.checkpoint_path is not None and result.status in ("done", "failed"):
+                with open(self.checkpoint_path, 'a') as checkpoint:
+                    checkpoint.write(json.dumps(result._asdict()) + "\n")
+                    checkpoint.flush()
+                    os.fsync(checkpoint.fileno())
+            if self.on_result is not None:
+                self.on_result(result)
+
+    def run(self, tasks):
+        """
+        Runs the statements of the RemediationTasks and returns their StatementResults.
+
+        Statements that are not a single concurrent drop or rebuild of one index, with
+        nothing after its semicolon, are rejected without being run, and statements the
+        checkpoint records as done are skipped.
+        """
+        self.results = []
+        completed = self.completed_statements()
+        tables = OrderedDict()
+        for task in tasks:
+            if not REMEDIATION_STATEMENT.match(task.statement.strip()):
+                self._record(StatementResult(task.table, task.statement, "rejected", 0, 0.0,
+                                             "Only a single DROP INDEX CONCURRENTLY or REINDEX INDEX CONCURRENTLY is run."))
+            elif task.statement in completed:
+                self._record(StatementResult(task.table, task.statement, "skipped", 0, 0.0, None))
+            else:
+                tables.setdefault(task.table, []).append(task)
+        if self.throttle is not None:
+            self.throttle.start(self.workers)
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                list(executor.map(lambda table: self._run_table(table, tables[table]), tables))
+        finally:
+            if self.throttle is not None:
+                self.throttle.stop()
+        return self.results
+
+    def _run_table(self, table, tasks):
+        """Runs the statements of the tasks of one table in order on one pooled connection."""
+        try:
+            with self.manager.pooled_connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute("SET statement_timeout = 0")
+                try:
+                    for task in tasks:
+                        if self.throttle is not None:
+                            with self.throttle.slot():
+                                result = self._run_statement(connection, task)
+                        else:
+                            result = self._run_statement(connection, task)
+                        self._record(result)
+                finally:
+                    with connection.cursor() as cursor:
+                        cursor.execute("RESET statement_timeout")
+        except Exception as e:
+            with self._lock:
+                finished = {result.statement for result in self.results}
+            for task in tasks:
+                if task.statement not in finished:
+                    self._record(StatementResult(table, task.statement, "failed", 0, 0.0, str(e)))
+
+    def _run_statement(self, connection, task):
+        """Runs the statement of one task, retrying it with an exponential backoff while it fails on lock_timeout."""
+        table, statement = task.table, task.statement
+        reindex = task.index_oid is not None and statement_operation(statement) == "REINDEX"
+        attempts = 0
+        started = time.monotonic()
+        while True:
+            attempts += 1
+            previous_builds = self._invalid_builds(connection, task) if reindex else {}
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(statement)
+                return StatementResult(table, statement, "done", attempts, time.monotonic() - started, None)
+            except psycopg2.errors.LockNotAvailable as e:
+                if reindex:
+                    self._drop_leftover_builds(connection, task, previous_builds)
+                if attempts > self.max_retries:
+                    return StatementResult(table, statement, "failed", attempts, time.monotonic() - started, str(e))
+                delay = min(self.max_backoff, self.backoff * 2 ** (attempts - 1))
+                self.manager.logger.info(f"Lock timeout on attempt {attempts} of {statement}, retrying in {delay:.0f}s.")
+                time.sleep(delay * random.uniform(0.5, 1.0))
+            except psycopg2.Error as e:
+                return StatementResult(table, statement, "failed", attempts, time.monotonic() - started, str(e))
+
+    @staticmethod
+    def _invalid_builds(connection, task):
+        """Returns index oid to DROP INDEX CONCURRENTLY statement of every invalid _ccnew index on the table of the task."""
+        with connection.cursor() as cursor:
+            cursor.execute(SqlQueries.get_invalid_reindex_builds(), (task.index_oid,))
+            return dict(cursor.fetchall())
+
+    def _drop_leftover_builds(self, connection, task, previous_builds):
+        """
+        Drops the invalid _ccnew indexes a failed REINDEX INDEX CONCURRENTLY left on the table.
+
+        Indexes that were already invalid before the attempt are left alone. A drop that fails
+        is logged, and its index stays for list-invalid-indexes to report.
+        """
+        try:
+            leftover_builds = self._invalid_builds(connection, task)
+        except psycopg2.Error as e:
+            self.manager.logger.warning(f"Leftover builds of {task.statement} could not be listed: {e}")
+            return
+        for index_oid, drop_statement in leftover_builds.items():
+            if index_oid in previous_builds:
+                continue
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(drop_statement)
+                self.manager.logger.info(f"Dropped the leftover build of {task.statement}: {drop_statement}")
+            except psycopg2.Error as e:
+                self.manager.logger.warning(f"Leftover build of {task.statement} could not be dropped: {e}")
@@ -0,0 +1,129 @@
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .database import DatabaseManager
+
+
+class FleetScanner:
+    """
+    Scans many configured databases concurrently and merges their results into one report.
+
+    Databases are dispatched to a bounded worker pool while never running more than
+    per_host_limit scans against the same host and port at once. Every scan has its own
+    timeout: the running statement is cancelled when it expires, and the scan stops at the
+    next of its phases, connecting, reading the catalog snapshot and evaluating the rules,
+    so a scan finishing past its timeout is reported as timed out. Connections opened by a
+    phase get the time left of the scan as their connect_timeout, so a host that does not
+    answer cannot hold a scan past its timeout either. A failing database only marks its
+    own entry as failed.
+
+    Attributes:
+        configs (list): Database configuration entries to scan.
+        max_workers (int): Maximum number of databases scanned at the same time.
+        per_host_limit (int): Maximum number of concurrent scans against one host.
+        timeout (int): Seconds a single database scan may take before it is cancelled.
+        bloat_threshold (int): Bloat percentage above which btree indexes are reported.
+    """
+
+    def __init__(self, configs, max_workers=8, per_host_limit=2, timeout=300, bloat_threshold=50):
+        self.configs = configs
+        self.max_workers = max(1, max_workers)
+        self.per_host_limit = max(1, per_host_limit)
+        self.timeout = timeout
+        self.bloat_threshold = bloat_threshold
+
+    @staticmethod
+    def host_key(config):
+        """Returns the host and port a database configuration points at."""
+        return config.get("host", "localhost"), str(config.get("port", "5432"))
+
+    def scan(self):
+        """Scans every configured database and returns one result entry per database, in configuration order."""
+        pending = OrderedDict()
+        for config in self.configs:
+            pending.setdefault(self.host_key(config), deque()).append(config)
+        running_per_host = dict.fromkeys(pending, 0)
+        results = {}
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or in_flight:
+                for host in list(pending):
+                    while (pending[host] and running_per_host[host] < self.per_host_limit
+                           and len(in_flight) < self.max_workers):
+                        config = pending[host].popleft()
+                        in_flight[executor.submit(self._scan_database, config)] = (host, config)
+                        running_per_host[host] += 1
+                    if not pending[host]:
+                        del pending[host]
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    host, config = in_flight.pop(future)
+                    running_per_host[host] -= 1
+                    results[id(config)] = future.result()
+        return [results[id(config)] for config in self.configs]
+
+    def _scan_database(self, config):
+        """Scans a single database, turning any failure or timeout into a failed result entry."""
+        host, port = self.host_key(config)
+        result = {
+            "name": config.get("name"),
+            "host": host,
+            "port": port,
+            "dbname": config.get("dbname"),
+            "status": "ok",
+            "error": None,
+            "elapsed": 0.0,
+            "indexes": [],
+        }
+        started = time.monotonic()
+        timed_out = threading.Event()
+        managers = []
+
+        def cancel_scan():
+            timed_out.set()
+            for manager in managers:
+                manager.cancel()
+
+        def check_timeout():
+            if timed_out.is_set():
+                raise TimeoutError(f"Scan exceeded {self.timeout}s timeout.")
+
+        def limit_connect_timeout(manager):
+            # libpq treats a connect_timeout below 2 seconds as 2 seconds.
+            remaining = max(2, math.ceil(self.timeout - (time.monotonic() - started)))
+            connect_timeout = min(config.get("connect_timeout", DatabaseManager.DEFAULT_CONNECT_TIMEOUT), remaining)
+            if manager.pool is None:
+                manager.config["connect_timeout"] = connect_timeout
+            else:
+                manager.pool.connect_kwargs["connect_timeout"] = connect_timeout
+
+        timer = threading.Timer(self.timeout, cancel_scan)
+        timer.daemon = True
+        timer.start()
+        try:
+            manager = DatabaseManager(config=dict(config))
+            managers.append(manager)
+            check_timeout()
+            limit_connect_timeout(manager)
+            manager.collect_facts()
+            check_timeout()
+            limit_connect_timeout(manager)
+            manager.snapshot()
+            check_timeout()
+            limit_connect_timeout(manager)
+            indexes = manager.fetch_inefficient_indexes(self.bloat_threshold)
+            check_timeout()
+            result["indexes"] = indexes
+            result["replica_node_exists"] = manager.replica_node_exists
+            result["recovery_status"] = manager.recovery_status
+        except Exception as e:
+            result["status"] = "timeout" if timed_out.is_set() else "failed"
+            result["error"] = f"Scan exceeded {self.timeout}s timeout." if timed_out.is_set() else str(e)
+        finally:
+            timer.cancel()
+            for manager in managers:
+                manager.close()
+            result["elapsed"] = time.monotonic() - started
+        return result
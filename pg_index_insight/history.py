@@ -0,0 +1,177 @@
+import os
+import re
+import sqlite3
+import time
+
+HISTORY_FORMAT_VERSION = 1
+HOUR = 3600
+DAY = 86400
+
+
+class UsageHistory:
+    """
+    A local SQLite store of index scan samples, used to tell how often an index was scanned over a time window.
+
+    pg_stat_user_indexes.idx_scan counts scans since the last statistics reset, so it is
+    sampled periodically and only the increase between two samples is stored, in hourly
+    buckets. A counter lower than in the previous sample, or a new stats_reset time of the
+    database, marks a reset, after which the counter itself is the increase. Buckets
+    without scans are not stored, and hourly buckets are merged into daily ones once they
+    are older than hourly_retention_days, so a year of hourly samples of an unused index
+    costs a single row of counters.
+
+    Attributes:
+        path (str): History file location.
+        resets_detected (int): Statistics resets detected while recording during this run.
+    """
+
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS metadata (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )""",
+        """CREATE TABLE IF NOT EXISTS index_counters (
+            index_oid INTEGER PRIMARY KEY,
+            index_scans INTEGER NOT NULL,
+            first_sampled_at INTEGER NOT NULL,
+            last_sampled_at INTEGER NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS index_usage (
+            index_oid INTEGER NOT NULL,
+            bucket_start INTEGER NOT NULL,
+            resolution INTEGER NOT NULL,
+            scans INTEGER NOT NULL,
+            PRIMARY KEY (index_oid, bucket_start, resolution)
+        ) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS stats_resets (
+            detected_at INTEGER PRIMARY KEY,
+            reason TEXT NOT NULL
+        )""",
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self.resets_detected = 0
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            for statement in self.SCHEMA:
+                self.connection.execute(statement)
+            self.connection.execute("INSERT OR IGNORE INTO metadata VALUES ('version', ?)",
+                                    (str(HISTORY_FORMAT_VERSION),))
+
+    @classmethod
+    def for_database(cls, history_dir, config):
+        """Opens the history file of a configured database inside history_dir."""
+        os.makedirs(history_dir, exist_ok=True)
+        name = f'{config.get("host", "localhost")}_{config.get("port", "5432")}_{config.get("dbname")}'
+        return cls(os.path.join(history_dir, re.sub(r'[^A-Za-z0-9_.-]', '_', name) + '.sqlite'))
+
+    def _metadata(self, key):
+        row = self.connection.execute("SELECT value FROM metadata WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def record(self, samples, stats_reset=None, sampled_at=None):
+        """
+        Stores one sample of every index.
+
+        Parameters:
+            samples (iterable): (index oid, cumulative idx_scan) pairs.
+            stats_reset (datetime): stats_reset of the database when sampled.
+            sampled_at (int): Sample time in epoch seconds, defaults to now.
+
+        Returns:
+            int: Number of indexes sampled.
+        """
+        sampled_at = int(sampled_at if sampled_at is not None else time.time())
+        bucket_start = sampled_at // HOUR * HOUR
+        stats_reset = stats_reset.isoformat() if stats_reset is not None else None
+        previous_stats_reset = self._metadata("stats_reset")
+        database_reset = previous_stats_reset is not None and stats_reset != previous_stats_reset
+        counters = dict(self.connection.execute("SELECT index_oid, index_scans FROM index_counters"))
+        sample_count = 0
+        counter_resets = 0
+        with self.connection:
+            for index_oid, index_scans in samples:
+                sample_count += 1
+                previous_scans = counters.pop(index_oid, None)
+                if previous_scans is None:
+                    self.connection.execute("INSERT INTO index_counters VALUES (?, ?, ?, ?)",
+                                            (index_oid, index_scans, sampled_at, sampled_at))
+                    continue
+                if database_reset or index_scans < previous_scans:
+                    counter_resets += index_scans < previous_scans
+                    scans = index_scans
+                else:
+                    scans = index_scans - previous_scans
+                self.connection.execute(
+                    "UPDATE index_counters SET index_scans = ?, last_sampled_at = ? WHERE index_oid = ?",
+                    (index_scans, sampled_at, index_oid))
+                if scans > 0:
+                    self._add_scans(index_oid, bucket_start, HOUR, scans)
+            self.connection.executemany("DELETE FROM index_counters WHERE index_oid = ?",
+                                        ((index_oid,) for index_oid in counters))
+            if database_reset or counter_resets:
+                reason = "stats_reset changed" if database_reset else f"{counter_resets} counter(s) decreased"
+                self.connection.execute("INSERT OR REPLACE INTO stats_resets VALUES (?, ?)", (sampled_at, reason))
+                self.resets_detected += 1
+            self.connection.execute("INSERT OR REPLACE INTO metadata VALUES ('stats_reset', ?)", (stats_reset,))
+        return sample_count
+
+    def _add_scans(self, index_oid, bucket_start, resolution, scans):
+        updated = self.connection.execute(
+            "UPDATE index_usage SET scans = scans + ? WHERE index_oid = ? AND bucket_start = ? AND resolution = ?",
+            (scans, index_oid, bucket_start, resolution))
+        if updated.rowcount == 0:
+            self.connection.execute("INSERT INTO index_usage VALUES (?, ?, ?, ?)",
+                                    (index_oid, bucket_start, resolution, scans))
+
+    def compact(self, hourly_retention_days=7, retention_days=400, now=None):
+        """
+        Merges hourly buckets older than hourly_retention_days into daily buckets and drops buckets
+        older than retention_days.
+
+        Returns:
+            tuple: (hourly buckets merged, buckets dropped).
+        """
+        now = int(now if now is not None else time.time())
+        downsample_before = (now - hourly_retention_days * DAY) // DAY * DAY
+        with self.connection:
+            daily_usage = self.connection.execute(
+                """SELECT index_oid, bucket_start / ? * ?, sum(scans)
+                   FROM index_usage
+                   WHERE resolution = ? AND bucket_start < ?
+                   GROUP BY index_oid, bucket_start / ?""",
+                (DAY, DAY, HOUR, downsample_before, DAY)).fetchall()
+            for index_oid, bucket_start, scans in daily_usage:
+                self._add_scans(index_oid, bucket_start, DAY, scans)
+            merged = self.connection.execute(
+                "DELETE FROM index_usage WHERE resolution = ? AND bucket_start < ?",
+                (HOUR, downsample_before)).rowcount
+            dropped = self.connection.execute(
+                "DELETE FROM index_usage WHERE bucket_start < ?", (now - retention_days * DAY,)).rowcount
+            self.connection.execute("DELETE FROM stats_resets WHERE detected_at < ?", (now - retention_days * DAY,))
+        return merged, dropped
+
+    def unused_index_oids(self, window_days, now=None):
+        """
+        Returns the oids of indexes that were sampled for the whole window and not scanned in it.
+
+        Indexes first sampled after the window started are left out, since the history
+        cannot tell whether they were scanned before that.
+        """
+        now = int(now if now is not None else time.time())
+        window_start = now - window_days * DAY
+        rows = self.connection.execute(
+            """SELECT c.index_oid
+               FROM index_counters AS c
+               WHERE c.first_sampled_at <= ?
+                 AND NOT EXISTS (
+                     SELECT 1 FROM index_usage AS u
+                     WHERE u.index_oid = c.index_oid AND u.bucket_start + u.resolution > ?
+                 )""",
+            (window_start, window_start))
+        return {row[0] for row in rows}
+
+    def close(self):
+        """Closes the history file."""
+        self.connection.close()
@@ -0,0 +1,145 @@
+import math
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.extensions import quote_ident
+from .queries import SqlQueries
+
+DEFAULT_MAX_CANDIDATES = 50
+
+BloatMeasurement = namedtuple("BloatMeasurement", ["bloat_pct", "bloat_bytes", "leaf_density", "bytes_read"])
+
+
+def measured_btree_bloat(index_stats, fillfactor, block_size):
+    """
+    Derives the bloat of a btree index from its pgstatindex page statistics.
+
+    The live leaf tuples are repacked at the index fillfactor, and everything beyond those
+    leaf pages, the internal pages and the metapage counts as bloat, including empty and
+    deleted pages.
+
+    Returns:
+        BloatMeasurement: The measured bloat, or None for an index without leaf pages.
+    """
+    index_size, internal_pages, leaf_pages, empty_pages, deleted_pages, leaf_density = index_stats
+    index_pages = index_size // block_size
+    if index_pages <= 0 or leaf_pages <= 0 or leaf_density is None or math.isnan(leaf_density):
+        return None
+    packed_leaf_pages = math.ceil(leaf_pages * leaf_density / fillfactor)
+    expected_pages = 1 + internal_pages + packed_leaf_pages
+    bloat_pct = 100 * (index_pages - expected_pages) / index_pages
+    bloat_bytes = max(index_pages - expected_pages, 0) * block_size
+    return BloatMeasurement(bloat_pct, bloat_bytes, leaf_density, index_size)
+
+
+class ExactBloatMeasurer:
+    """
+    Measures btree bloat exactly with pgstattuple's pgstatindex on a bounded set of candidates.
+
+    pgstatindex reads every page of the index, so only indexes with a positive estimated
+    bloat are candidates. They are ranked by estimated bloat in bytes and index size, and
+    at most max_candidates of them fitting the I/O budget are measured, on a few pooled
+    connections in parallel. Measurements still running when the time budget runs out
+    are cancelled.
+
+    Attributes:
+        workers (int): Number of indexes measured concurrently.
+        time_budget (float): Seconds all measurements together may take.
+        io_budget (int): Maximum number of index bytes read, or None for no limit.
+        max_candidates (int): Maximum number of indexes measured.
+        measured (int): Number of indexes measured.
+        skipped (int): Number of ranked candidates not measured because of a budget.
+        bytes_read (int): Index bytes read by the measurements.
+        elapsed (float): Seconds spent measuring.
+    """
+
+    EXTENSION_NAME = "pgstattuple"
+
+    def __init__(self, manager, workers=2, time_budget=300, io_budget=None, max_candidates=DEFAULT_MAX_CANDIDATES):
+        self.manager = manager
+        self.workers = max(1, workers)
+        self.time_budget = time_budget
+        self.io_budget = io_budget
+        self.max_candidates = max(0, max_candidates)
+        self.measured = 0
+        self.skipped = 0
+        self.failed = 0
+        self.bytes_read = 0
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def _extension_schema(self):
+        """Returns the quoted schema pgstattuple is installed in, raising when it is not installed."""
+        connection = self.manager.connect()
+        with connection.cursor() as cursor:
+            cursor.execute(SqlQueries.get_extension_schema(), (self.EXTENSION_NAME,))
+            row = cursor.fetchone()
+        if row is None:
+            raise ValueError(f"The {self.EXTENSION_NAME} extension is required to measure bloat. "
+                             f"Run CREATE EXTENSION {self.EXTENSION_NAME}; on the database first.")
+        return quote_ident(row[0], connection)
+
+    def select_candidates(self, estimates):
+        """
+        Ranks (record, bloat_pct, bloat_bytes) estimates with a positive estimated bloat and keeps
+        up to max_candidates of them fitting the I/O budget.
+        """
+        ranked = sorted((estimate for estimate in estimates if estimate[2] > 0),
+                        key=lambda estimate: (estimate[2], estimate[0].index_size_bytes), reverse=True)
+        selected = []
+        planned_bytes = 0
+        for estimate in ranked:
+            size = estimate[0].index_size_bytes
+            if (len(selected) >= self.max_candidates
+                    or self.io_budget is not None and planned_bytes + size > self.io_budget):
+                self.skipped += 1
+                continue
+            planned_bytes += size
+            selected.append(estimate)
+        return selected
+
+    def measure(self, estimates):
+        """Measures the selected candidates and returns a map of index oid to BloatMeasurement."""
+        extension_schema = self._extension_schema()
+        candidates = self.select_candidates(estimates)
+        block_size = self.manager.snapshot().block_size
+        deadline = time.monotonic() + self.time_budget
+        started = time.monotonic()
+        measurements = {}
+
+        def measure_index(estimate):
+            record = estimate[0]
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                with self._lock:
+                    self.skipped += 1
+                return
+            try:
+                with self.manager.pooled_connection() as connection:
+                    with connection.cursor() as cursor:
+                        cursor.execute("SET statement_timeout = %s", (max(1, int(remaining * 1000)),))
+                        try:
+                            cursor.execute(SqlQueries.measure_btree_index(extension_schema), (record.index_oid,))
+                            index_stats = cursor.fetchone()
+                        finally:
+                            cursor.execute("RESET statement_timeout")
+            except Exception as e:
+                self.manager.logger.warning(f"Failed to measure {record.schema_name}.{record.index_name}: {e}")
+                with self._lock:
+                    if time.monotonic() >= deadline:
+                        self.skipped += 1
+                    else:
+                        self.failed += 1
+                return
+            measurement = measured_btree_bloat(index_stats, record.fillfactor, block_size)
+            with self._lock:
+                self.measured += 1
+                self.bytes_read += index_stats[0]
+                if measurement is not None:
+                    measurements[record.index_oid] = measurement
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(measure_index, candidates))
+        self.elapsed = time.monotonic() - started
+        return measurements
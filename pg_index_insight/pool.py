@@ -0,0 +1,93 @@
+import threading
+from contextlib import contextmanager
+import psycopg2
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of PostgreSQL connections sharing one set of connection parameters.
+
+    Connections are opened lazily, up to max_connections, and handed back to the pool
+    instead of being closed, so a run pays the connect and session setup cost once per
+    concurrently used connection rather than once per query.
+
+    Attributes:
+        max_connections (int): Maximum number of connections checked out at the same time.
+        connections_opened (int): Number of server connections opened over the pool lifetime.
+    """
+
+    def __init__(self, connect_kwargs, max_connections=1, on_connect=None):
+        self.connect_kwargs = connect_kwargs
+        self.max_connections = max(1, max_connections)
+        self.on_connect = on_connect
+        self.connections_opened = 0
+        self._idle = []
+        self._open_connections = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_connections)
+
+    def _open(self):
+        """Opens a new autocommit connection and runs the on_connect hook on it."""
+        connection = psycopg2.connect(**self.connect_kwargs)
+        connection.autocommit = True
+        with self._lock:
+            self.connections_opened += 1
+            self._open_connections.append(connection)
+        if self.on_connect is not None:
+            self.on_connect(connection)
+        return connection
+
+    def getconn(self):
+        """Checks a connection out of the pool, blocking while max_connections are in use."""
+        self._slots.acquire()
+        try:
+            connection = None
+            with self._lock:
+                while self._idle and connection is None:
+                    candidate = self._idle.pop()
+                    if not candidate.closed:
+                        connection = candidate
+            return connection if connection is not None else self._open()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, connection, discard=False):
+        """Returns a connection to the pool, closing it instead when discard is set or it is unusable."""
+        try:
+            unusable = connection.closed or connection.status != psycopg2.extensions.STATUS_READY
+            with self._lock:
+                if discard or unusable:
+                    if connection in self._open_connections:
+                        self._open_connections.remove(connection)
+                    if not connection.closed:
+                        connection.close()
+                else:
+                    self._idle.append(connection)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Context manager borrowing a connection for the duration of the block."""
+        connection = self.getconn()
+        try:
+            yield connection
+        finally:
+            self.putconn(connection)
+
+    def cancel_all(self):
+        """Cancels the statements running on every open connection. Safe to call from another thread."""
+        with self._lock:
+            connections = list(self._open_connections)
+        for connection in connections:
+            if not connection.closed:
+                connection.cancel()
+
+    def closeall(self):
+        """Closes every connection opened by the pool."""
+        with self._lock:
+            connections, self._open_connections, self._idle = self._open_connections, [], []
+        for connection in connections:
+            if not connection.closed:
+                connection.close()
@@ -0,0 +1,260 @@
+import inspect
+import json
+import os
+import threading
+import time
+import psycopg2
+import psycopg2.extensions
+from .queries import SqlQueries
+
+EXPLAINED_QUERIES = ("get_index_catalog", "get_index_column_stats", "get_remediation_sizes")
+
+_current = None
+
+
+class _NoSpan:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def current():
+    """Returns the active Profiler, or None when the run is not profiled."""
+    return _current
+
+
+def span(name, category="phase", **args):
+    """Returns a context manager timing a step of the active Profiler, which does nothing when none is active."""
+    if _current is None:
+        return _NO_SPAN
+    return _current.span(name, category, **args)
+
+
+def _row_bytes(rows):
+    """Approximates the bytes of rows on the wire by the length of their text representation."""
+    return sum(len(str(value)) for row in rows for value in row if value is not None)
+
+
+class _Span:
+    def __init__(self, profiler, name, category, args):
+        self.profiler = profiler
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self.args
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.add_event(self.name, self.category, self.started, time.perf_counter() - self.started,
+                                self.args)
+        return False
+
+
+class Profiler:
+    """
+    Records query and Python step timings of one run and writes them as a Chrome trace.
+
+    Queries are recorded by ProfilingCursor, which the connections of a DatabaseManager
+    use while a profiler is active: wall time, rows and an estimate of the bytes returned,
+    named after the SqlQueries method the statement comes from. Fetches from named
+    server-side cursors are round trips of their own and are recorded separately. Python
+    steps such as tabulation and export are recorded with span.
+
+    The trace file opens in chrome://tracing or https://ui.perfetto.dev.
+
+    Attributes:
+        path (str): Trace file location.
+        explain (bool): Whether EXPLAIN (ANALYZE, BUFFERS) is captured for EXPLAINED_QUERIES.
+        events (list): Complete trace events recorded so far.
+    """
+
+    def __init__(self, path, explain=False):
+        self.path = path
+        self.explain = explain
+        self.events = []
+        self.explained = set()
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._threads = {}
+        self._query_names = None
+
+    def start(self):
+        """Makes this profiler the active one."""
+        global _current
+        _current = self
+        return self
+
+    def stop(self):
+        """Deactivates the profiler and writes the trace file."""
+        global _current
+        if _current is self:
+            _current = None
+        self.write()
+
+    def span(self, name, category="phase", **args):
+        """Returns a context manager recording the time spent in its block. Its value is the mutable event args."""
+        return _Span(self, name, category, args)
+
+    def add_event(self, name, category, started, duration, args=None):
+        """Records a complete event that started at the perf_counter value started and lasted duration seconds."""
+        thread_id = threading.get_ident()
+        with self._lock:
+            if thread_id not in self._threads:
+                self._threads[thread_id] = (len(self._threads) + 1, threading.current_thread().name)
+            self.events.append({
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": (started - self._started) * 1e6,
+                "dur": duration * 1e6,
+                "pid": os.getpid(),
+                "tid": self._threads[thread_id][0],
+                "args": args or {},
+            })
+
+    def query_name(self, query):
+        """Returns the name of the SqlQueries method a statement comes from, or the start of the statement."""
+        if self._query_names is None:
+            query_names = {}
+            for name, method in inspect.getmembers(SqlQueries, inspect.isfunction):
+                parameters = inspect.signature(method).parameters.values()
+                if any(parameter.default is inspect.Parameter.empty for parameter in parameters):
+                    continue
+                query_names[method()] = name
+                for parameter in parameters:
+                    if isinstance(parameter.default, bool):
+                        query_names[method(**{parameter.name: not parameter.default})] = name
+            self._query_names = query_names
+        name = self._query_names.get(query)
+        return name if name is not None else " ".join(query.split())[:60]
+
+    def summary(self):
+        """Returns (name, calls, seconds, rows, bytes) of every query, the slowest in total first."""
+        totals = {}
+        for event in self.events:
+            if event["cat"] not in ("query", "fetch"):
+                continue
+            total = totals.setdefault(event["name"], [0, 0.0, 0, 0])
+            total[0] += 1
+            total[1] += event["dur"] / 1e6
+            total[2] += event["args"].get("rows", 0)
+            total[3] += event["args"].get("bytes", 0)
+        return sorted(((name,) + tuple(total) for name, total in totals.items()), key=lambda entry: entry[2],
+                      reverse=True)
+
+    def write(self):
+        """Writes the recorded events as a Chrome trace JSON file."""
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": thread_name}}
+            for tid, thread_name in self._threads.values()
+        ]
+        with open(self.path, "w") as trace_file:
+            json.dump({"traceEvents": metadata + self.events, "displayTimeUnit": "ms"}, trace_file, default=str)
+
+
+class ProfilingCursor(psycopg2.extensions.cursor):
+    """A cursor recording its statements, and the fetches of named cursors, in the active Profiler."""
+
+    _profile_name = None
+    _profile_args = None
+
+    def execute(self, query, vars=None):
+        profiler = _current
+        if profiler is None:
+            return super().execute(query, vars)
+        self._profile_name = profiler.query_name(query)
+        self._profile_args = {"statement": " ".join(query.split())[:500]}
+        started = time.perf_counter()
+        try:
+            result = super().execute(query, vars)
+        finally:
+            if self.name is None and self.description is not None:
+                self._profile_args.update(rows=self.rowcount, bytes=0)
+            profiler.add_event(self._profile_name, "query", started, time.perf_counter() - started,
+                               self._profile_args)
+        if (profiler.explain and self._profile_name in EXPLAINED_QUERIES
+                and self._profile_name not in profiler.explained):
+            profiler.explained.add(self._profile_name)
+            self._explain(profiler, query, vars)
+        return result
+
+    def _explain(self, profiler, query, vars):
+        """
+        Runs EXPLAIN (ANALYZE, BUFFERS) of a statement on a plain cursor and records its plan.
+
+        The statement runs a second time. Inside a transaction, it runs in a savepoint, so a
+        failing EXPLAIN does not abort the snapshot the statement belongs to.
+        """
+        started = time.perf_counter()
+        in_transaction = not self.connection.autocommit
+        with self.connection.cursor(cursor_factory=psycopg2.extensions.cursor) as cursor:
+            try:
+                if in_transaction:
+                    cursor.execute("SAVEPOINT pgindexinsight_explain")
+                cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query.strip().rstrip(';')}", vars)
+                plan = cursor.fetchone()[0]
+                if in_transaction:
+                    cursor.execute("RELEASE SAVEPOINT pgindexinsight_explain")
+            except psycopg2.Error as e:
+                plan = f"EXPLAIN failed: {e}"
+                if in_transaction:
+                    cursor.execute("ROLLBACK TO SAVEPOINT pgindexinsight_explain")
+        profiler.add_event(f"{self._profile_name} EXPLAIN", "explain", started, time.perf_counter() - started,
+                           {"plan": plan})
+
+    def _fetched(self, started, rows):
+        """Records fetched rows: as a round trip of their own for a named cursor, on the statement otherwise."""
+        profiler = _current
+        if profiler is None or self._profile_args is None:
+            return
+        if self.name is not None:
+            profiler.add_event(f"{self._profile_name} fetch", "fetch", started, time.perf_counter() - started,
+                               {"rows": len(rows), "bytes": _row_bytes(rows)})
+        elif "bytes" in self._profile_args:
+            self._profile_args["bytes"] += _row_bytes(rows)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, [row] if row is not None else [])
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(size if size is not None else self.arraysize)
+        self._fetched(started, rows)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, rows)
+        return rows
+
+    def __iter__(self):
+        if self.name is None:
+            return iter(self.fetchall())
+        return self._iter_named()
+
+    def _iter_named(self):
+        while True:
+            rows = self.fetchmany(self.itersize)
+            if not rows:
+                return
+            for row in rows:
+                yield row
+
+
+class ProfilingConnection(psycopg2.extensions.connection):
+    """A connection whose cursors are ProfilingCursors."""
+
+    def cursor(self, *args, **kwargs):
+        kwargs.setdefault("cursor_factory", ProfilingCursor)
+        return super().cursor(*args, **kwargs)
@@ -1,297 +1,293 @@
 class SqlQueries:
     @staticmethod
-    def find_unused_redundant_indexes():
-        """Returns a query to find unused and redundant indexes."""
+    def get_server_settings():
+        """Returns block size and maximum alignment used by the btree bloat estimate."""
         return """
-        WITH unused_indexes AS (
             SELECT
-                i.relname AS index_name,
-                t.relname AS table_name,
-                pg_size_pretty(pg_relation_size(i.oid)) AS index_size,
-                s.idx_scan AS index_scans
+                current_setting('block_size')::integer AS block_size,
+                CASE WHEN version() ~ 'mingw32' OR version() ~ '64-bit|x86_64|ppc64|ia64|amd64' THEN 8 ELSE 4 END AS max_align;
+    """
+
+    @staticmethod
+    def get_database_facts():
+        """Returns the recovery status, the number of active physical replication slots and the server version."""
+        return """
+            SELECT
+                pg_is_in_recovery() AS recovery_status,
+                (SELECT count(*) FROM pg_replication_slots WHERE slot_type = 'physical' AND active IS true) AS physical_repl_count,
+                version() AS server_version;
+    """
+
+    @staticmethod
+    def get_index_catalog():
+        """
+        Returns catalog, size and usage properties of every user index ordered by table.
+        parent_index_oid is the partitioned index an index of a partition is attached to.
+        """
+        return """
+            SELECT
+                i.indexrelid AS index_oid,
+                i.indrelid AS table_oid,
+                n.nspname AS schema_name,
+                ct.relname AS table_name,
+                ci.relname AS index_name,
+                am.amname AS index_type,
+                i.indisprimary AS is_primary,
+                i.indisunique AS is_unique,
+                i.indisvalid AS is_valid,
+                i.indisready AS is_ready,
+                i.indkey::int2[] AS column_numbers,
+                i.indnkeyatts AS key_column_count,
+                i.indclass::oid[] AS operator_classes,
+                i.indcollation::oid[] AS collations,
+                i.indoption::int2[] AS column_options,
+                pg_get_expr(i.indexprs, i.indrelid) AS expressions,
+                pg_get_expr(i.indpred, i.indrelid) AS predicate,
+                ci.relpages AS relpages,
+                ci.reltuples AS reltuples,
+                coalesce(substring(array_to_string(ci.reloptions, ' ') from 'fillfactor=([0-9]+)')::smallint, 90) AS fillfactor,
+                pg_relation_size(i.indexrelid) AS index_size_bytes,
+                s.idx_scan AS index_scans,
+                ci.relfilenode AS relfilenode,
+                greatest(ts.last_analyze, ts.last_autoanalyze) AS table_last_analyzed,
+                inh.inhparent AS parent_index_oid,
+                ci.relkind = 'I' AS is_partitioned
             FROM
-                pg_stat_user_indexes AS s
+                pg_index AS i
             JOIN
-                pg_index AS idx ON s.indexrelid = idx.indexrelid
+                pg_class AS ci ON ci.oid = i.indexrelid
             JOIN
-                pg_class AS i ON i.oid = s.indexrelid
+                pg_class AS ct ON ct.oid = i.indrelid
             JOIN
-                pg_class AS t ON t.oid = idx.indrelid
+                pg_namespace AS n ON n.oid = ci.relnamespace
+            JOIN
+                pg_am AS am ON am.oid = ci.relam
+            LEFT JOIN
+                pg_stat_user_indexes AS s ON s.indexrelid = i.indexrelid
+            LEFT JOIN
+                pg_stat_user_tables AS ts ON ts.relid = i.indrelid
+            LEFT JOIN
+                pg_inherits AS inh ON inh.inhrelid = i.indexrelid
             WHERE
-                s.idx_scan = 0
-                AND NOT idx.indisprimary
-                AND NOT idx.indisunique
-        ),
-        redundant_indexes AS (
-             SELECT
-            tnsp.nspname AS schema_name,
-            trel.relname AS table_name,
-            irel.relname AS index_name,
-            string_agg(a.attname, ', ' ORDER BY c.ordinality) AS columns
-          FROM pg_index AS i
-          JOIN pg_class AS trel ON trel.oid = i.indrelid
-          JOIN pg_namespace AS tnsp ON trel.relnamespace = tnsp.oid
-          JOIN pg_class AS irel ON irel.oid = i.indexrelid
-          JOIN pg_attribute AS a ON trel.oid = a.attrelid
-          JOIN LATERAL unnest(i.indkey) 
-            WITH ORDINALITY AS c(colnum, ordinality)
-              ON a.attnum = c.colnum
-          GROUP BY i, tnsp.nspname, trel.relname, irel.relname
-        ),
-        redundant_list AS(
-        SELECT
-          i.schema_name AS "schema_name",
-          i.table_name,
-          i.index_name AS "index_name",
-          i.columns AS "columns_list",
-          j.index_name AS "existsing_index",
-          j.columns AS "existing_columns"
-        FROM redundant_indexes i
-        JOIN redundant_indexes j
-          ON i.schema_name = j.schema_name
-          AND i.table_name = j.table_name
-          AND j.columns LIKE i.columns || ',%'
-        )
-        SELECT
-            r.schema_name AS schema_name,
-            u.table_name AS table_name,
-            u.index_name AS index_name,
-            u.index_scans AS index_scans,
-            u.index_size AS index_size
-        FROM
-            unused_indexes u
-        JOIN
-            redundant_list r ON u.index_name = r.index_name;
-        """
+                n.nspname NOT IN ('pg_catalog', 'information_schema')
+                AND n.nspname !~ '^pg_toast'
+            ORDER BY
+                i.indrelid, i.indexrelid;
+    """
 
     @staticmethod
-    def find_unused_indexes():
-        """Returns indexes that never scanned and are not pk or constraint."""
-        return """
+    def get_index_column_stats(filter_by_oids=False, filter_by_table_range=False):
+        """
+        Returns per column width statistics of every non-empty btree index ordered by table.
+        With filter_by_oids, only the indexes in the oid array parameter are returned.
+        With filter_by_table_range, only the indexes of tables whose oid is between the
+        two oid parameters, bounds included, are returned.
+        """
+        oid_filter = "AND i.indexrelid = ANY(%s::oid[])" if filter_by_oids else ""
+        if filter_by_table_range:
+            oid_filter += " AND i.indrelid BETWEEN %s::oid AND %s::oid"
+        return f"""
             SELECT
-                s.schemaname AS schema_name,
-                t.relname AS table_name,
-                i.relname AS index_name,
-                idx_scan AS index_scans,
-                pg_size_pretty(pg_relation_size(i.oid)) AS index_size
+                i.indexrelid AS index_oid,
+                i.indrelid AS table_oid,
+                coalesce(a1.attname, a2.attname) AS attname,
+                coalesce(a1.atttypid, a2.atttypid) = 'pg_catalog.name'::regtype AS is_name_type,
+                coalesce(st.null_frac, 0) AS null_frac,
+                coalesce(st.avg_width, 1024) AS avg_width
             FROM
-                pg_stat_user_indexes AS s
+                pg_index AS i
             JOIN
-                pg_index AS idx ON s.indexrelid = idx.indexrelid
+                pg_class AS ci ON ci.oid = i.indexrelid
             JOIN
-                pg_class AS i ON i.oid = s.indexrelid
+                pg_class AS ct ON ct.oid = i.indrelid
             JOIN
-                pg_class AS t ON t.oid = idx.indrelid
+                pg_namespace AS n ON n.oid = ci.relnamespace
+            CROSS JOIN LATERAL
+                generate_series(1, i.indnatts) AS k(attpos)
+            LEFT JOIN
+                pg_attribute AS a1 ON i.indkey[k.attpos - 1] <> 0 AND a1.attrelid = i.indrelid AND a1.attnum = i.indkey[k.attpos - 1]
+            LEFT JOIN
+                pg_attribute AS a2 ON i.indkey[k.attpos - 1] = 0 AND a2.attrelid = i.indexrelid AND a2.attnum = k.attpos
+            JOIN LATERAL (
+                SELECT
+                    s.null_frac,
+                    s.avg_width
+                FROM
+                    pg_stats AS s
+                WHERE
+                    s.schemaname = n.nspname
+                    AND s.tablename = CASE WHEN a1.attnum IS NULL THEN ci.relname ELSE ct.relname END
+                    AND s.attname = coalesce(a1.attname, a2.attname)
+                ORDER BY
+                    s.inherited
+                LIMIT 1
+            ) AS st ON true
             WHERE
-                s.idx_scan=0
-                AND NOT idx.indisprimary
-                AND NOT idx.indisunique
+                ci.relam = (SELECT oid FROM pg_am WHERE amname = 'btree')
+                AND ci.relpages > 0
+                AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+                AND n.nspname !~ '^pg_toast'
+                {oid_filter}
             ORDER BY
-                idx_scan DESC;
-        """
+                i.indrelid, i.indexrelid, k.attpos;
+    """
 
     @staticmethod
-    def find_invalid_indexes():
-        """Returns a query to list all indexes which scanned over last year"""
+    def get_index_ddl_by_oids():
+        """Returns the create statement of every index in the oid array parameter, in array order."""
         return """
             SELECT
-                s.schemaname AS schema_name,
-                t.relname AS table_name,
-                i.relname AS index_name,
-                idx_scan AS index_scans,
-                pg_size_pretty(pg_relation_size(i.oid)) AS index_size
+                c.index_oid,
+                pg_get_indexdef(c.index_oid) || ';' AS index_definition
             FROM
-                pg_stat_user_indexes AS s
-            JOIN
-                pg_index AS idx ON s.indexrelid = idx.indexrelid
+                unnest(%s::oid[]) WITH ORDINALITY AS c(index_oid, position)
             JOIN
-                pg_class AS i ON i.oid = s.indexrelid
-            JOIN
-                pg_class AS t ON t.oid = idx.indrelid WHERE idx.indisvalid is FALSE;
+                pg_index AS i ON i.indexrelid = c.index_oid
+            ORDER BY
+                c.position;
     """
 
     @staticmethod
-    def calculate_btree_bloat():
+    def get_extension_schema():
+        """Returns the schema an extension, named by the parameter, is installed in."""
         return """
-    SELECT current_database(), 
-       nspname AS schemaname, 
-       tblname, 
-       idxname, 
-       bs * (relpages)::bigint AS real_size,
-       bs * (relpages - est_pages)::bigint AS extra_size,
-       100 * (relpages - est_pages)::float / relpages AS extra_pct,
-       fillfactor,
-       CASE WHEN relpages > est_pages_ff 
-            THEN bs * (relpages - est_pages_ff) 
-            ELSE 0 
-       END AS bloat_size,
-       100 * (relpages - est_pages_ff)::float / relpages AS bloat_pct,
-       is_na
-FROM (
-    SELECT coalesce(1 + ceil(reltuples / floor((bs - pageopqdata - pagehdr) / (4 + nulldatahdrwidth)::float)), 0) AS est_pages,
-           coalesce(1 + ceil(reltuples / floor((bs - pageopqdata - pagehdr) * fillfactor / (100 * (4 + nulldatahdrwidth)::float))), 0) AS est_pages_ff,
-           bs, 
-           nspname, 
-           tblname, 
-           idxname, 
-           relpages, 
-           fillfactor, 
-           is_na
-    FROM (
-        SELECT maxalign, 
-               bs, 
-               nspname, 
-               tblname, 
-               idxname, 
-               reltuples, 
-               relpages, 
-               idxoid, 
-               fillfactor,
-               (index_tuple_hdr_bm + maxalign - CASE WHEN index_tuple_hdr_bm % maxalign = 0 THEN maxalign ELSE index_tuple_hdr_bm % maxalign END + nulldatawidth + maxalign - CASE WHEN nulldatawidth = 0 THEN 0 WHEN nulldatawidth::integer % maxalign = 0 THEN maxalign ELSE nulldatawidth::integer % maxalign END) AS nulldatahdrwidth, 
-               pagehdr, 
-               pageopqdata, 
-               is_na
-        FROM (
-            SELECT n.nspname, 
-                   i.tblname, 
-                   i.idxname, 
-                   i.reltuples, 
-                   i.relpages, 
-                   i.idxoid, 
-                   i.fillfactor,
-                   current_setting('block_size')::numeric AS bs,
-                   CASE WHEN version() ~ 'mingw32' OR version() ~ '64-bit|x86_64|ppc64|ia64|amd64' THEN 8 ELSE 4 END AS maxalign,
-                   24 AS pagehdr,
-                   16 AS pageopqdata,
-                   CASE WHEN max(coalesce(s.null_frac, 0)) = 0 THEN 8 ELSE 8 + ((32 + 8 - 1) / 8) END AS index_tuple_hdr_bm,
-                   sum((1 - coalesce(s.null_frac, 0)) * coalesce(s.avg_width, 1024)) AS nulldatawidth,
-                   max(CASE WHEN i.atttypid = 'pg_catalog.name'::regtype THEN 1 ELSE 0 END) > 0 AS is_na
-            FROM (
-                SELECT ct.relname AS tblname, 
-                       ct.relnamespace, 
-                       ic.idxname, 
-                       ic.attpos, 
-                       ic.indkey, 
-                       ic.indkey[ic.attpos], 
-                       ic.reltuples, 
-                       ic.relpages, 
-                       ic.tbloid, 
-                       ic.idxoid, 
-                       ic.fillfactor,
-                       coalesce(a1.attnum, a2.attnum) AS attnum, 
-                       coalesce(a1.attname, a2.attname) AS attname, 
-                       coalesce(a1.atttypid, a2.atttypid) AS atttypid,
-                       CASE WHEN a1.attnum IS NULL THEN ic.idxname ELSE ct.relname END AS attrelname
-                FROM (
-                    SELECT idxname, 
-                           reltuples, 
-                           relpages, 
-                           tbloid, 
-                           idxoid, 
-                           fillfactor, 
-                           indkey, 
-                           pg_catalog.generate_series(1, indnatts) AS attpos
-                    FROM (
-                        SELECT ci.relname AS idxname, 
-                               ci.reltuples, 
-                               ci.relpages, 
-                               i.indrelid AS tbloid, 
-                               i.indexrelid AS idxoid,
-                               coalesce(substring(array_to_string(ci.reloptions, ' ') from 'fillfactor=([0-9]+)')::smallint, 90) AS fillfactor,
-                               i.indnatts, 
-                               pg_catalog.string_to_array(pg_catalog.textin(pg_catalog.int2vectorout(i.indkey)), ' ')::int[] AS indkey
-                        FROM pg_catalog.pg_index i
-                        JOIN pg_catalog.pg_class ci ON ci.oid = i.indexrelid
-                        WHERE ci.relam = (SELECT oid FROM pg_am WHERE amname = 'btree') 
-                          AND ci.relpages > 0
-                    ) AS idx_data
-                ) AS ic
-                JOIN pg_catalog.pg_class ct ON ct.oid = ic.tbloid
-                LEFT JOIN pg_catalog.pg_attribute a1 ON ic.indkey[ic.attpos] <> 0 AND a1.attrelid = ic.tbloid AND a1.attnum = ic.indkey[ic.attpos]
-                LEFT JOIN pg_catalog.pg_attribute a2 ON ic.indkey[ic.attpos] = 0 AND a2.attrelid = ic.idxoid AND a2.attnum = ic.attpos
-            ) i
-            JOIN pg_catalog.pg_namespace n ON n.oid = i.relnamespace
-            JOIN pg_catalog.pg_stats s ON s.schemaname = n.nspname AND s.tablename = i.attrelname AND s.attname = i.attname
-            WHERE n.nspname NOT IN ('pg_catalog', 'information_schema')
-            GROUP BY 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11
-        ) AS rows_data_stats
-    ) AS rows_hdr_pdg_stats
-) AS relation_stats
-ORDER BY nspname, tblname, idxname;
+            SELECT
+                n.nspname
+            FROM
+                pg_extension AS e
+            JOIN
+                pg_namespace AS n ON n.oid = e.extnamespace
+            WHERE
+                e.extname = %s;
     """
 
+    @staticmethod
+    def measure_btree_index(extension_schema):
+        """Returns the pgstatindex page statistics of the btree index whose oid is the parameter."""
+        return f"""
+            SELECT
+                index_size,
+                internal_pages,
+                leaf_pages,
+                empty_pages,
+                deleted_pages,
+                avg_leaf_density
+            FROM
+                {extension_schema}.pgstatindex(%s::oid::regclass);
+    """
 
     @staticmethod
-    def find_duplicate_constraints():
-        """Returns a list of unique indexes which are valid,ready and unique"""
+    def get_index_usage_sample():
+        """Returns the cumulative scan counter of every user index and the stats reset time of the database."""
         return """
             SELECT
-                ix.schemaname,
-                ix.tablename,
-                ix.indexname,
-                ix.indexdef,
-                pg_size_pretty(pg_relation_size(cs.oid)) AS index_size
+                s.indexrelid AS index_oid,
+                coalesce(s.idx_scan, 0) AS index_scans,
+                d.stats_reset AS stats_reset
             FROM
-                pg_stat_user_indexes co
-                INNER JOIN pg_indexes ix ON co.indexrelname = ix.indexname
-                INNER JOIN pg_index i ON co.indexrelid = i.indexrelid
-                INNER JOIN pg_class AS cs ON cs.oid = co.indexrelid
+                pg_stat_user_indexes AS s
+            CROSS JOIN
+                pg_stat_database AS d
             WHERE
-                i.indisunique = true
-                AND i.indisvalid = true
-                AND i.indisready = true
-            ORDER BY
-                ix.tablename;
+                d.datname = current_database();
     """
-    
+
     @staticmethod
-    def find_duplicate_btrees():
-        """Returns a list of unique indexes which are valid,ready and unique"""
+    def get_index_counters():
+        """Returns the usage and size counters of every user index sampled by the watch mode."""
         return """
             SELECT
-                ix.schemaname,
-                ix.tablename,
-                ix.indexname,
-                ix.indexdef,
-                pg_size_pretty(pg_relation_size(cs.oid)) AS index_size
+                s.indexrelid AS index_oid,
+                s.idx_scan AS index_scans,
+                s.idx_tup_read AS index_tuples_read,
+                c.relpages AS relpages,
+                c.reltuples AS reltuples
             FROM
-                pg_stat_user_indexes co
-                INNER JOIN pg_indexes ix ON co.indexrelname = ix.indexname
-                INNER JOIN pg_index i ON co.indexrelid = i.indexrelid
-                INNER JOIN pg_class AS cs ON cs.oid = co.indexrelid
-            WHERE
-                i.indisunique = false
-                AND i.indisvalid = true
-                AND i.indisready = true
-            ORDER BY
-                ix.tablename;
+                pg_stat_user_indexes AS s
+            JOIN
+                pg_class AS c ON c.oid = s.indexrelid;
     """
 
     @staticmethod
-    def get_index_type_by_indexname(index_name):
-        """Returns a list of unique indexes which are valid,ready and unique"""
-        return f"""
+    def get_catalog_change_marker():
+        """
+        Returns a marker of the index catalog that changes with every DDL on an index or its table.
+
+        The marker is made of the rows inserted, updated and deleted in pg_index and pg_class
+        counted by the statistics system, so it is read in constant time however many indexes
+        the database has. VACUUM and ANALYZE update size statistics in place, which these
+        counters do not count. DDL on relations without indexes, such as temporary tables,
+        moves the marker too. Counters reach the statistics system after a delay of about
+        a second, and stay at zero with track_counts off.
+        """
+        return """
             SELECT
-                c.relname AS index_name,
-                am.amname AS index_type
+                pg_stat_get_tuples_inserted('pg_catalog.pg_index'::regclass) AS index_rows_inserted,
+                pg_stat_get_tuples_updated('pg_catalog.pg_index'::regclass) AS index_rows_updated,
+                pg_stat_get_tuples_deleted('pg_catalog.pg_index'::regclass) AS index_rows_deleted,
+                pg_stat_get_tuples_inserted('pg_catalog.pg_class'::regclass) AS class_rows_inserted,
+                pg_stat_get_tuples_updated('pg_catalog.pg_class'::regclass) AS class_rows_updated,
+                pg_stat_get_tuples_deleted('pg_catalog.pg_class'::regclass) AS class_rows_deleted;
+    """
+
+    @staticmethod
+    def get_replication_status():
+        """Returns the largest standby replay lag in seconds and bytes, the number of standbys and the current WAL position."""
+        return """
+            SELECT
+                coalesce(max(extract(epoch FROM r.replay_lag)), 0) AS max_replay_lag_seconds,
+                coalesce(max(pg_wal_lsn_diff(pg_current_wal_lsn(), r.replay_lsn)), 0) AS max_replay_lag_bytes,
+                count(r.pid) AS standby_count,
+                pg_wal_lsn_diff(pg_current_wal_lsn(), '0/0') AS wal_position_bytes
+            FROM
+                pg_stat_replication AS r;
+    """
+
+    @staticmethod
+    def get_invalid_reindex_builds():
+        """
+        Returns the oid and a DROP INDEX CONCURRENTLY statement of every invalid index left by a
+        REINDEX INDEX CONCURRENTLY of the index in the oid parameter, named <index>_ccnew or <index>_ccnew<n>.
+        Like PostgreSQL, the index name is cut so the name with its suffix fits in 63 characters.
+        Builds of other indexes of the table are never returned.
+        """
+        return """
+            SELECT
+                c.oid AS index_oid,
+                format('DROP INDEX CONCURRENTLY %%I.%%I;', n.nspname, c.relname) AS drop_statement
             FROM
-                pg_class c
+                pg_index AS target
+            JOIN
+                pg_class AS ct ON ct.oid = target.indexrelid
             JOIN
-                pg_index i ON c.oid = i.indexrelid
+                pg_index AS i ON i.indrelid = target.indrelid
             JOIN
-                pg_am am ON c.relam = am.oid
+                pg_class AS c ON c.oid = i.indexrelid
+            JOIN
+                pg_namespace AS n ON n.oid = c.relnamespace
+            CROSS JOIN LATERAL
+                substring(c.relname FROM '_ccnew[0-9]*$') AS build_suffix
             WHERE
-                c.relname = '{index_name}';
+                target.indexrelid = %s::oid
+                AND NOT i.indisvalid
+                AND c.relnamespace = ct.relnamespace
+                AND c.relname = left(ct.relname, 63 - length(build_suffix)) || build_suffix;
     """
 
     @staticmethod
-    def get_index_ddl(schema_name,index_name):
-        """Returns create statement of index"""
-        return f"""
+    def get_remediation_sizes():
+        """Returns the index and table sizes and the tuple count used by the remediation cost model, for every index in the oid array parameter."""
+        return """
             SELECT
-            indexdef || ';'
+                i.indexrelid AS index_oid,
+                pg_relation_size(i.indexrelid) AS index_size_bytes,
+                pg_relation_size(i.indrelid) AS table_size_bytes,
+                greatest(ci.reltuples, 0) AS reltuples,
+                pg_size_bytes(current_setting('maintenance_work_mem')) AS maintenance_work_mem_bytes
             FROM
-                pg_indexes
+                pg_index AS i
+            JOIN
+                pg_class AS ci ON ci.oid = i.indexrelid
             WHERE
-                schemaname = '{schema_name}' and indexname = '{index_name}';
+                i.indexrelid = ANY(%s::oid[]);
     """
@@ -0,0 +1,95 @@
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2
+from .queries import SqlQueries
+
+NodeUsage = namedtuple("NodeUsage", ["name", "host", "port", "status", "error", "elapsed", "index_scans"])
+
+
+class ReplicaUsageCollector:
+    """
+    Reads the index scan counters of the primary and of every configured standby concurrently.
+
+    Physical standbys share the index oids of their primary but count their own scans,
+    so an index serving read traffic on a standby looks unused on the primary. Standbys
+    are listed under the standbys key of a database entry and inherit every connection
+    setting they do not override from it.
+
+    Attributes:
+        nodes (list): NodeUsage of every node after collect, the primary first.
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.nodes = []
+
+    def node_configs(self):
+        """Returns (name, config) of the primary and of every standby."""
+        primary = {key: value for key, value in self.manager.config.items() if key != "standbys"}
+        configs = [(primary.get("name", "primary"), primary)]
+        for position, standby in enumerate(self.manager.config.get("standbys") or [], start=1):
+            config = dict(primary, **standby)
+            configs.append((standby.get("name", f'{primary.get("name", "primary")}-standby-{position}'), config))
+        return configs
+
+    def _sample_node(self, name, config, is_primary):
+        """Reads the scan counters of one node, returning its NodeUsage whether it answered or not."""
+        started = time.monotonic()
+        host, port = config.get("host", "localhost"), config.get("port", "5432")
+        try:
+            if is_primary:
+                with self.manager.pooled_connection() as connection:
+                    rows = self._read_counters(connection)
+            else:
+                connection = psycopg2.connect(**self.manager.connect_kwargs(config))
+                try:
+                    rows = self._read_counters(connection)
+                finally:
+                    connection.close()
+        except Exception as e:
+            self.manager.logger.warning(f"Failed to read index usage from {name} ({host}:{port}): {e}")
+            return NodeUsage(name, host, port, "failed", str(e), time.monotonic() - started, {})
+        return NodeUsage(name, host, port, "ok", None, time.monotonic() - started,
+                         {index_oid: index_scans for index_oid, index_scans, _ in rows})
+
+    @staticmethod
+    def _read_counters(connection):
+        with connection.cursor() as cursor:
+            cursor.execute(SqlQueries.get_index_usage_sample())
+            return cursor.fetchall()
+
+    def collect(self):
+        """Reads every node concurrently and returns their NodeUsage, the primary first."""
+        configs = self.node_configs()
+        with ThreadPoolExecutor(max_workers=len(configs)) as executor:
+            futures = [
+                executor.submit(self._sample_node, name, config, position == 0)
+                for position, (name, config) in enumerate(configs)
+            ]
+            self.nodes = [future.result() for future in futures]
+        return self.nodes
+
+    @property
+    def complete(self):
+        """True when every node answered."""
+        return all(node.status == "ok" for node in self.nodes)
+
+    def total_scans(self):
+        """Returns index oid to the sum of its scans over the nodes that answered."""
+        totals = {}
+        for node in self.nodes:
+            for index_oid, index_scans in node.index_scans.items():
+                totals[index_oid] = totals.get(index_oid, 0) + index_scans
+        return totals
+
+    def unused_index_oids(self):
+        """
+        Returns the oids of indexes idle on every node.
+
+        When a node did not answer, its usage is unknown and no index is returned.
+        """
+        if not self.complete or not self.nodes:
+            return set()
+        totals = self.total_scans()
+        return {index_oid for index_oid in self.nodes[0].index_scans if totals[index_oid] == 0}
@@ -0,0 +1,202 @@
+import csv
+import json
+
+DEFAULT_REPORT_HEADERS = ['Database Name', 'Schema Name', 'Index Name', 'Index Type', 'Index Size', 'Category']
+DEFAULT_SINK_BATCH_SIZE = 1000
+
+
+class ReportSink:
+    """
+    Base class of the report sinks, which write index rows to a file as they are produced.
+
+    A sink keeps at most one batch of rows in memory, so export time and memory depend on
+    the batch size and not on the size of the result. Sinks are context managers and are
+    closed when the block ends.
+
+    Attributes:
+        path (str): Report file location.
+        headers (list): Column names of the rows.
+        row_count (int): Number of rows written so far.
+    """
+    extension = None
+
+    def __init__(self, db_name, report_name="index_report", filename='index_report', report_path='/tmp/',
+                 headers=None, batch_size=DEFAULT_SINK_BATCH_SIZE):
+        self.db_name = db_name
+        self.report_name = report_name
+        self.path = f'''{report_path}{filename}.{self.extension}'''
+        self.headers = list(headers) if headers is not None else DEFAULT_REPORT_HEADERS
+        self.batch_size = batch_size
+        self.row_count = 0
+        self.closed = False
+
+    def write(self, row):
+        """Appends one row of index properties to the report."""
+        self._write(row)
+        self.row_count += 1
+
+    def close(self):
+        """Flushes the pending rows and closes the report."""
+        if not self.closed:
+            self.closed = True
+            self._close()
+
+    def _write(self, row):
+        raise NotImplementedError
+
+    def _close(self):
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+class JsonSink(ReportSink):
+    """
+    Writes the indented JSON report document row by row.
+
+    The report has the same keys as a report built at once. The total index count is only
+    known after the last row, so it is written after the index list.
+    """
+    extension = "json"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._file = open(self.path, 'w')
+        self._file.write('{\n')
+        self._file.write(f'    "report_name": {json.dumps(self.report_name)},\n')
+        self._file.write(f'    "database_name": {json.dumps(self.db_name)},\n')
+        self._file.write('    "indexes": [')
+
+    def _write(self, row):
+        separator = ',\n' if self.row_count else '\n'
+        index = json.dumps(dict(zip(self.headers, row)), indent=4, default=str)
+        self._file.write(separator + '\n'.join('        ' + line for line in index.split('\n')))
+
+    def _close(self):
+        self._file.write('\n    ],\n' if self.row_count else '],\n')
+        self._file.write(f'    "total_index_count": {self.row_count}\n}}')
+        self._file.close()
+
+
+class NdjsonSink(ReportSink):
+    """Writes newline-delimited JSON, one index object per line."""
+    extension = "ndjson"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._file = open(self.path, 'w')
+
+    def _write(self, row):
+        self._file.write(json.dumps(dict(zip(self.headers, row)), default=str) + '\n')
+
+    def _close(self):
+        self._file.close()
+
+
+class CsvSink(ReportSink):
+    """Writes a CSV file with a header line followed by one line per index."""
+    extension = "csv"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._file = open(self.path, 'w', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.headers)
+
+    def _write(self, row):
+        self._writer.writerow(row)
+
+    def _close(self):
+        self._file.close()
+
+
+class ParquetSink(ReportSink):
+    """
+    Writes a columnar Parquet file, one row group per batch of rows.
+
+    Column types are taken from the first non-null value of each column in the first
+    batch, and columns without any value in it are written as strings. Requires the
+    optional pyarrow dependency, installed with pip install pg_index_insight[parquet].
+    """
+    extension = "parquet"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ValueError("The parquet export requires pyarrow. Install it with: pip install pyarrow")
+        self._pyarrow = pyarrow
+        self._parquet = pyarrow.parquet
+        self._batch = []
+        self._writer = None
+        self._schema = None
+
+    def _write(self, row):
+        self._batch.append(row)
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+
+    def _infer_schema(self):
+        fields = []
+        for position, header in enumerate(self.headers):
+            values = [row[position] for row in self._batch if row[position] is not None]
+            field_type = self._pyarrow.array(values[:1]).type if values else self._pyarrow.string()
+            fields.append(self._pyarrow.field(header, field_type))
+        return self._pyarrow.schema(fields)
+
+    def _flush(self):
+        if not self._batch:
+            return
+        if self._schema is None:
+            self._schema = self._infer_schema()
+            self._writer = self._parquet.ParquetWriter(self.path, self._schema)
+        columns = []
+        for position, field in enumerate(self._schema):
+            values = [row[position] for row in self._batch]
+            if field.type == self._pyarrow.string():
+                values = [str(value) if value is not None else None for value in values]
+            columns.append(self._pyarrow.array(values, type=field.type))
+        self._writer.write_table(self._pyarrow.Table.from_arrays(columns, schema=self._schema))
+        self._batch = []
+
+    def _close(self):
+        self._flush()
+        if self._writer is None:
+            self._schema = self._pyarrow.schema([self._pyarrow.field(header, self._pyarrow.string())
+                                                 for header in self.headers])
+            self._writer = self._parquet.ParquetWriter(self.path, self._schema)
+        self._writer.close()
+
+
+SINK_FORMATS = {
+    "json": JsonSink,
+    "ndjson": NdjsonSink,
+    "csv": CsvSink,
+    "parquet": ParquetSink,
+}
+
+
+def open_sink(export_format, db_name, report_name="index_report", filename='index_report', report_path='/tmp/',
+              headers=None, batch_size=DEFAULT_SINK_BATCH_SIZE):
+    """
+    Opens the report sink of an export format.
+
+    Parameters:
+        export_format (str): One of json, ndjson, csv or parquet.
+        headers (list): Column names of the rows, defaults to the single database report columns.
+        batch_size (int): Rows buffered before they are written, for the columnar format.
+
+    Returns:
+        ReportSink: The open sink.
+    """
+    if export_format not in SINK_FORMATS:
+        raise ValueError(f"Unknown export format: {export_format}")
+    return SINK_FORMATS[export_format](db_name, report_name=report_name, filename=filename,
+                                        report_path=report_path, headers=headers, batch_size=batch_size)
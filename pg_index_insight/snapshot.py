@@ -0,0 +1,577 @@
+import queue
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from itertools import groupby
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_REPEATABLE_READ
+from .queries import SqlQueries
+
+DEFAULT_BATCH_SIZE = 2000
+DEFAULT_PREFETCH_BATCHES = 4
+DEFAULT_CHUNK_SIZE = 2000
+DEFAULT_CHUNK_ATTEMPTS = 3
+_NOT_READ = object()
+
+IndexRecord = namedtuple("IndexRecord", [
+    "index_oid",
+    "table_oid",
+    "schema_name",
+    "table_name",
+    "index_name",
+    "index_type",
+    "is_primary",
+    "is_unique",
+    "is_valid",
+    "is_ready",
+    "column_numbers",
+    "key_column_count",
+    "operator_classes",
+    "collations",
+    "column_options",
+    "expressions",
+    "predicate",
+    "relpages",
+    "reltuples",
+    "fillfactor",
+    "index_size_bytes",
+    "index_scans",
+    "relfilenode",
+    "table_last_analyzed",
+    "parent_index_oid",
+    "is_partitioned",
+])
+
+IndexColumn = namedtuple("IndexColumn", ["attname", "is_name_type", "null_frac", "avg_width"])
+
+TableGroup = namedtuple("TableGroup", ["table_oid", "indexes", "columns"])
+
+ColumnChunk = namedtuple("ColumnChunk", ["tables", "attempt"])
+
+FailedChunk = namedtuple("FailedChunk", ["first_table_oid", "last_table_oid", "index_oids", "error"])
+
+
+@contextmanager
+def consistent_snapshot(connection, snapshot_id=None):
+    """
+    Runs the block in a read only repeatable read transaction, so every query sees the same point in time.
+
+    With snapshot_id, the transaction imports a snapshot exported by another one with
+    export_snapshot, and sees the same point in time as that transaction.
+    """
+    autocommit = connection.autocommit
+    connection.autocommit = False
+    connection.set_session(isolation_level=ISOLATION_LEVEL_REPEATABLE_READ, readonly=True)
+    try:
+        if snapshot_id is not None:
+            with connection.cursor() as cursor:
+                cursor.execute("SET TRANSACTION SNAPSHOT %s", (snapshot_id,))
+        yield connection
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+    finally:
+        connection.set_session(isolation_level="DEFAULT", readonly="DEFAULT")
+        connection.autocommit = autocommit
+
+
+def stream_rows(connection, query, params=None, batch_size=DEFAULT_BATCH_SIZE, name="pgindexinsight"):
+    """
+    Yields the rows of a query from a named server-side cursor, batch_size rows per round trip.
+
+    The connection must be inside a transaction, see consistent_snapshot.
+    """
+    with connection.cursor(name=name) as cursor:
+        cursor.itersize = batch_size
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+
+
+def export_snapshot(connection):
+    """Exports the snapshot of the transaction open on connection and returns its identifier."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_export_snapshot()")
+        return cursor.fetchone()[0]
+
+
+class ConcurrentReader:
+    """
+    Runs independent catalog queries at the same time on borrowed connections sharing one snapshot.
+
+    The transaction reading the snapshot exports it, and every borrowed connection imports
+    it before its query, so rows read concurrently are as consistent as rows read on a
+    single connection. Reads end when the slowest query ends instead of when the sum of
+    them would. When timeout seconds pass, every running statement is cancelled and the
+    reads raise TimeoutError. The reader is a context manager starting the timeout.
+
+    Attributes:
+        snapshot_id (str): Snapshot imported by every borrowed connection.
+        concurrency (int): Maximum number of queries submitted with submit running at once.
+        timeout (float): Seconds the reads may take, or None for no limit.
+        timed_out (threading.Event): Set once the timeout cancelled the reads.
+    """
+
+    def __init__(self, borrow_connection, snapshot_id, concurrency=2, timeout=None, batch_size=DEFAULT_BATCH_SIZE):
+        self.borrow_connection = borrow_connection
+        self.snapshot_id = snapshot_id
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.timed_out = threading.Event()
+        self._timer = None
+        self._executor = None
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        if self.timeout:
+            self._timer = threading.Timer(self.timeout, self.cancel)
+            self._timer.daemon = True
+            self._timer.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        if self._timer is not None:
+            self._timer.cancel()
+        return False
+
+    def cancel(self):
+        """Cancels the statements running on every borrowed connection. Safe to call from another thread."""
+        self.timed_out.set()
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            if not connection.closed:
+                connection.cancel()
+
+    @contextmanager
+    def _snapshot_connection(self):
+        """Borrows a connection and runs the block in a transaction importing the shared snapshot."""
+        with self.borrow_connection() as connection:
+            with self._lock:
+                self._connections.append(connection)
+            try:
+                if self.timed_out.is_set():
+                    raise psycopg2.extensions.QueryCanceledError("canceling statement due to user request")
+                with consistent_snapshot(connection, self.snapshot_id):
+                    yield connection
+            except psycopg2.extensions.QueryCanceledError:
+                if self.timed_out.is_set():
+                    raise TimeoutError(f"Catalog reads exceeded the {self.timeout}s timeout and were cancelled.")
+                raise
+            finally:
+                with self._lock:
+                    self._connections.remove(connection)
+
+    def _fetch(self, name, query, params):
+        with self._snapshot_connection() as connection:
+            return list(stream_rows(connection, query, params, batch_size=self.batch_size, name=name))
+
+    def submit(self, name, query, params=None):
+        """
+        Starts a query on a borrowed connection, up to concurrency at a time, and returns the future of its rows.
+
+        The name also names the server-side cursor the rows are fetched from.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="pgindexinsight")
+        return self._executor.submit(self._fetch, name, query, params)
+
+    def stream(self, query, params=None, name="pgindexinsight", prefetch_batches=DEFAULT_PREFETCH_BATCHES):
+        """
+        Returns an iterator over the rows of a query, read ahead on a background thread.
+
+        The query starts right away, and up to prefetch_batches batches of batch_size rows
+        are fetched ahead of the consumer, so it runs while the caller reads other rows,
+        with bounded memory. The iterator must be closed when it is not read to the end.
+        """
+        batches = queue.Queue(maxsize=max(1, prefetch_batches))
+        stopped = threading.Event()
+
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                with self._snapshot_connection() as connection:
+                    with connection.cursor(name=name) as cursor:
+                        cursor.itersize = self.batch_size
+                        cursor.execute(query, params)
+                        while True:
+                            rows = cursor.fetchmany(self.batch_size)
+                            if not put(rows) or not rows:
+                                return
+            except Exception as e:
+                put(e)
+
+        producer = threading.Thread(target=produce, name=f"{name}-prefetch", daemon=True)
+        producer.start()
+        return PrefetchedRows(batches, stopped, producer)
+
+
+class PrefetchedRows:
+    """Iterator over the row batches a ConcurrentReader.stream producer thread puts in a queue."""
+
+    def __init__(self, batches, stopped, producer):
+        self._batches = batches
+        self._stopped = stopped
+        self._producer = producer
+        self._rows = iter(())
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while True:
+            row = next(self._rows, None)
+            if row is not None:
+                return row
+            if self._stopped.is_set():
+                raise StopIteration
+            rows = self._batches.get()
+            if isinstance(rows, Exception):
+                self.close()
+                raise rows
+            if not rows:
+                self.close()
+                raise StopIteration
+            self._rows = iter(rows)
+
+    def close(self):
+        """Stops the producer and waits for it to hand its connection back."""
+        self._stopped.set()
+        self._producer.join()
+
+
+class ColumnStatsChunks:
+    """
+    Reads the btree column statistics in chunks of tables, concurrently, while the index catalog streams in.
+
+    Tables are added in catalog order, that is by table oid. Once chunk_size indexes need
+    statistics, their tables form a chunk, read with a table oid range query, or, with a
+    BloatCache, with the oids of the indexes whose cached estimate is stale. A failing
+    chunk is split in two halves of its tables and read again, up to max_attempts reads
+    of any table, so a chunk running into statement_timeout is retried smaller. Chunks
+    failing every attempt are kept in failed and their indexes get no statistics, while
+    the statistics of every other chunk are still returned.
+
+    Attributes:
+        chunk_size (int): Indexes needing statistics per chunk.
+        max_attempts (int): Reads of a table before its chunk is reported failed.
+        submitted (int): Chunks submitted so far, retries included.
+        completed (int): Chunks read or failed for good so far.
+        columns (dict): Index oid to a tuple of IndexColumn, filled as chunks complete.
+        failed (list): FailedChunk of every chunk that could not be read.
+    """
+
+    def __init__(self, reader, bloat_cache=None, chunk_size=DEFAULT_CHUNK_SIZE, max_attempts=DEFAULT_CHUNK_ATTEMPTS,
+                 on_chunk=None):
+        self.reader = reader
+        self.bloat_cache = bloat_cache
+        self.chunk_size = max(1, chunk_size)
+        self.max_attempts = max(1, max_attempts)
+        self.on_chunk = on_chunk
+        self.submitted = 0
+        self.completed = 0
+        self.columns = {}
+        self.failed = []
+        self._tables = []
+        self._index_count = 0
+        self._pending = {}
+
+    def add(self, table_oid, records):
+        """Adds the IndexRecords of one table, submitting a chunk once enough indexes need statistics."""
+        index_oids = [
+            record.index_oid for record in records
+            if record.index_type == "btree" and record.relpages > 0
+            and (self.bloat_cache is None or not self.bloat_cache.contains(record))
+        ]
+        if not index_oids:
+            return
+        self._tables.append((table_oid, index_oids))
+        self._index_count += len(index_oids)
+        if self._index_count >= self.chunk_size:
+            self._submit(ColumnChunk(self._tables, 1))
+            self._tables = []
+            self._index_count = 0
+        for future in [future for future in self._pending if future.done()]:
+            self._collect(future)
+
+    def finish(self):
+        """Submits the last chunk, waits for every chunk and returns the statistics read."""
+        if self._tables:
+            self._submit(ColumnChunk(self._tables, 1))
+            self._tables = []
+        while self._pending:
+            done, _ = wait(self._pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                self._collect(future)
+        return self.columns
+
+    def _submit(self, chunk):
+        if self.bloat_cache is None:
+            query = SqlQueries.get_index_column_stats(filter_by_table_range=True)
+            params = (chunk.tables[0][0], chunk.tables[-1][0])
+        else:
+            query = SqlQueries.get_index_column_stats(filter_by_oids=True)
+            params = ([index_oid for _, index_oids in chunk.tables for index_oid in index_oids],)
+        self.submitted += 1
+        future = self.reader.submit(f"pgindexinsight_columns_{self.submitted}", query, params)
+        self._pending[future] = chunk
+
+    def _collect(self, future):
+        chunk = self._pending.pop(future)
+        try:
+            rows = future.result()
+        except Exception as e:
+            if chunk.attempt < self.max_attempts and not self.reader.timed_out.is_set():
+                middle = (len(chunk.tables) + 1) // 2
+                for tables in (chunk.tables[:middle], chunk.tables[middle:]):
+                    if tables:
+                        self._submit(ColumnChunk(tables, chunk.attempt + 1))
+            else:
+                self.failed.append(FailedChunk(
+                    chunk.tables[0][0], chunk.tables[-1][0],
+                    [index_oid for _, index_oids in chunk.tables for index_oid in index_oids], str(e).strip()))
+            self.completed += 1
+            self._report()
+            return
+        columns = {}
+        for row in rows:
+            columns.setdefault(row[0], []).append(IndexColumn(*row[2:]))
+        for index_oid, index_columns in columns.items():
+            self.columns[index_oid] = tuple(index_columns)
+        self.completed += 1
+        self._report()
+
+    def _report(self):
+        if self.on_chunk is not None:
+            self.on_chunk(self.completed, self.submitted + (1 if self._tables else 0), len(self.failed))
+
+
+def group_tables(index_rows, column_rows):
+    """
+    Merges index catalog rows and column statistics rows, both ordered by table and index oid, into TableGroups.
+
+    Only one table worth of rows is held in memory at a time.
+    """
+    column_rows = iter(column_rows)
+    pending = _NOT_READ
+    for table_oid, rows in groupby(index_rows, key=lambda row: row[1]):
+        indexes = [IndexRecord(*row) for row in rows]
+        if pending is _NOT_READ:
+            # Read only now, so the index query has started when column rows are read ahead elsewhere.
+            pending = next(column_rows, None)
+        columns = {}
+        while pending is not None and pending[1] < table_oid:
+            pending = next(column_rows, None)
+        while pending is not None and pending[1] == table_oid:
+            columns.setdefault(pending[0], []).append(IndexColumn(*pending[2:]))
+            pending = next(column_rows, None)
+        yield TableGroup(table_oid, indexes, {index_oid: tuple(cols) for index_oid, cols in columns.items()})
+
+
+def partition_root(parent_index_oids, index_oid):
+    """Returns the top partitioned index above an index, following parent_index_oids, or the index itself."""
+    while index_oid in parent_index_oids:
+        index_oid = parent_index_oids[index_oid]
+    return index_oid
+
+
+def read_server_settings(connection):
+    """Returns the block size and maximum alignment of the server."""
+    with connection.cursor() as cursor:
+        cursor.execute(SqlQueries.get_server_settings())
+        return cursor.fetchone()
+
+
+class CatalogSnapshot:
+    """
+    An in-memory copy of the catalog and statistics inputs used by the index detectors.
+
+    The snapshot is read inside a single repeatable read transaction, so every rule
+    evaluated over it sees the catalog and usage counters as of the same point in time.
+
+    Attributes:
+        indexes (dict): Index oid to IndexRecord, ordered by table.
+        columns (dict): Index oid to a tuple of IndexColumn for btree indexes with statistics.
+        block_size (int): Server block size in bytes.
+        max_align (int): Server maximum alignment in bytes.
+        failed_chunks (list): FailedChunk of the column statistics that could not be read.
+        unread_index_oids (set): Oids of the indexes of failed_chunks, whose bloat cannot be estimated.
+        partition_tables (dict): Top partitioned index oid to the oids of every table of its hierarchy.
+    """
+
+    def __init__(self, indexes, columns, block_size, max_align, failed_chunks=()):
+        self.indexes = indexes
+        self.columns = columns
+        self.block_size = block_size
+        self.max_align = max_align
+        self.failed_chunks = list(failed_chunks)
+        self.unread_index_oids = {index_oid for chunk in self.failed_chunks for index_oid in chunk.index_oids}
+        self.indexes_by_table = {}
+        parent_index_oids = {}
+        for record in indexes.values():
+            self.indexes_by_table.setdefault(record.table_oid, []).append(record)
+            if record.parent_index_oid is not None:
+                parent_index_oids[record.index_oid] = record.parent_index_oid
+        self.partition_tables = {}
+        for record in indexes.values():
+            if record.is_partitioned or record.parent_index_oid is not None:
+                self.partition_tables.setdefault(
+                    partition_root(parent_index_oids, record.index_oid), set()).add(record.table_oid)
+
+    @classmethod
+    def load(cls, connection, bloat_cache=None, batch_size=DEFAULT_BATCH_SIZE, borrow_connection=None,
+             concurrency=1, timeout=None, chunk_size=DEFAULT_CHUNK_SIZE, chunk_attempts=DEFAULT_CHUNK_ATTEMPTS,
+             on_chunk=None):
+        """
+        Reads all detector inputs from the database in one consistent snapshot.
+
+        When a BloatCache is given, column statistics are only read for btree indexes
+        whose cached bloat estimate is missing or stale.
+
+        With borrow_connection and a concurrency above one, the column statistics are read
+        by ColumnStatsChunks on borrowed connections importing the snapshot, chunk after
+        chunk while the index catalog streams in, and a failing chunk only leaves its own
+        indexes without statistics. on_chunk(completed, submitted, failed) is called as
+        chunks complete. Otherwise, everything is read on connection, one query at a time.
+        """
+        with consistent_snapshot(connection):
+            block_size, max_align = read_server_settings(connection)
+            index_rows = stream_rows(connection, SqlQueries.get_index_catalog(), batch_size=batch_size,
+                                     name="pgindexinsight_indexes")
+            if borrow_connection is not None and concurrency > 1:
+                indexes = {}
+                reader = ConcurrentReader(borrow_connection, export_snapshot(connection), concurrency=concurrency,
+                                          timeout=timeout, batch_size=batch_size)
+                with reader:
+                    chunks = ColumnStatsChunks(reader, bloat_cache=bloat_cache, chunk_size=chunk_size,
+                                               max_attempts=chunk_attempts, on_chunk=on_chunk)
+                    for table_oid, rows in groupby(index_rows, key=lambda row: row[1]):
+                        records = [IndexRecord(*row) for row in rows]
+                        for record in records:
+                            indexes[record.index_oid] = record
+                        chunks.add(table_oid, records)
+                    columns = chunks.finish()
+                return cls(indexes, columns, block_size, max_align, chunks.failed)
+            indexes = {row[0]: IndexRecord(*row) for row in index_rows}
+            if bloat_cache is None:
+                column_rows = stream_rows(connection, SqlQueries.get_index_column_stats(), batch_size=batch_size)
+            else:
+                stale_index_oids = [
+                    record.index_oid for record in indexes.values()
+                    if record.index_type == "btree" and record.relpages > 0 and not bloat_cache.contains(record)
+                ]
+                column_rows = stream_rows(connection, SqlQueries.get_index_column_stats(filter_by_oids=True),
+                                          (stale_index_oids,), batch_size=batch_size)
+            columns = {}
+            for row in column_rows:
+                columns.setdefault(row[0], []).append(IndexColumn(*row[2:]))
+        return cls(indexes, {oid: tuple(cols) for oid, cols in columns.items()}, block_size, max_align)
+
+    def update(self, records):
+        """Replaces the given IndexRecords, keeping every table list in sync."""
+        table_oids = set()
+        for record in records:
+            self.indexes[record.index_oid] = record
+            table_oids.add(record.table_oid)
+        for table_oid in table_oids:
+            self.indexes_by_table[table_oid] = [
+                self.indexes[record.index_oid] for record in self.indexes_by_table[table_oid]
+            ]
+
+    def subset(self, table_oids):
+        """
+        Returns a CatalogSnapshot sharing the records and statistics of the given tables only.
+
+        A partition or partitioned table brings every table of its partition hierarchy along,
+        so the indexes of the subset are rolled up over all their partitions.
+        """
+        table_oids = set(table_oids)
+        for hierarchy_table_oids in self.partition_tables.values():
+            if not table_oids.isdisjoint(hierarchy_table_oids):
+                table_oids |= hierarchy_table_oids
+        indexes = {
+            record.index_oid: record
+            for table_oid in table_oids
+            for record in self.indexes_by_table.get(table_oid, ())
+        }
+        columns = {index_oid: self.columns[index_oid] for index_oid in indexes if index_oid in self.columns}
+        return CatalogSnapshot(indexes, columns, self.block_size, self.max_align)
+
+    def iter_tables(self):
+        """Yields a TableGroup for every indexed table."""
+        for table_oid, indexes in self.indexes_by_table.items():
+            columns = {
+                record.index_oid: self.columns[record.index_oid]
+                for record in indexes if record.index_oid in self.columns
+            }
+            yield TableGroup(table_oid, indexes, columns)
+
+
+class CatalogStream:
+    """
+    Streams the detector inputs table by table instead of holding them in memory.
+
+    Every pass over iter_tables reads the catalog again from named server-side cursors,
+    batch_size rows per round trip, inside one repeatable read transaction, so memory
+    use is bounded by the largest table rather than by the size of the catalog. With
+    borrow_connection, the column statistics are read ahead on a borrowed connection
+    importing the same snapshot, while the index catalog is read on this one.
+
+    Attributes:
+        block_size (int): Server block size in bytes, known once a pass has started.
+        max_align (int): Server maximum alignment in bytes, known once a pass has started.
+        unread_index_oids (set): Always empty, as a stream reads the column statistics in one query.
+    """
+
+    def __init__(self, connection, batch_size=DEFAULT_BATCH_SIZE, borrow_connection=None, timeout=None):
+        self.connection = connection
+        self.batch_size = batch_size
+        self.borrow_connection = borrow_connection
+        self.timeout = timeout
+        self.unread_index_oids = set()
+        self.block_size = None
+        self.max_align = None
+
+    def iter_tables(self):
+        """Yields a TableGroup for every indexed table, streamed from the server."""
+        with consistent_snapshot(self.connection):
+            self.block_size, self.max_align = read_server_settings(self.connection)
+            if self.borrow_connection is None:
+                column_rows = stream_rows(self.connection, SqlQueries.get_index_column_stats(),
+                                          batch_size=self.batch_size, name="pgindexinsight_columns")
+                for group in group_tables(self._index_rows(), column_rows):
+                    yield group
+                return
+            reader = ConcurrentReader(self.borrow_connection, export_snapshot(self.connection),
+                                      timeout=self.timeout, batch_size=self.batch_size)
+            with reader:
+                column_rows = reader.stream(SqlQueries.get_index_column_stats(), name="pgindexinsight_columns")
+                try:
+                    for group in group_tables(self._index_rows(), column_rows):
+                        yield group
+                finally:
+                    column_rows.close()
+
+    def _index_rows(self):
+        return stream_rows(self.connection, SqlQueries.get_index_catalog(), batch_size=self.batch_size,
+                           name="pgindexinsight_indexes")
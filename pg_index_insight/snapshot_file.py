@@ -0,0 +1,294 @@
+import gc
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate, chain, starmap
+from .snapshot import CatalogSnapshot, IndexRecord, IndexColumn
+
+SNAPSHOT_MAGIC = b"PGIISNAP"
+SNAPSHOT_FORMAT_VERSION = 2
+SNAPSHOT_DATABASE_KEYS = ("name", "host", "port", "dbname")
+
+INDEX_FIELD_KINDS = {
+    "index_oid": "int",
+    "table_oid": "int",
+    "schema_name": "text",
+    "table_name": "text",
+    "index_name": "text",
+    "index_type": "text",
+    "is_primary": "bool",
+    "is_unique": "bool",
+    "is_valid": "bool",
+    "is_ready": "bool",
+    "column_numbers": "int_array",
+    "key_column_count": "int",
+    "operator_classes": "int_array",
+    "collations": "int_array",
+    "column_options": "int_array",
+    "expressions": "text",
+    "predicate": "text",
+    "relpages": "int",
+    "reltuples": "float",
+    "fillfactor": "int",
+    "index_size_bytes": "int",
+    "index_scans": "int",
+    "relfilenode": "int",
+    "table_last_analyzed": "timestamp",
+    "parent_index_oid": "int",
+    "is_partitioned": "bool",
+}
+
+COLUMN_FIELD_KINDS = {
+    "attname": "text",
+    "is_name_type": "bool",
+    "null_frac": "float",
+    "avg_width": "int",
+}
+
+_HEADER = struct.Struct(">8sII")
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _encode_field(kind, values):
+    """
+    Encodes the values of one field as a list of byte strings.
+
+    Numbers are packed in native byte order arrays, texts are joined with NUL, which
+    PostgreSQL text never contains, and integer arrays are flattened next to their
+    lengths. A trailing null mask is added when a value is None.
+    """
+    if kind == "int":
+        parts = [array("q", [value or 0 for value in values]).tobytes()]
+    elif kind == "float":
+        parts = [array("d", [value or 0.0 for value in values]).tobytes()]
+    elif kind == "bool":
+        parts = [bytes(bool(value) for value in values)]
+    elif kind == "text":
+        parts = ["\0".join(value or "" for value in values).encode("utf-8")]
+    elif kind == "int_array":
+        parts = [array("q", [len(value) if value is not None else 0 for value in values]).tobytes(),
+                 array("q", chain.from_iterable(value for value in values if value is not None)).tobytes()]
+    elif kind == "timestamp":
+        parts = [array("q", chain.from_iterable(
+            ((value - _EPOCH) // _MICROSECOND, int(value.utcoffset().total_seconds())) if value is not None
+            else (0, 0) for value in values)).tobytes()]
+    else:
+        raise ValueError(f"Unknown snapshot field kind: {kind}")
+    if any(value is None for value in values):
+        parts.append(bytes(value is None for value in values))
+    return parts
+
+
+def _int_array(data, swap):
+    values = array("q")
+    values.frombytes(data)
+    if swap:
+        values.byteswap()
+    return values
+
+
+def _decode_field(kind, parts, count, swap):
+    """Decodes the values of one field from the byte strings written by _encode_field."""
+    if kind == "int":
+        values = _int_array(parts[0], swap).tolist()
+    elif kind == "float":
+        values = array("d")
+        values.frombytes(parts[0])
+        if swap:
+            values.byteswap()
+        values = values.tolist()
+    elif kind == "bool":
+        values = [value == 1 for value in parts[0]]
+    elif kind == "text":
+        values = bytes(parts[0]).decode("utf-8").split("\0") if count else []
+    elif kind == "int_array":
+        flat = _int_array(parts[1], swap).tolist()
+        lengths = _int_array(parts[0], swap).tolist()
+        values = [flat[end - length:end] for length, end in zip(lengths, accumulate(lengths))]
+    elif kind == "timestamp":
+        flat = _int_array(parts[0], swap).tolist()
+        # Indexes of one table share its analyze time, so each distinct value is built once.
+        keys = list(zip(flat[0::2], flat[1::2]))
+        decoded = {
+            key: (_EPOCH + timedelta(microseconds=key[0])).astimezone(timezone(timedelta(seconds=key[1])))
+            for key in set(keys)
+        }
+        values = [decoded[key] for key in keys]
+    else:
+        raise ValueError(f"Unknown snapshot field kind: {kind}")
+    if len(parts) > (2 if kind == "int_array" else 1):
+        values = [None if is_null else value for value, is_null in zip(values, parts[-1])]
+    return values
+
+
+def _encode_section(field_kinds, rows):
+    """Returns the directory entry of a section holding rows, with its compressed bytes."""
+    columns = list(zip(*rows)) if rows else [() for _ in field_kinds]
+    fields = []
+    parts = []
+    for (name, kind), values in zip(field_kinds.items(), columns):
+        field_parts = _encode_field(kind, values)
+        fields.append([name, kind, [len(part) for part in field_parts]])
+        parts.extend(field_parts)
+    return {"rows": len(rows), "fields": fields}, zlib.compress(b"".join(parts), 6)
+
+
+def _decode_section(entry, data, swap):
+    """Returns one list of values per field of a section."""
+    data = memoryview(data)
+    offset = 0
+    columns = []
+    for _, kind, part_lengths in entry["fields"]:
+        parts = []
+        for length in part_lengths:
+            parts.append(data[offset:offset + length])
+            offset += length
+        columns.append(_decode_field(kind, parts, entry["rows"], swap))
+    return columns
+
+
+class SnapshotFile:
+    """
+    A catalog snapshot saved to a file, so detectors can run offline against it.
+
+    The file holds everything a CatalogSnapshot is built from: the index catalog and
+    usage rows, the btree column statistics, the server block size and alignment, and the
+    database facts shown next to the results. Connection secrets are never written.
+
+    Layout: a fixed header (magic, format version, directory length), a JSON directory,
+    then one zlib compressed section per input. Sections are column oriented: numbers are
+    packed arrays and texts are joined, which compresses well and decodes without a
+    per-value parser. The file is memory mapped and
+    each section is decompressed straight from its byte range, so reading the directory
+    alone, as in describe(), does not read the sections.
+
+    Attributes:
+        path (str): Snapshot file location.
+        directory (dict): Format version, database, facts, server settings, counts and section ranges.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._map = None
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, directory_length = _HEADER.unpack_from(self._map, 0)
+            if magic != SNAPSHOT_MAGIC:
+                raise ValueError(f"{path} is not a pgindexinsight snapshot file.")
+            if version != SNAPSHOT_FORMAT_VERSION:
+                raise ValueError(f"{path} has snapshot format {version}, this version reads {SNAPSHOT_FORMAT_VERSION}.")
+            self._data_offset = _HEADER.size + directory_length
+            self.directory = json.loads(self._map[_HEADER.size:self._data_offset].decode("utf-8"))
+        except Exception:
+            self.close()
+            raise
+
+    @property
+    def database(self):
+        """Connection-free configuration of the database the snapshot was taken from."""
+        return self.directory["database"]
+
+    @property
+    def facts(self):
+        """Recovery status, replication and server version of the database when the snapshot was taken."""
+        return self.directory["facts"]
+
+    def section(self, name):
+        """Returns one list of values per field of a section, decompressed from its range of the mapped file."""
+        entry = self.directory["sections"][name]
+        start = self._data_offset + entry["offset"]
+        data = zlib.decompress(self._map[start:start + entry["length"]])
+        return _decode_section(entry, data, self.directory["byteorder"] != sys.byteorder)
+
+    def load(self):
+        """
+        Builds the CatalogSnapshot saved in the file.
+
+        The garbage collector is paused while the records are created: every new tuple
+        would otherwise count towards a collection, and a 100k index snapshot creates
+        hundreds of thousands of them.
+        """
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            index_fields = self.section("indexes")
+            indexes = dict(zip(index_fields[0], starmap(IndexRecord, zip(*index_fields))))
+            index_oids, counts = self.section("column_counts")
+            column_rows = list(starmap(IndexColumn, zip(*self.section("columns"))))
+            columns = {
+                index_oid: tuple(column_rows[end - count:end])
+                for index_oid, count, end in zip(index_oids, counts, accumulate(counts))
+            }
+            return CatalogSnapshot(indexes, columns, self.directory["block_size"], self.directory["max_align"])
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def describe(self):
+        """Returns a one line description of the snapshot, read from the directory only."""
+        database = self.database
+        return (f'{database.get("name")} ({database.get("dbname")} on {database.get("host", "localhost")}), '
+                f'{self.directory["index_count"]} indexes, taken {self.directory["created_at"]}')
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    @staticmethod
+    def write(path, snapshot, config, facts):
+        """
+        Writes a CatalogSnapshot and the database facts to path, returning the file size in bytes.
+
+        Only the name, host, port and dbname of config are kept. The file is written next
+        to path and renamed, so readers never see a partial snapshot.
+        """
+        column_oids = list(snapshot.columns)
+        sections = [
+            ("indexes",) + _encode_section(INDEX_FIELD_KINDS, list(snapshot.indexes.values())),
+            ("column_counts",) + _encode_section(
+                {"index_oid": "int", "count": "int"},
+                [(index_oid, len(snapshot.columns[index_oid])) for index_oid in column_oids]),
+            ("columns",) + _encode_section(
+                COLUMN_FIELD_KINDS,
+                [column for index_oid in column_oids for column in snapshot.columns[index_oid]]),
+        ]
+        section_entries = {}
+        offset = 0
+        for name, entry, data in sections:
+            section_entries[name] = dict(entry, offset=offset, length=len(data))
+            offset += len(data)
+        directory = json.dumps({
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "database": {key: config[key] for key in SNAPSHOT_DATABASE_KEYS if key in config},
+            "facts": facts,
+            "block_size": snapshot.block_size,
+            "max_align": snapshot.max_align,
+            "index_count": len(snapshot.indexes),
+            "byteorder": sys.byteorder,
+            "sections": section_entries,
+        }).encode("utf-8")
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "wb") as snapshot_file:
+            snapshot_file.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, len(directory)))
+            snapshot_file.write(directory)
+            for _, _, data in sections:
+                snapshot_file.write(data)
+        os.replace(temporary_path, path)
+        return _HEADER.size + len(directory) + offset
@@ -0,0 +1,70 @@
+import heapq
+
+
+class ReclaimableSummary:
+    """
+    Totals the bytes that removing or rebuilding the reported indexes would give back.
+
+    Results are added one at a time while they are printed, so the totals never need the
+    full result list. An index reported in several categories counts in each category,
+    but only once, with its largest reclaimable size, in the schema, table and overall totals.
+    Results carrying a config_name, as scan-fleet merges them, are told apart by it, so two
+    hosts serving a database of the same name are totalled separately.
+
+    Attributes:
+        categories (dict): Category to [index count, reclaimable bytes].
+        schemas (dict): (database, schema name) to [index count, reclaimable bytes].
+        tables (dict): (database, schema name, table name) to [index count, reclaimable bytes].
+            The database is the config name and database name joined by a slash for
+            results carrying a config_name, and the database name otherwise.
+        total_bytes (int): Reclaimable bytes over every distinct index.
+    """
+
+    def __init__(self):
+        self.categories = {}
+        self.schemas = {}
+        self.tables = {}
+        self.total_bytes = 0
+        self._indexes = {}
+
+    def add(self, result):
+        """Adds one index result dictionary carrying reclaimable_bytes."""
+        reclaimable_bytes = result.get("reclaimable_bytes") or 0
+        self._add(self.categories, result["category"], 1, reclaimable_bytes)
+        index_key = (result.get("config_name"), result.get("database_name"), result.get("index_oid"))
+        previous_bytes = self._indexes.get(index_key)
+        if previous_bytes is not None and previous_bytes >= reclaimable_bytes:
+            return
+        self._indexes[index_key] = reclaimable_bytes
+        index_count = 1 if previous_bytes is None else 0
+        added_bytes = reclaimable_bytes - (previous_bytes or 0)
+        schema_key = (self.database(result), result["schema_name"])
+        self._add(self.schemas, schema_key, index_count, added_bytes)
+        self._add(self.tables, schema_key + (result.get("table_name"),), index_count, added_bytes)
+        self.total_bytes += added_bytes
+
+    @staticmethod
+    def database(result):
+        """Returns the database a result is totalled under."""
+        if result.get("config_name") is not None:
+            return f'{result["config_name"]}/{result.get("database_name")}'
+        return result.get("database_name")
+
+    @staticmethod
+    def _add(totals, key, index_count, reclaimable_bytes):
+        total = totals.setdefault(key, [0, 0])
+        total[0] += index_count
+        total[1] += reclaimable_bytes
+
+    @property
+    def index_count(self):
+        """Number of distinct indexes added."""
+        return len(self._indexes)
+
+    @staticmethod
+    def ranked(totals, limit=None):
+        """Returns (key, index count, reclaimable bytes) of totals, the largest reclaimable bytes first."""
+        entries = ((key, total[0], total[1]) for key, total in totals.items())
+        if limit is None:
+            return sorted(entries, key=lambda entry: entry[2], reverse=True)
+        return heapq.nlargest(limit, entries, key=lambda entry: entry[2])
@@ -0,0 +1,133 @@
+import threading
+import time
+from contextlib import contextmanager
+from .queries import SqlQueries
+from .utils import pretty_size
+
+
+class ReplicationThrottle:
+    """
+    Limits how many remediation statements run at once from the standby replay lag and the WAL rate.
+
+    A monitor thread reads pg_stat_replication and the WAL position every check_interval
+    seconds while the job runs. The load is the largest ratio of the replay lag or the WAL
+    rate to its threshold. From a load of 1, no new statement starts until it drops back.
+    From a load of 0.5, statements run one at a time. Below that, every worker runs.
+    Statements already running are never interrupted. The status is read on the shared
+    connection of the manager, so the monitor never waits for a pooled connection held by
+    a worker. After MAX_FAILED_CHECKS reads of the status fail in a row, statements run one
+    at a time until it can be read again, so a paused job does not wait forever on a broken
+    connection.
+
+    Attributes:
+        max_replay_lag (float): Standby replay lag in seconds that pauses the job, or None.
+        max_wal_rate (float): WAL bytes per second that pauses the job, or None.
+        allowed (int): Number of statements currently allowed to run at once.
+        paused_seconds (float): Time statements waited while the job was paused.
+    """
+
+    SLOW_DOWN_LOAD = 0.5
+    MAX_FAILED_CHECKS = 3
+
+    def __init__(self, manager, max_replay_lag=None, max_wal_rate=None, check_interval=5.0, on_change=None):
+        self.manager = manager
+        self.max_replay_lag = max_replay_lag
+        self.max_wal_rate = max_wal_rate
+        self.check_interval = check_interval
+        self.on_change = on_change
+        self.workers = 1
+        self.allowed = 1
+        self.paused_seconds = 0.0
+        self._active = 0
+        self._failed_checks = 0
+        self._last_wal_sample = None
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._monitor = None
+
+    def check(self):
+        """Reads the replication status once and updates the allowed concurrency."""
+        try:
+            with self.manager.connect().cursor() as cursor:
+                cursor.execute(SqlQueries.get_replication_status())
+                replay_lag, replay_lag_bytes, standby_count, wal_position = cursor.fetchone()
+        except Exception as e:
+            self._failed_checks += 1
+            if self._failed_checks < self.MAX_FAILED_CHECKS:
+                self.manager.logger.warning(f"Failed to read the replication status, keeping the current pace: {e}")
+            else:
+                self.manager.logger.warning(f"Failed to read the replication status {self._failed_checks} times in a "
+                                            f"row, running one statement at a time: {e}")
+                self._set_allowed(1, 'replication status unknown')
+            return
+        self._failed_checks = 0
+        sampled_at = time.monotonic()
+        wal_rate = None
+        if self._last_wal_sample is not None:
+            previous_position, previous_sampled_at = self._last_wal_sample
+            if sampled_at > previous_sampled_at:
+                wal_rate = float(wal_position - previous_position) / (sampled_at - previous_sampled_at)
+        self._last_wal_sample = (wal_position, sampled_at)
+        load = 0.0
+        if self.max_replay_lag and standby_count:
+            load = max(load, float(replay_lag) / self.max_replay_lag)
+        if self.max_wal_rate and wal_rate is not None:
+            load = max(load, wal_rate / self.max_wal_rate)
+        if load >= 1:
+            allowed = 0
+        elif load >= self.SLOW_DOWN_LOAD:
+            allowed = 1
+        else:
+            allowed = self.workers
+        wal_rate_text = f'{pretty_size(int(wal_rate))}/s' if wal_rate is not None else 'unknown'
+        self._set_allowed(allowed, f'replay lag {float(replay_lag):.1f}s ({pretty_size(int(replay_lag_bytes))}), '
+                                   f'WAL rate {wal_rate_text}')
+
+    def _set_allowed(self, allowed, status):
+        """Updates the allowed concurrency, wakes the waiting statements and reports a change."""
+        with self._condition:
+            changed = allowed != self.allowed
+            self.allowed = allowed
+            self._condition.notify_all()
+        if changed and self.on_change is not None:
+            self.on_change(allowed, status)
+
+    def start(self, workers):
+        """Checks the replication status once, then keeps checking it in a monitor thread."""
+        self.workers = max(1, workers)
+        self.allowed = self.workers
+        self._failed_checks = 0
+        self._stopped.clear()
+        self.check()
+        self._monitor = threading.Thread(target=self._run_monitor, name="pgindexinsight-throttle", daemon=True)
+        self._monitor.start()
+
+    def _run_monitor(self):
+        while not self._stopped.wait(self.check_interval):
+            self.check()
+
+    def stop(self):
+        """Stops the monitor thread."""
+        self._stopped.set()
+        if self._monitor is not None:
+            self._monitor.join()
+            self._monitor = None
+
+    @contextmanager
+    def slot(self):
+        """Waits until one more statement is allowed to run, and holds that slot while it runs."""
+        with self._condition:
+            waiting_since = None
+            while self._active >= self.allowed:
+                if waiting_since is None:
+                    waiting_since = time.monotonic()
+                self._condition.wait(self.check_interval)
+            if waiting_since is not None:
+                self.paused_seconds += time.monotonic() - waiting_since
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._active -= 1
+                self._condition.notify_all()
@@ -1,29 +1,85 @@
-import json
+import logging
 import os
+import re
 
-def generate_index_report(data, db_name, report_name="index_report", filename='index_report', report_path='/tmp/'):
+LOGGER_NAME = "pgindexinsight"
+
+SIZE_UNITS = ["kB", "MB", "GB", "TB", "PB"]
+CREATE_INDEX_PREFIX = re.compile(r"^CREATE (UNIQUE )?INDEX ")
+IDENTIFIER = r'(?:[A-Za-z_][A-Za-z0-9_$]*|"(?:[^"]|"")+")'
+REMEDIATION_STATEMENT = re.compile(
+    rf"^(DROP INDEX CONCURRENTLY|REINDEX INDEX CONCURRENTLY)\s+{IDENTIFIER}(?:\.{IDENTIFIER})?\s*;?\s*$",
+    re.IGNORECASE)
+SIMPLE_IDENTIFIER = re.compile(r"^[a-z_][a-z0-9_]*$")
+# Reserved, type or function name and column name keywords of PostgreSQL 13 to 17, which quote_ident quotes.
+QUOTED_KEYWORDS = frozenset("""
+    all analyse analyze and any array as asc asymmetric authorization between bigint binary bit boolean both case
+    cast char character check coalesce collate collation column concurrently constraint create cross
+    current_catalog current_date current_role current_schema current_time current_timestamp current_user dec
+    decimal default deferrable desc distinct do else end except exists extract false fetch float for foreign
+    freeze from full grant greatest group grouping having ilike in initially inner inout int integer intersect
+    interval into is isnull join json json_array json_arrayagg json_exists json_object json_objectagg json_query
+    json_scalar json_serialize json_table json_value lateral leading least left like limit localtime
+    localtimestamp merge_action national natural nchar none normalize not notnull null nullif numeric offset on
+    only or order out outer overlaps overlay placing position precision primary real references returning right
+    row select session_user setof similar smallint some substring symmetric system_user table tablesample then
+    time timestamp to trailing treat trim true union unique user using values varchar variadic verbose when
+    where window with xmlattributes xmlconcat xmlelement xmlexists xmlforest xmlnamespaces xmlparse xmlpi
+    xmlroot xmlserialize xmltable
+""".split())
+SIZE_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(B|bytes|kB|KB|MB|GB|TB|PB)?\s*$", re.IGNORECASE)
+
+def configure_logging(level=logging.WARNING):
+    """
+    Attach the console handler to the pgindexinsight logger and set the level of both.
+
+    The CLI calls it once on startup, so importing the package leaves logging untouched.
+
+    Parameters:
+        level (int): Lowest level logged, such as logging.INFO.
+    """
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(level)
+    if not logger.handlers:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        logger.addHandler(console_handler)
+    for handler in logger.handlers:
+        handler.setLevel(level)
+    return logger
+
+def quote_ident(name):
+    """
+    Quote an identifier the same way PostgreSQL's quote_ident does.
+
+    Names of lowercase letters, digits and underscores, not starting with a digit, are left
+    as is unless they are a keyword PostgreSQL does not allow as a bare name. Anything else,
+    including $ and non-ASCII letters, is double quoted with embedded quotes doubled. The
+    keywords are those of every supported version, so a word only a newer version reserves
+    is quoted too, which names the same relation.
+
+    Parameters:
+        name (str): Schema, table or index name.
+
+    Returns:
+        str: The name as is when it is a lowercase non-keyword identifier, double quoted otherwise.
     """
-    Generate a JSON report of index information.
+    if SIMPLE_IDENTIFIER.match(name) and name not in QUOTED_KEYWORDS:
+        return name
+    return '"' + name.replace('"', '""') + '"'
+
+def qualified_name(schema_name, name):
+    """
+    Build the schema qualified, quoted name of a relation.
 
     Parameters:
-        data (list of lists): Raw index data where each inner list contains index properties.
-        report_name (str): Name of the report.
+        schema_name (str): The schema name of the relation.
+        name (str): The name of the relation.
 
     Returns:
-        str: JSON formatted string representing the index report.
+        str: schema.name with both parts quoted as needed.
     """
-    headers = ['Database Name', 'Schema Name', 'Index Name', 'Index Type','Index Size', 'Category']
-    indexes = [dict(zip(headers, row)) for row in data]
-    report = {
-        "report_name": report_name,
-        "database_name": db_name,
-        "total_index_count": len(indexes),
-        "indexes": indexes
-    }
-    with open(f'''{report_path}{filename}.json''', 'w') as output_json:
-        json.dump(report, output_json, indent=4)
-        return True
-    return False
+    return f"{quote_ident(schema_name)}.{quote_ident(name)}"
 
 def generate_command(category,schema_name,index_name):
     """
@@ -35,7 +91,105 @@ def generate_command(category,schema_name,index_name):
         index_name (str): The name of the index.
 
     Returns:
-        str: The SQL command to execute.
+        str: The SQL command to execute, with the schema and index names quoted as needed.
     """
     operation = "REINDEX INDEX CONCURRENTLY" if category == "Bloated" else "DROP INDEX CONCURRENTLY"
-    return f"{operation} {schema_name}.{index_name};"
\ No newline at end of file
+    return f"{operation} {qualified_name(schema_name, index_name)};"
+
+def pretty_size(size_bytes):
+    """
+    Format a size in bytes the same way PostgreSQL's pg_size_pretty does.
+
+    Parameters:
+        size_bytes (int): Size in bytes.
+
+    Returns:
+        str: Human readable size such as '16 kB' or '15 MB'.
+    """
+    limit = 10 * 1024
+    half_limit = 20 * 1024 - 1
+    size = int(size_bytes)
+    if abs(size) < limit:
+        return f"{size} bytes"
+    size >>= 9
+    for unit in SIZE_UNITS:
+        if abs(size) < half_limit or unit == SIZE_UNITS[-1]:
+            return f"{(size + (1 if size >= 0 else -1)) // 2} {unit}"
+        size >>= 10
+
+
+def pretty_duration(seconds):
+    """
+    Format a duration in seconds for the remediation plan.
+
+    Parameters:
+        seconds (float): Duration in seconds.
+
+    Returns:
+        str: Duration such as '2h 05m', '3m 20s' or '4.2s'.
+    """
+    seconds = float(seconds)
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    if minutes < 60:
+        return f"{minutes}m {seconds:02d}s"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m"
+
+
+def add_concurrently(index_definition):
+    """
+    Turn a pg_get_indexdef statement into its CREATE INDEX CONCURRENTLY form.
+
+    pg_get_indexdef always starts with 'CREATE INDEX ' or 'CREATE UNIQUE INDEX ', so the
+    keyword is inserted right after that fixed prefix and the quoted index, table and
+    column names that follow are never touched.
+
+    Parameters:
+        index_definition (str): Statement returned by pg_get_indexdef.
+
+    Returns:
+        str: The statement building the index concurrently.
+    """
+    return CREATE_INDEX_PREFIX.sub(lambda match: f"{match.group(0)}CONCURRENTLY ", index_definition, count=1)
+
+
+def write_rollback_script(statements, filename, report_path='/tmp/', echo=None):
+    """
+    Stream statements into a SQL rollback script, one statement per line.
+
+    Parameters:
+        statements (iterable of str): Statements to write, consumed in a single pass.
+        filename (str): Script file name without extension.
+        report_path (str): Script output directory.
+        echo (callable): Optional callback receiving every statement as it is written.
+
+    Returns:
+        str: Path of the written script.
+    """
+    script_path = f'''{report_path}{filename}.sql'''
+    with open(script_path, 'w') as rollback_script:
+        for statement in statements:
+            rollback_script.write(statement + "\n")
+            if echo is not None:
+                echo(statement)
+    return script_path
+
+
+def parse_size(size_text):
+    """
+    Parse a human readable size such as '500MB' or '10 GB' into bytes.
+
+    Parameters:
+        size_text (str): Size with an optional B, kB, MB, GB, TB or PB unit, in powers of 1024.
+
+    Returns:
+        int: Size in bytes.
+    """
+    match = SIZE_PATTERN.match(str(size_text))
+    if not match:
+        raise ValueError(f"Invalid size: {size_text}")
+    unit = (match.group(2) or "B").upper()
+    exponent = 0 if unit in ("B", "BYTES") else [u.upper() for u in SIZE_UNITS].index(unit) + 1
+    return int(float(match.group(1)) * 1024 ** exponent)
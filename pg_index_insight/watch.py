@@ -0,0 +1,146 @@
+import time
+from datetime import datetime, timezone
+from .analyzer import IndexAnalyzer
+from .queries import SqlQueries
+from .snapshot import CatalogSnapshot
+
+
+class IndexWatcher:
+    """
+    Samples index counters on one long-lived connection and reports indexes changing category.
+
+    The sampling queries are prepared once per connection. Every sample first reads a
+    catalog change marker; the full catalog snapshot is only read again when it moved,
+    which means an index or its table went through DDL. Otherwise only the usage and size
+    counters are read, and the rules are evaluated again for the tables of the indexes
+    whose counters changed. The marker is read from the statistics system, so with
+    track_counts off every sample reads the catalog snapshot again.
+
+    Attributes:
+        samples (int): Number of samples taken.
+        reloads (int): Number of times the catalog snapshot was read.
+        last_sample_ms (float): Duration of the last sample in milliseconds.
+    """
+
+    COUNTERS_STATEMENT = "pgindexinsight_counters"
+    MARKER_STATEMENT = "pgindexinsight_catalog_marker"
+
+    def __init__(self, manager, bloat_threshold=50):
+        manager._check_version_supported()
+        self.manager = manager
+        self.bloat_threshold = bloat_threshold
+        self.snapshot = None
+        self.categories = {}
+        self.counters = {}
+        self.marker = None
+        self.samples = 0
+        self.reloads = 0
+        self.last_sample_ms = 0.0
+        self._prepared_connection = None
+        self._track_counts = True
+
+    def _cursor(self):
+        """Returns a cursor of the shared connection, preparing the sampling statements on a new connection."""
+        connection = self.manager.connect()
+        if connection is not self._prepared_connection:
+            with connection.cursor() as cursor:
+                cursor.execute(f"PREPARE {self.MARKER_STATEMENT} AS {SqlQueries.get_catalog_change_marker()}")
+                cursor.execute(f"PREPARE {self.COUNTERS_STATEMENT} AS {SqlQueries.get_index_counters()}")
+                cursor.execute("SELECT current_setting('track_counts')::boolean")
+                self._track_counts = cursor.fetchone()[0]
+            if not self._track_counts:
+                self.manager.logger.warning("track_counts is off, the catalog is read again on every sample.")
+            self._prepared_connection = connection
+        return connection.cursor()
+
+    def sample(self):
+        """
+        Takes one sample and returns the category change events it found.
+
+        The first sample only records the current categories and returns no events.
+
+        Returns:
+            list: Event dictionaries with the index, its category and whether it entered or left it.
+        """
+        started = time.monotonic()
+        with self._cursor() as cursor:
+            cursor.execute(f"EXECUTE {self.MARKER_STATEMENT}")
+            marker = cursor.fetchone()
+            cursor.execute(f"EXECUTE {self.COUNTERS_STATEMENT}")
+            counters = {row[0]: row[1:] for row in cursor.fetchall()}
+        if marker != self.marker or not self._track_counts:
+            events = self._reload(marker, counters)
+        else:
+            events = self._apply_counters(counters)
+        self.samples += 1
+        self.last_sample_ms = (time.monotonic() - started) * 1000
+        return events
+
+    def _reload(self, marker, counters):
+        """Reads the catalog snapshot again and evaluates every table."""
+        previous_snapshot = self.snapshot
+        self.snapshot = CatalogSnapshot.load(self.manager.connect())
+        self.marker = marker
+        self.counters = counters
+        self.reloads += 1
+        categories = self._evaluate(self.snapshot)
+        events = []
+        if previous_snapshot is not None:
+            events = self._diff(set(self.categories) | set(categories), categories, previous_snapshot)
+        self.categories = categories
+        return events
+
+    def _apply_counters(self, counters):
+        """Updates the records whose counters changed and evaluates their tables again."""
+        changed_records = []
+        for index_oid, values in counters.items():
+            if self.counters.get(index_oid) == values or index_oid not in self.snapshot.indexes:
+                continue
+            index_scans, _, relpages, reltuples = values
+            changed_records.append(self.snapshot.indexes[index_oid]._replace(
+                index_scans=index_scans, relpages=relpages, reltuples=reltuples))
+        self.counters = counters
+        if not changed_records:
+            return []
+        self.snapshot.update(changed_records)
+        table_subset = self.snapshot.subset({record.table_oid for record in changed_records})
+        categories = self._evaluate(table_subset)
+        events = self._diff(table_subset.indexes, categories)
+        for index_oid in table_subset.indexes:
+            self.categories.pop(index_oid, None)
+        self.categories.update(categories)
+        return events
+
+    def _evaluate(self, snapshot):
+        """Returns index oid to the set of rules matching it."""
+        categories = {}
+        analyzer = IndexAnalyzer(snapshot)
+        for rule, record, _ in analyzer.evaluate(IndexAnalyzer.RULES, self.bloat_threshold):
+            categories.setdefault(record.index_oid, set()).add(rule)
+        return categories
+
+    def _diff(self, index_oids, categories, previous_snapshot=None):
+        """Builds the events of the indexes whose set of rules changed, naming dropped ones from previous_snapshot."""
+        events = []
+        sampled_at = datetime.now(timezone.utc).isoformat()
+        for index_oid in index_oids:
+            before = self.categories.get(index_oid, set())
+            after = categories.get(index_oid, set())
+            if before == after:
+                continue
+            record = self.snapshot.indexes.get(index_oid)
+            dropped = record is None
+            if dropped and previous_snapshot is not None:
+                record = previous_snapshot.indexes.get(index_oid)
+            for rule, change in sorted([(rule, "entered") for rule in after - before]
+                                       + [(rule, "left") for rule in before - after]):
+                events.append({
+                    "time": sampled_at,
+                    "database_name": self.manager.dbname,
+                    "schema_name": record.schema_name if record is not None else None,
+                    "index_name": record.index_name if record is not None else None,
+                    "index_oid": index_oid,
+                    "category": self.manager.RULE_CATEGORIES[rule],
+                    "change": "dropped" if dropped else change,
+                })
+        return events
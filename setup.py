@@ -9,7 +9,7 @@ setup(
     long_description=open('README.md').read(),
     long_description_content_type='text/markdown',
     url='https://github.com/kylorend3r/pg_index_insight',  
-    packages=find_packages(), 
+    packages=find_packages(exclude=['tests', 'tests.*']),
     include_package_data=True,
     python_requires='>=3.6',
     install_requires=[
@@ -18,6 +18,9 @@ setup(
         'tabulate',
         'pyyaml'
     ],
+    extras_require={
+        'parquet': ['pyarrow'],
+    },
     entry_points={
         'console_scripts': [
             'pgindexinsight=pg_index_insight.cli:main',
@@ -0,0 +1,54 @@
+from datetime import datetime, timezone
+import pytest
+from pg_index_insight.snapshot import CatalogSnapshot, IndexRecord
+
+BTREE_INT_OPCLASS = 1978
+BTREE_TEXT_OPCLASS = 3126
+
+
+def make_record(index_oid, table_oid=100, index_name=None, column_numbers=(1,), key_column_count=None,
+                operator_classes=None, index_type="btree", is_primary=False, is_unique=False, is_valid=True,
+                predicate=None, expressions=None, index_scans=0, index_size_bytes=8192, relpages=1,
+                reltuples=100.0, parent_index_oid=None, is_partitioned=False, table_last_analyzed=None):
+    """Builds an IndexRecord with the catalog values of a plain btree index, overridden by the arguments."""
+    column_numbers = list(column_numbers)
+    return IndexRecord(
+        index_oid=index_oid,
+        table_oid=table_oid,
+        schema_name="public",
+        table_name=f"t{table_oid}",
+        index_name=index_name or f"i{index_oid}",
+        index_type=index_type,
+        is_primary=is_primary,
+        is_unique=is_unique or is_primary,
+        is_valid=is_valid,
+        is_ready=True,
+        column_numbers=column_numbers,
+        key_column_count=key_column_count if key_column_count is not None else len(column_numbers),
+        operator_classes=list(operator_classes) if operator_classes is not None
+        else [BTREE_INT_OPCLASS] * len(column_numbers),
+        collations=[0] * len(column_numbers),
+        column_options=[0] * len(column_numbers),
+        expressions=expressions,
+        predicate=predicate,
+        relpages=0 if is_partitioned else relpages,
+        reltuples=reltuples,
+        fillfactor=90,
+        index_size_bytes=0 if is_partitioned else index_size_bytes,
+        index_scans=None if is_partitioned else index_scans,
+        relfilenode=0 if is_partitioned else index_oid,
+        table_last_analyzed=table_last_analyzed,
+        parent_index_oid=parent_index_oid,
+        is_partitioned=is_partitioned,
+    )
+
+
+def make_snapshot(records, columns=None):
+    """Builds a CatalogSnapshot of the records, ordered by table and index oid like the catalog query."""
+    records = sorted(records, key=lambda record: (record.table_oid, record.index_oid))
+    return CatalogSnapshot({record.index_oid: record for record in records}, columns or {}, 8192, 8)
+
+
+@pytest.fixture
+def analyzed_at():
+    return datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
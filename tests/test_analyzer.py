@@ -0,0 +1,215 @@
+import pytest
+from pg_index_insight.analyzer import IndexAnalyzer, PrefixTrie, estimate_btree_bloat, index_signature, key_path
+from pg_index_insight.snapshot import IndexColumn
+from .conftest import BTREE_TEXT_OPCLASS, make_record, make_snapshot
+
+# Inputs and results of the baseline btree bloat query on PostgreSQL 16 with 8 kB blocks and
+# 8 byte alignment: relpages, reltuples, fillfactor, (null_frac, avg_width) of every column,
+# then its bloat_pct and bloat_size. The null data width of 2.5 rounds to 2 and 3.5 to 4, as
+# the float8 to integer cast of the query and Python's round both round halves to even.
+BASELINE_BLOAT = {
+    "no_nulls": (60, 10000.0, 90, [(0.0, 4)], 51.666666666666664, 253952),
+    "nullable_two_columns_fillfactor_70": (400, 25000.0, 70, [(0.25, 4), (0.25, 13)], 60.25, 1974272),
+    "half_width_rounds_down_to_even": (33, 7000.0, 90, [(0.5, 5)], 12.121212121212121, 32768),
+    "half_width_rounds_up_to_even": (33, 7000.0, 90, [(0.5, 7)], 15.151515151515152, 40960),
+    "smaller_than_estimated": (10, 5000.0, 90, [(0.1, 5), (0.1, 20)], -220.0, 0),
+    "inexact_null_fraction": (1234, 123456.0, 90, [(0.3, 8), (0.3, 7)], 50.08103727714749, 5062656),
+}
+
+
+def evaluate(records, rules, unused_index_oids=None):
+    analyzer = IndexAnalyzer(make_snapshot(records), unused_index_oids=unused_index_oids)
+    return analyzer, [(rule, record.index_name, related) for rule, record, related in analyzer.evaluate(rules)]
+
+
+def related_names(matches):
+    return [(rule, name, related.index_name if related is not None else None) for rule, name, related in matches]
+
+
+def statistics(column_stats):
+    return tuple(IndexColumn(f"c{position}", False, null_frac, avg_width)
+                 for position, (null_frac, avg_width) in enumerate(column_stats, 1))
+
+
+def test_unused_skips_primary_and_unique_keys():
+    _, matches = evaluate([
+        make_record(1, index_name="idle"),
+        make_record(2, index_name="scanned", index_scans=3),
+        make_record(3, index_name="pkey", is_primary=True),
+        make_record(4, index_name="unique_key", is_unique=True),
+    ], ("unused",))
+    assert matches == [("unused", "idle", None)]
+
+
+def test_invalid_reports_invalid_indexes_whatever_their_usage():
+    _, matches = evaluate([
+        make_record(1, index_name="valid"),
+        make_record(2, index_name="failed_build", is_valid=False, index_scans=5),
+    ], ("invalid",))
+    assert matches == [("invalid", "failed_build", None)]
+
+
+def test_unknown_rules_are_rejected():
+    with pytest.raises(ValueError, match="Unknown rules: missing"):
+        list(IndexAnalyzer(make_snapshot([])).evaluate(("unused", "missing")))
+
+
+@pytest.mark.parametrize("relpages, reltuples, fillfactor, column_stats, bloat_pct, bloat_size",
+                         list(BASELINE_BLOAT.values()), ids=list(BASELINE_BLOAT))
+def test_bloat_estimate_matches_the_baseline_query(relpages, reltuples, fillfactor, column_stats, bloat_pct,
+                                                   bloat_size):
+    record = make_record(1, relpages=relpages, reltuples=reltuples)._replace(fillfactor=fillfactor)
+    assert estimate_btree_bloat(record, statistics(column_stats), 8192, 8) == (pytest.approx(bloat_pct), bloat_size)
+
+
+def test_bloat_estimate_needs_statistics_and_pages():
+    assert estimate_btree_bloat(make_record(1, relpages=60), (), 8192, 8) is None
+    assert estimate_btree_bloat(make_record(1, relpages=0), statistics([(0.0, 4)]), 8192, 8) is None
+
+
+def test_bloat_rule_reports_btree_indexes_over_the_threshold():
+    records = [make_record(1, index_name="bloated", relpages=60, reltuples=10000.0),
+               make_record(2, index_name="compact", relpages=29, reltuples=7000.0),
+               make_record(3, index_name="hash", index_type="hash", relpages=60, reltuples=10000.0)]
+    columns = {index_oid: statistics([(0.0, 4)]) for index_oid in (1, 2, 3)}
+    analyzer = IndexAnalyzer(make_snapshot(records, columns))
+    assert [(record.index_name, round(bloat_pct, 1), bloat_bytes)
+            for record, bloat_pct, bloat_bytes in analyzer.bloated_indexes(50)] == [("bloated", 51.7, 253952)]
+
+
+def test_signature_matches_identical_indexes_only():
+    index = make_record(1, column_numbers=(1, 2))
+    assert index_signature(index) == index_signature(make_record(2, column_numbers=(1, 2)))
+    assert index_signature(index) != index_signature(make_record(3, column_numbers=(2, 1)))
+    assert index_signature(index) != index_signature(make_record(4, column_numbers=(1, 2), predicate="(c1 > 0)"))
+    assert index_signature(index) != index_signature(
+        make_record(5, column_numbers=(1, 2), operator_classes=(1978, BTREE_TEXT_OPCLASS)))
+    assert index_signature(index) != index_signature(make_record(6, column_numbers=(1, 2), table_oid=200))
+    assert index_signature(index) != index_signature(make_record(7, column_numbers=(1, 2), key_column_count=1))
+
+
+def test_duplicate_keeps_the_most_scanned_index():
+    _, matches = evaluate([
+        make_record(1, index_name="rarely_used", column_numbers=(2,), index_scans=1),
+        make_record(2, index_name="often_used", column_numbers=(2,), index_scans=50),
+        make_record(3, index_name="other", column_numbers=(3,)),
+    ], ("duplicate",))
+    assert related_names(matches) == [("duplicate", "rarely_used", "often_used")]
+
+
+def test_duplicate_of_primary_key_keeps_the_primary_key():
+    _, matches = evaluate([
+        make_record(1, index_name="unique_copy", is_unique=True, index_scans=100),
+        make_record(2, index_name="pkey", is_primary=True, index_scans=0),
+    ], ("duplicate_unique", "duplicate"))
+    assert related_names(matches) == [("duplicate_unique", "unique_copy", "pkey")]
+
+
+def test_duplicate_ignores_invalid_indexes_and_uniqueness_mismatch():
+    _, matches = evaluate([
+        make_record(1, column_numbers=(2,)),
+        make_record(2, column_numbers=(2,), is_valid=False),
+        make_record(3, column_numbers=(2,), is_unique=True),
+    ], ("duplicate", "duplicate_unique"))
+    assert matches == []
+
+
+def test_prefix_trie_finds_strict_extensions_only():
+    short = make_record(1, column_numbers=(1,))
+    long = make_record(2, column_numbers=(1, 2))
+    trie = PrefixTrie()
+    for record in (short, long):
+        trie.insert(key_path(record), record)
+    assert trie.find_extending(key_path(short)) is long
+    assert trie.find_extending(key_path(long)) is None
+    assert trie.find_extending(key_path(make_record(3, column_numbers=(2,)))) is None
+
+
+def test_redundant_reports_unused_left_prefix():
+    _, matches = evaluate([
+        make_record(1, index_name="c1", column_numbers=(1,), index_scans=0),
+        make_record(2, index_name="c1_c2", column_numbers=(1, 2), index_scans=10),
+    ], ("redundant",))
+    assert related_names(matches) == [("redundant", "c1", "c1_c2")]
+
+
+def test_redundant_requires_unused_plain_btree_with_matching_key():
+    records = [
+        make_record(1, index_name="used", column_numbers=(1,), index_scans=5),
+        make_record(2, index_name="unique", column_numbers=(1,), is_unique=True),
+        make_record(3, index_name="other_opclass", column_numbers=(2,), operator_classes=(BTREE_TEXT_OPCLASS,)),
+        make_record(4, index_name="partial", column_numbers=(1,), predicate="(c3 > 0)"),
+        make_record(5, index_name="hash", column_numbers=(1,), index_type="hash"),
+        make_record(6, index_name="covering", column_numbers=(1, 2), index_scans=10),
+    ]
+    _, matches = evaluate(records, ("redundant",))
+    assert matches == []
+
+
+def test_unused_follows_the_usage_window_when_given():
+    records = [make_record(1, index_scans=0), make_record(2, index_scans=7)]
+    _, matches = evaluate(records, ("unused",), unused_index_oids={2})
+    assert [name for _, name, _ in matches] == ["i2"]
+
+
+def partitioned_table(parent_index_oid, table_oid, partitions, scans, first_index_oid, column_numbers=(1,),
+                      index_name=None):
+    """Returns a partitioned index and one attached index per partition with the given scans."""
+    records = [make_record(parent_index_oid, table_oid=table_oid, index_name=index_name, column_numbers=column_numbers,
+                           is_partitioned=True)]
+    for position in range(partitions):
+        records.append(make_record(first_index_oid + position, table_oid=table_oid + 1 + position,
+                                   column_numbers=column_numbers, index_scans=scans[position],
+                                   index_size_bytes=1000, parent_index_oid=parent_index_oid))
+    return records
+
+
+def test_partitioned_index_is_unused_only_when_every_partition_is():
+    records = (partitioned_table(10, 1000, 3, [0, 0, 0], 100, index_name="idle")
+               + partitioned_table(20, 2000, 3, [0, 4, 0], 200, index_name="busy", column_numbers=(2,)))
+    analyzer, matches = evaluate(records, ("unused",))
+    assert [name for _, name, _ in matches] == ["idle"]
+    rolled_up = [record for _, record, _ in analyzer.evaluate(("unused",))][0]
+    assert rolled_up.index_size_bytes == 3000
+    assert rolled_up.index_scans == 0
+    assert analyzer.partition_counts == {10: 3, 20: 3}
+
+
+def test_partitioned_index_sums_scans_for_the_duplicate_winner():
+    records = (partitioned_table(10, 1000, 2, [1, 1], 100, index_name="less_used")
+               + partitioned_table(20, 1000, 2, [5, 5], 200, index_name="more_used"))
+    records = [record._replace(table_oid=1000 + (record.index_oid % 100) + 1) if record.parent_index_oid else record
+               for record in records]
+    _, matches = evaluate(records, ("duplicate",))
+    assert related_names(matches) == [("duplicate", "less_used", "more_used")]
+
+
+def test_attached_indexes_are_never_reported_but_local_duplicates_are():
+    records = partitioned_table(10, 1000, 2, [0, 0], 100, column_numbers=(2,))
+    records.append(make_record(300, table_oid=1001, index_name="local_copy", column_numbers=(2,), index_scans=9))
+    _, matches = evaluate(records, ("unused", "duplicate", "redundant"))
+    assert related_names(matches) == [("duplicate", "local_copy", "i100"), ("unused", "i10", None)]
+
+
+def test_sub_partitions_roll_up_to_the_top_partitioned_index():
+    records = [
+        make_record(10, table_oid=1000, is_partitioned=True),
+        make_record(11, table_oid=1001, is_partitioned=True, parent_index_oid=10),
+        make_record(12, table_oid=1002, parent_index_oid=11, index_size_bytes=500),
+        make_record(13, table_oid=1003, parent_index_oid=11, index_size_bytes=700),
+        make_record(14, table_oid=1004, parent_index_oid=10, index_size_bytes=300),
+    ]
+    analyzer, matches = evaluate(records, ("unused",))
+    assert [name for _, name, _ in matches] == ["i10"]
+    assert [record.index_size_bytes for _, record, _ in analyzer.evaluate(("unused",))] == [1500]
+    assert analyzer.partition_counts[10] == 3
+
+
+def test_partitioned_index_without_partitions_is_not_unused():
+    _, matches = evaluate([make_record(10, table_oid=1000, is_partitioned=True)], ("unused",))
+    assert matches == []
+
+
+def test_subset_keeps_the_whole_partition_hierarchy():
+    snapshot = make_snapshot(partitioned_table(10, 1000, 3, [0, 0, 0], 100) + [make_record(1, table_oid=50)])
+    assert set(snapshot.subset({1002}).indexes) == {10, 100, 101, 102}
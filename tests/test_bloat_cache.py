@@ -0,0 +1,68 @@
+import json
+from datetime import timedelta
+from pg_index_insight.bloat_cache import CACHE_FORMAT_VERSION, BloatCache
+from .conftest import make_record
+
+ESTIMATE = (81920, 40960, 50.0)
+
+
+def test_entry_is_reused_while_its_inputs_are_unchanged(tmp_path, analyzed_at):
+    cache = BloatCache(str(tmp_path / "cache.json"))
+    record = make_record(1, relpages=10, table_last_analyzed=analyzed_at)
+    assert cache.get(record) == (False, None)
+    cache.put(record, ESTIMATE)
+    assert cache.get(record) == (True, ESTIMATE)
+    assert (cache.hits, cache.misses, cache.hit_rate) == (1, 1, 0.5)
+
+
+def test_entry_is_invalidated_by_any_estimate_input(tmp_path, analyzed_at):
+    cache = BloatCache(str(tmp_path / "cache.json"))
+    record = make_record(1, relpages=10, table_last_analyzed=analyzed_at)
+    cache.put(record, ESTIMATE)
+    assert not cache.contains(record._replace(relfilenode=99))
+    assert not cache.contains(record._replace(relpages=11))
+    assert not cache.contains(record._replace(reltuples=101.0))
+    assert not cache.contains(record._replace(fillfactor=70))
+    assert not cache.contains(record._replace(table_last_analyzed=analyzed_at + timedelta(hours=1)))
+    assert cache.contains(record)
+
+
+def test_unestimable_indexes_are_cached_too(tmp_path):
+    cache = BloatCache(str(tmp_path / "cache.json"))
+    record = make_record(1)
+    cache.put(record, None)
+    assert cache.get(record) == (True, None)
+
+
+def test_evicts_dropped_and_rewritten_indexes(tmp_path):
+    cache = BloatCache(str(tmp_path / "cache.json"))
+    for index_oid in (1, 2, 3):
+        cache.put(make_record(index_oid), ESTIMATE)
+    cache.evict_missing({1: 1, 2: 20})
+    assert cache.contains(make_record(1))
+    assert not cache.contains(make_record(2))
+    assert not cache.contains(make_record(3))
+    assert cache.evicted == 2
+
+
+def test_saved_entries_survive_a_reload(tmp_path, analyzed_at):
+    path = str(tmp_path / "cache.json")
+    record = make_record(1, table_last_analyzed=analyzed_at)
+    cache = BloatCache(path)
+    cache.put(record, ESTIMATE)
+    cache.save()
+    assert BloatCache(path).get(record) == (True, ESTIMATE)
+
+
+def test_other_format_versions_and_corrupt_files_start_empty(tmp_path):
+    path = tmp_path / "cache.json"
+    record = make_record(1)
+    cache = BloatCache(str(path))
+    cache.put(record, ESTIMATE)
+    cache.save()
+    saved = json.loads(path.read_text())
+    saved["version"] = CACHE_FORMAT_VERSION + 1
+    path.write_text(json.dumps(saved))
+    assert not BloatCache(str(path)).contains(record)
+    path.write_text("{not json")
+    assert not BloatCache(str(path)).contains(record)
@@ -0,0 +1,73 @@
+from pg_index_insight.costs import ActionEstimate, ActionSizes, RemediationCostModel, ThroughputHistory
+
+MB = 1024 * 1024
+
+
+def action(table, index_oid, duration, reclaimable_bytes, wal_bytes=0):
+    return ActionEstimate(table, f"REINDEX INDEX CONCURRENTLY i{index_oid};", "REINDEX", index_oid, duration,
+                          wal_bytes, 0, wal_bytes, reclaimable_bytes, False)
+
+
+def summary(planned):
+    return [(entry.estimate.index_oid, entry.worker, entry.start, entry.status) for entry in planned]
+
+
+def test_plan_keeps_a_table_on_one_worker():
+    planned = RemediationCostModel.plan([
+        action("public.orders", 1, 10.0, 1000),
+        action("public.orders", 2, 10.0, 900),
+        action("public.users", 3, 10.0, 800),
+    ], window_seconds=100)
+    assert summary(planned) == [(1, 0, 0.0, "planned"), (3, 1, 0.0, "planned"), (2, 0, 10.0, "planned")]
+
+
+def test_plan_defers_statements_past_the_window():
+    planned = RemediationCostModel.plan([
+        action("public.orders", 1, 60.0, 6000),
+        action("public.orders", 2, 60.0, 3000),
+        action("public.users", 3, 500.0, 100000),
+    ], window_seconds=100, workers=1)
+    assert summary(planned) == [(1, 0, 0.0, "planned"), (3, None, None, "over window"),
+                                (2, None, None, "over window")]
+
+
+def test_plan_defers_statements_over_the_wal_budget():
+    planned = RemediationCostModel.plan([
+        action("public.orders", 1, 1.0, 3000, wal_bytes=80 * MB),
+        action("public.users", 2, 1.0, 2000, wal_bytes=30 * MB),
+        action("public.items", 3, 1.0, 1000, wal_bytes=20 * MB),
+    ], window_seconds=100, wal_budget=100 * MB)
+    assert [entry.status for entry in planned] == ["planned", "planned", "over WAL budget"]
+    assert [entry.estimate.index_oid for entry in planned] == [1, 3, 2]
+
+
+def test_reindex_estimate_spills_to_temp_files_beyond_maintenance_work_mem():
+    model = RemediationCostModel("db1:5432")
+    sizes = ActionSizes(1, 100 * MB, 400 * MB, 1000000.0, 64 * MB)
+    estimate = model.estimate("public.orders", "REINDEX INDEX CONCURRENTLY public.i1;", sizes, 40 * MB)
+    assert estimate.wal_bytes == 60 * MB
+    assert estimate.temp_bytes == 60 * MB + 1000000 * RemediationCostModel.SORT_TUPLE_OVERHEAD
+    assert estimate.disk_bytes == estimate.wal_bytes + estimate.temp_bytes
+    assert estimate.duration == 900 * MB / RemediationCostModel.DEFAULT_REINDEX_THROUGHPUT
+    assert not estimate.measured
+    fits = model.estimate("public.orders", "REINDEX INDEX CONCURRENTLY public.i1;", sizes._replace(
+        maintenance_work_mem_bytes=1024 * MB), 40 * MB)
+    assert fits.temp_bytes == 0
+
+
+def test_estimates_use_the_measured_throughput_of_the_host(tmp_path):
+    history = ThroughputHistory.for_directory(str(tmp_path))
+    try:
+        history.record("db1:5432", "REINDEX", 100 * MB, 10.0, executed_at=1)
+        history.record("db1:5432", "REINDEX", 300 * MB, 10.0, executed_at=2)
+        history.record("db1:5432", "DROP", 0, 4.0, executed_at=3)
+        history.record("db2:5432", "DROP", 0, 99.0, executed_at=4)
+        model = RemediationCostModel("db1:5432", history)
+    finally:
+        history.close()
+    sizes = ActionSizes(1, 100 * MB, 400 * MB, 0.0, 1024 * MB)
+    reindex = model.estimate("public.orders", "REINDEX INDEX CONCURRENTLY public.i1;", sizes, 0)
+    drop = model.estimate("public.orders", "DROP INDEX CONCURRENTLY public.i1;", sizes, 100 * MB)
+    assert reindex.measured and reindex.duration == 900 * MB / (20 * MB)
+    assert drop.measured and drop.duration == 4.0
+    assert (drop.wal_bytes, drop.temp_bytes, drop.disk_bytes, drop.reclaimable_bytes) == (0, 0, 0, 100 * MB)
@@ -0,0 +1,159 @@
+import json
+import logging
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+import psycopg2.errors
+import pytest
+from pg_index_insight import executor as executor_module
+from pg_index_insight.executor import RemediationExecutor, RemediationTask
+from pg_index_insight.queries import SqlQueries
+
+DROP = "DROP INDEX CONCURRENTLY public.orders_email_idx;"
+REINDEX = "REINDEX INDEX CONCURRENTLY public.orders_total_idx;"
+
+
+class FakeConnection:
+    """
+    Records the statements run on it.
+
+    failures maps a statement to the exceptions its next runs raise, and builds lists
+    the invalid _ccnew indexes returned by the successive leftover build queries.
+    """
+
+    def __init__(self, failures=None, builds=None):
+        self.failures = {statement: list(errors) for statement, errors in (failures or {}).items()}
+        self.builds = list(builds or [])
+        self.executed = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, statement, parameters=None):
+        if statement == SqlQueries.get_invalid_reindex_builds():
+            self.rows = list(self.connection.builds.pop(0).items())
+            return
+        self.connection.executed.append(statement)
+        if self.connection.failures.get(statement):
+            raise self.connection.failures[statement].pop(0)
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeManager:
+    logger = logging.getLogger("pgindexinsight.tests")
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    @contextmanager
+    def pooled_connection(self):
+        yield self.connection
+
+
+def statements(connection):
+    return [statement for statement in connection.executed if "statement_timeout" not in statement]
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(executor_module, "time", SimpleNamespace(monotonic=time.monotonic, sleep=slept.append))
+    monkeypatch.setattr(executor_module, "random", SimpleNamespace(uniform=lambda low, high: high))
+    return slept
+
+
+def lock_timeout():
+    return psycopg2.errors.LockNotAvailable("canceling statement due to lock timeout")
+
+
+def test_lock_timeouts_are_retried_with_a_capped_exponential_backoff(sleeps):
+    connection = FakeConnection(failures={DROP: [lock_timeout(), lock_timeout(), lock_timeout()]})
+    executor = RemediationExecutor(FakeManager(connection), backoff=2.0, max_backoff=5.0)
+    [result] = executor.run([RemediationTask("public.orders", DROP)])
+    assert (result.status, result.attempts) == ("done", 4)
+    assert sleeps == [2.0, 4.0, 5.0]
+    assert statements(connection) == [DROP] * 4
+
+
+def test_statement_fails_after_its_last_retry(sleeps):
+    connection = FakeConnection(failures={DROP: [lock_timeout() for _ in range(3)]})
+    executor = RemediationExecutor(FakeManager(connection), max_retries=2)
+    [result] = executor.run([RemediationTask("public.orders", DROP)])
+    assert (result.status, result.attempts) == ("failed", 3)
+    assert "lock timeout" in result.error
+    assert len(sleeps) == 2
+
+
+def test_other_errors_are_not_retried(sleeps):
+    connection = FakeConnection(failures={DROP: [psycopg2.errors.InsufficientPrivilege("must be owner")]})
+    [result] = RemediationExecutor(FakeManager(connection)).run([RemediationTask("public.orders", DROP)])
+    assert (result.status, result.attempts, result.error) == ("failed", 1, "must be owner")
+    assert sleeps == []
+
+
+def test_checkpoint_skips_done_statements_on_resume(tmp_path):
+    checkpoint_path = str(tmp_path / "checkpoint.jsonl")
+    with open(checkpoint_path, "w") as checkpoint:
+        checkpoint.write(json.dumps({"statement": DROP, "status": "done"}) + "\n")
+        checkpoint.write(json.dumps({"statement": REINDEX, "status": "failed"}) + "\n")
+        checkpoint.write("{torn line\n")
+    connection = FakeConnection()
+    executor = RemediationExecutor(FakeManager(connection), checkpoint_path=checkpoint_path)
+    results = executor.run([RemediationTask("public.orders", DROP), RemediationTask("public.orders", REINDEX)])
+    assert [(result.statement, result.status) for result in results] == [(DROP, "skipped"), (REINDEX, "done")]
+    assert statements(connection) == [REINDEX]
+    assert executor.completed_statements() == {DROP, REINDEX}
+
+
+@pytest.mark.parametrize("statement", [
+    "DROP INDEX CONCURRENTLY public.orders_email_idx; DROP TABLE public.orders;",
+    "DROP INDEX CONCURRENTLY public.orders_email_idx; --",
+    "DROP INDEX public.orders_email_idx;",
+    "REINDEX TABLE CONCURRENTLY public.orders;",
+])
+def test_anything_but_one_concurrent_drop_or_rebuild_is_rejected(statement):
+    connection = FakeConnection()
+    [result] = RemediationExecutor(FakeManager(connection)).run([RemediationTask("public.orders", statement)])
+    assert (result.status, result.attempts) == ("rejected", 0)
+    assert statements(connection) == []
+
+
+def test_quoted_names_with_semicolons_are_run():
+    statement = 'DROP INDEX CONCURRENTLY "Sales"."orders;email ""idx""";'
+    connection = FakeConnection()
+    [result] = RemediationExecutor(FakeManager(connection)).run([RemediationTask('"Sales".orders', statement)])
+    assert result.status == "done"
+    assert statements(connection) == [statement]
+
+
+def test_failed_reindex_drops_only_the_build_it_left(sleeps):
+    earlier_build = {400: "DROP INDEX CONCURRENTLY public.orders_total_idx_ccnew;"}
+    left_build = {501: "DROP INDEX CONCURRENTLY public.orders_total_idx_ccnew1;"}
+    connection = FakeConnection(
+        failures={REINDEX: [lock_timeout()]},
+        builds=[earlier_build, {**earlier_build, **left_build}, earlier_build])
+    [result] = RemediationExecutor(FakeManager(connection)).run(
+        [RemediationTask("public.orders", REINDEX, index_oid=300)])
+    assert (result.status, result.attempts) == ("done", 2)
+    assert statements(connection) == [REINDEX, left_build[501], REINDEX]
+
+
+def test_drops_are_not_checked_for_leftover_builds():
+    connection = FakeConnection()
+    [result] = RemediationExecutor(FakeManager(connection)).run(
+        [RemediationTask("public.orders", DROP, index_oid=300)])
+    assert (result.status, statements(connection)) == ("done", [DROP])
@@ -0,0 +1,73 @@
+from datetime import timedelta
+import pytest
+from pg_index_insight.history import DAY, HOUR, UsageHistory
+
+START = 1767268800  # 2026-01-01 12:00 UTC, on an hour boundary
+
+
+@pytest.fixture
+def history(tmp_path):
+    usage_history = UsageHistory(str(tmp_path / "history.sqlite"))
+    yield usage_history
+    usage_history.close()
+
+
+def usage_rows(history):
+    return history.connection.execute(
+        "SELECT index_oid, bucket_start, resolution, scans FROM index_usage ORDER BY index_oid, bucket_start").fetchall()
+
+
+def reasons(history):
+    return [row[0] for row in history.connection.execute("SELECT reason FROM stats_resets ORDER BY detected_at")]
+
+
+def test_stores_increases_in_hourly_buckets(history, analyzed_at):
+    assert history.record([(1, 10), (2, 5)], analyzed_at, START) == 2
+    history.record([(1, 15), (2, 5)], analyzed_at, START + 600)
+    history.record([(1, 18), (2, 5)], analyzed_at, START + HOUR + 60)
+    assert usage_rows(history) == [(1, START, HOUR, 5), (1, START + HOUR, HOUR, 3)]
+    assert history.resets_detected == 0
+
+
+def test_decreased_counter_is_a_reset(history, analyzed_at):
+    history.record([(1, 100), (2, 50)], analyzed_at, START)
+    history.record([(1, 4), (2, 60)], analyzed_at, START + 600)
+    assert usage_rows(history) == [(1, START, HOUR, 4), (2, START, HOUR, 10)]
+    assert history.resets_detected == 1
+    assert reasons(history) == ["1 counter(s) decreased"]
+
+
+def test_new_stats_reset_time_takes_counters_as_increases(history, analyzed_at):
+    history.record([(1, 100), (2, 50)], analyzed_at, START)
+    history.record([(1, 120), (2, 50)], analyzed_at + timedelta(minutes=5), START + 600)
+    assert usage_rows(history) == [(1, START, HOUR, 120), (2, START, HOUR, 50)]
+    assert history.resets_detected == 1
+    assert reasons(history) == ["stats_reset changed"]
+
+
+def test_dropped_indexes_are_forgotten(history, analyzed_at):
+    history.record([(1, 0), (2, 0)], analyzed_at, START)
+    history.record([(1, 0)], analyzed_at, START + HOUR)
+    assert [row[0] for row in history.connection.execute("SELECT index_oid FROM index_counters")] == [1]
+
+
+def test_unused_requires_samples_covering_the_whole_window(history, analyzed_at):
+    history.record([(1, 0), (2, 0)], analyzed_at, START)
+    history.record([(1, 0), (2, 3), (3, 0)], analyzed_at, START + 5 * DAY)
+    history.record([(1, 0), (2, 3), (3, 0)], analyzed_at, START + 10 * DAY)
+    assert history.unused_index_oids(7, now=START + 10 * DAY) == {1}
+    assert history.unused_index_oids(4, now=START + 10 * DAY) == {1, 2, 3}
+    assert history.unused_index_oids(14, now=START + 10 * DAY) == set()
+
+
+def test_compact_merges_old_hours_into_days_and_drops_expired_buckets(history, analyzed_at):
+    history.record([(1, 0)], analyzed_at, START)
+    for hour, scans in enumerate((2, 5, 9), start=1):
+        history.record([(1, scans)], analyzed_at, START + hour * HOUR)
+    history.record([(1, 10)], analyzed_at, START + 20 * DAY)
+    merged, dropped = history.compact(hourly_retention_days=7, retention_days=400, now=START + 20 * DAY)
+    day_start = START // DAY * DAY
+    assert (merged, dropped) == (3, 0)
+    assert usage_rows(history) == [(1, day_start, DAY, 9), (1, START + 20 * DAY, HOUR, 1)]
+    assert history.compact(hourly_retention_days=7, retention_days=10, now=START + 20 * DAY) == (0, 1)
+    assert usage_rows(history) == [(1, START + 20 * DAY, HOUR, 1)]
@@ -0,0 +1,70 @@
+import csv
+import json
+import sys
+import pytest
+from pg_index_insight.sinks import DEFAULT_REPORT_HEADERS, open_sink
+
+HEADERS = ["Index Name", "Index Size Bytes", "Category"]
+ROWS = [["i1", 8192, "Unused Index"], ["i2", None, "Invalid, \"Bloated\""], ["i3", 16384, "Duplicate Index"]]
+
+
+def export(tmp_path, export_format, rows=ROWS, batch_size=2):
+    with open_sink(export_format, "app", report_name="report", filename="indexes", report_path=f"{tmp_path}/",
+                   headers=HEADERS, batch_size=batch_size) as sink:
+        for row in rows:
+            sink.write(row)
+    assert sink.row_count == len(rows)
+    return sink.path
+
+
+def test_json_report_document(tmp_path):
+    with open(export(tmp_path, "json")) as report:
+        document = json.load(report)
+    assert document == {
+        "report_name": "report",
+        "database_name": "app",
+        "indexes": [dict(zip(HEADERS, row)) for row in ROWS],
+        "total_index_count": 3,
+    }
+
+
+def test_empty_json_report_is_valid(tmp_path):
+    with open(export(tmp_path, "json", rows=[])) as report:
+        assert json.load(report)["indexes"] == []
+
+
+def test_ndjson_writes_one_object_per_line(tmp_path):
+    with open(export(tmp_path, "ndjson")) as report:
+        assert [json.loads(line) for line in report] == [dict(zip(HEADERS, row)) for row in ROWS]
+
+
+def test_csv_writes_the_header_then_quoted_rows(tmp_path):
+    with open(export(tmp_path, "csv"), newline='') as report:
+        assert list(csv.reader(report)) == [HEADERS] + [["" if value is None else str(value) for value in row]
+                                                        for row in ROWS]
+
+
+def test_parquet_keeps_column_types_over_row_groups(tmp_path):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    report = parquet.ParquetFile(export(tmp_path, "parquet"))
+    assert report.metadata.num_row_groups == 2
+    assert report.read().to_pydict() == {header: [row[position] for row in ROWS]
+                                         for position, header in enumerate(HEADERS)}
+
+
+def test_parquet_without_pyarrow_asks_to_install_it(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+    with pytest.raises(ValueError, match="requires pyarrow"):
+        export(tmp_path, "parquet")
+
+
+def test_unknown_format_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="Unknown export format"):
+        export(tmp_path, "xml")
+
+
+def test_headers_default_to_the_report_columns(tmp_path):
+    with open_sink("ndjson", "app", report_path=f"{tmp_path}/") as sink:
+        sink.write(["app", "public", "i1", "btree", "8192 bytes", "Unused Index"])
+    with open(sink.path) as report:
+        assert list(json.loads(report.readline())) == DEFAULT_REPORT_HEADERS
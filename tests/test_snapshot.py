@@ -0,0 +1,74 @@
+import threading
+from concurrent.futures import Future
+from pg_index_insight.snapshot import ColumnStatsChunks, FailedChunk, IndexColumn
+from .conftest import make_record
+
+
+class FakeReader:
+    """Answers every table oid range query at once, failing the ranges that contain a table of failing_tables."""
+
+    def __init__(self, failing_tables=(), failures_per_table=None):
+        self.failing_tables = set(failing_tables)
+        self.failures_per_table = failures_per_table
+        self.timed_out = threading.Event()
+        self.ranges = []
+
+    def submit(self, name, query, params):
+        first_table_oid, last_table_oid = params
+        self.ranges.append((first_table_oid, last_table_oid))
+        future = Future()
+        failing = [table_oid for table_oid in self.failing_tables if first_table_oid <= table_oid <= last_table_oid]
+        if failing:
+            if self.failures_per_table is not None:
+                self.failures_per_table -= 1
+                if self.failures_per_table == 0:
+                    self.failing_tables.clear()
+            future.set_exception(RuntimeError("canceling statement due to statement timeout\n"))
+        else:
+            future.set_result([(table_oid * 10, table_oid, "c1", False, 0.0, 4)
+                               for table_oid in range(first_table_oid, last_table_oid + 1)])
+        return future
+
+
+def read_chunks(reader, table_oids, chunk_size=4, max_attempts=3):
+    progress = []
+    chunks = ColumnStatsChunks(reader, chunk_size=chunk_size, max_attempts=max_attempts,
+                               on_chunk=lambda *counts: progress.append(counts))
+    for table_oid in table_oids:
+        chunks.add(table_oid, [make_record(table_oid * 10, table_oid=table_oid),
+                               make_record(table_oid * 10 + 1, table_oid=table_oid, index_type="hash"),
+                               make_record(table_oid * 10 + 2, table_oid=table_oid, relpages=0)])
+    return chunks, chunks.finish(), progress
+
+
+def test_chunks_cover_tables_in_ranges_of_chunk_size_indexes():
+    reader = FakeReader()
+    chunks, columns, progress = read_chunks(reader, range(10, 20))
+    assert reader.ranges == [(10, 13), (14, 17), (18, 19)]
+    assert columns == {table_oid * 10: (IndexColumn("c1", False, 0.0, 4),) for table_oid in range(10, 20)}
+    assert (chunks.failed, progress[-1]) == ([], (3, 3, 0))
+
+
+def test_failing_chunk_is_halved_until_only_its_failing_table_is_left():
+    reader = FakeReader(failing_tables={12})
+    chunks, columns, progress = read_chunks(reader, range(10, 18))
+    assert sorted(reader.ranges) == [(10, 11), (10, 13), (12, 12), (12, 13), (13, 13), (14, 17)]
+    assert chunks.failed == [FailedChunk(12, 12, [120], "canceling statement due to statement timeout")]
+    assert set(columns) == {table_oid * 10 for table_oid in range(10, 18)} - {120}
+    assert progress[-1] == (6, 6, 1)
+
+
+def test_chunk_failing_once_is_read_again_in_halves():
+    reader = FakeReader(failing_tables={11}, failures_per_table=1)
+    chunks, columns, _ = read_chunks(reader, range(10, 14))
+    assert reader.ranges == [(10, 13), (10, 11), (12, 13)]
+    assert (chunks.failed, len(columns)) == ([], 4)
+
+
+def test_chunks_are_not_retried_after_the_query_timeout():
+    reader = FakeReader(failing_tables={12})
+    reader.timed_out.set()
+    chunks, columns, _ = read_chunks(reader, range(10, 14))
+    assert reader.ranges == [(10, 13)]
+    assert chunks.failed == [FailedChunk(10, 13, [100, 110, 120, 130], "canceling statement due to statement timeout")]
+    assert columns == {}
@@ -0,0 +1,78 @@
+import struct
+from datetime import datetime, timedelta, timezone
+import pytest
+from pg_index_insight.snapshot import IndexColumn
+from pg_index_insight.snapshot_file import SNAPSHOT_FORMAT_VERSION, SNAPSHOT_MAGIC, SnapshotFile
+from .conftest import make_record, make_snapshot
+
+CONFIG = {"name": "orders", "host": "db1", "port": 5432, "dbname": "shop", "user": "app", "password": "secret"}
+FACTS = {"is_replica": False, "server_version": 160002}
+
+
+def sample_snapshot(analyzed_at):
+    records = [
+        make_record(1, index_name="orders_pkey", is_primary=True, index_scans=42, table_last_analyzed=analyzed_at),
+        make_record(2, index_name="orders_lower_email_idx", column_numbers=(0,), expressions="lower(email)",
+                    predicate="(deleted_at IS NULL)", index_scans=None,
+                    table_last_analyzed=analyzed_at.astimezone(timezone(timedelta(hours=-5)))),
+        make_record(3, table_oid=200, index_name="bestellungen_größe_idx", column_numbers=(), reltuples=-1.0,
+                    is_partitioned=True),
+        make_record(4, table_oid=201, index_name="bestellungen_p1_größe_idx", column_numbers=(2, 3),
+                    parent_index_oid=3, index_size_bytes=2 ** 40),
+    ]
+    columns = {
+        1: (IndexColumn("id", False, 0.0, 8),),
+        4: (IndexColumn("größe", False, 0.25, 4), IndexColumn("name", True, 0.0, 64)),
+    }
+    return make_snapshot(records, columns)
+
+
+def test_round_trip_keeps_every_record_and_column(tmp_path, analyzed_at):
+    snapshot = sample_snapshot(analyzed_at)
+    path = str(tmp_path / "orders.pgisnap")
+    size = SnapshotFile.write(path, snapshot, CONFIG, FACTS)
+    assert size == (tmp_path / "orders.pgisnap").stat().st_size
+    with SnapshotFile(path) as snapshot_file:
+        loaded = snapshot_file.load()
+        assert snapshot_file.facts == FACTS
+        assert snapshot_file.database == {"name": "orders", "host": "db1", "port": 5432, "dbname": "shop"}
+    assert list(loaded.indexes) == list(snapshot.indexes)
+    for index_oid, record in snapshot.indexes.items():
+        assert loaded.indexes[index_oid] == record
+    assert loaded.indexes[2].table_last_analyzed.utcoffset() == timedelta(hours=-5)
+    assert loaded.columns == snapshot.columns
+    assert (loaded.block_size, loaded.max_align) == (8192, 8)
+
+
+def test_round_trip_of_an_empty_snapshot(tmp_path):
+    path = str(tmp_path / "empty.pgisnap")
+    SnapshotFile.write(path, make_snapshot([]), CONFIG, FACTS)
+    with SnapshotFile(path) as snapshot_file:
+        loaded = snapshot_file.load()
+    assert loaded.indexes == {}
+    assert loaded.columns == {}
+
+
+def test_describe_reads_the_directory(tmp_path, analyzed_at):
+    path = str(tmp_path / "orders.pgisnap")
+    SnapshotFile.write(path, sample_snapshot(analyzed_at), CONFIG, FACTS)
+    with SnapshotFile(path) as snapshot_file:
+        assert snapshot_file.describe().startswith("orders (shop on db1), 4 indexes, taken ")
+
+
+def test_rejects_files_that_are_not_snapshots(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_bytes(b"not a snapshot file at all")
+    with pytest.raises(ValueError, match="not a pgindexinsight snapshot"):
+        SnapshotFile(str(path))
+
+
+def test_rejects_other_format_versions(tmp_path, analyzed_at):
+    path = tmp_path / "orders.pgisnap"
+    SnapshotFile.write(str(path), sample_snapshot(analyzed_at), CONFIG, FACTS)
+    data = bytearray(path.read_bytes())
+    struct.pack_into(">8sI", data, 0, SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION + 1)
+    path.write_bytes(bytes(data))
+    with pytest.raises(ValueError, match="snapshot format"):
+        SnapshotFile(str(path))
+
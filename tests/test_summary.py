@@ -0,0 +1,28 @@
+from pg_index_insight.summary import ReclaimableSummary
+
+
+def result(index_oid, category="unused", reclaimable_bytes=100, database_name="app", config_name=None):
+    item = {"database_name": database_name, "schema_name": "public", "table_name": "orders", "index_oid": index_oid,
+            "category": category, "reclaimable_bytes": reclaimable_bytes}
+    if config_name is not None:
+        item["config_name"] = config_name
+    return item
+
+
+def test_index_in_several_categories_counts_once_with_its_largest_size():
+    summary = ReclaimableSummary()
+    summary.add(result(1, "unused", 100))
+    summary.add(result(1, "bloat", 40))
+    summary.add(result(1, "duplicate", 150))
+    assert summary.categories == {"unused": [1, 100], "bloat": [1, 40], "duplicate": [1, 150]}
+    assert (summary.index_count, summary.total_bytes) == (1, 150)
+    assert summary.schemas == {("app", "public"): [1, 150]}
+
+
+def test_same_database_name_on_two_hosts_is_totalled_separately():
+    summary = ReclaimableSummary()
+    summary.add(result(1, config_name="primary-a"))
+    summary.add(result(1, config_name="primary-b", reclaimable_bytes=300))
+    assert (summary.index_count, summary.total_bytes) == (2, 400)
+    assert summary.schemas == {("primary-a/app", "public"): [1, 100], ("primary-b/app", "public"): [1, 300]}
+    assert summary.tables[("primary-b/app", "public", "orders")] == [1, 300]
@@ -0,0 +1,114 @@
+import logging
+import threading
+from types import SimpleNamespace
+import psycopg2
+from pg_index_insight import throttle as throttle_module
+from pg_index_insight.throttle import ReplicationThrottle
+
+MB = 1024 * 1024
+
+
+class StatusManager:
+    """Stands in for a DatabaseManager whose connection returns the queued replication statuses."""
+
+    logger = logging.getLogger("pgindexinsight.tests")
+
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+
+    def connect(self):
+        return self
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query):
+        if isinstance(self.statuses[0], Exception):
+            raise self.statuses.pop(0)
+
+    def fetchone(self):
+        return self.statuses.pop(0)
+
+
+def status(replay_lag=0.0, standby_count=1, wal_position=0):
+    return replay_lag, 0, standby_count, wal_position
+
+
+def started_throttle(manager, workers=4, **thresholds):
+    throttle = ReplicationThrottle(manager, **thresholds)
+    throttle.workers = workers
+    throttle.allowed = workers
+    return throttle
+
+
+def test_replay_lag_load_sets_the_allowed_statements():
+    manager = StatusManager(status(10.0), status(30.0), status(60.0), status(90.0, standby_count=0))
+    throttle = started_throttle(manager, max_replay_lag=60)
+    allowed = []
+    for _ in range(4):
+        throttle.check()
+        allowed.append(throttle.allowed)
+    assert allowed == [4, 1, 0, 4]
+
+
+def test_wal_rate_load_sets_the_allowed_statements(monkeypatch):
+    sampled_at = iter([0.0, 1.0, 2.0, 3.0])
+    monkeypatch.setattr(throttle_module, "time", SimpleNamespace(monotonic=lambda: next(sampled_at)))
+    manager = StatusManager(status(wal_position=0), status(wal_position=10 * MB), status(wal_position=50 * MB),
+                            status(wal_position=120 * MB))
+    throttle = started_throttle(manager, max_wal_rate=64 * MB)
+    allowed = []
+    for _ in range(4):
+        throttle.check()
+        allowed.append(throttle.allowed)
+    assert allowed == [4, 4, 1, 0]
+
+
+def test_changes_are_reported():
+    changes = []
+    throttle = started_throttle(StatusManager(status(60.0), status(60.0), status(0.0)), max_replay_lag=60)
+    throttle.on_change = lambda allowed, text: changes.append(allowed)
+    for _ in range(3):
+        throttle.check()
+    assert changes == [0, 4]
+
+
+def test_failed_reads_keep_the_pace_then_run_one_statement_at_a_time():
+    failure = psycopg2.OperationalError("server closed the connection unexpectedly")
+    manager = StatusManager(status(60.0), *[failure] * ReplicationThrottle.MAX_FAILED_CHECKS, status(0.0))
+    throttle = started_throttle(manager, max_replay_lag=60)
+    throttle.check()
+    assert throttle.allowed == 0
+    for _ in range(ReplicationThrottle.MAX_FAILED_CHECKS - 1):
+        throttle.check()
+        assert throttle.allowed == 0
+    throttle.check()
+    assert throttle.allowed == 1
+    throttle.check()
+    assert throttle.allowed == 4
+
+
+def test_fallback_wakes_a_paused_slot():
+    failure = psycopg2.OperationalError("server closed the connection unexpectedly")
+    manager = StatusManager(status(60.0), *[failure] * ReplicationThrottle.MAX_FAILED_CHECKS)
+    throttle = started_throttle(manager, max_replay_lag=60)
+    throttle.check()
+    entered = threading.Event()
+
+    def run_statement():
+        with throttle.slot():
+            entered.set()
+
+    worker = threading.Thread(target=run_statement, daemon=True)
+    worker.start()
+    assert not entered.wait(0.1)
+    for _ in range(ReplicationThrottle.MAX_FAILED_CHECKS):
+        throttle.check()
+    assert entered.wait(5)
+    worker.join(5)
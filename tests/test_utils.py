@@ -0,0 +1,38 @@
+import pytest
+from pg_index_insight.utils import add_concurrently, generate_command, qualified_name, quote_ident
+
+
+@pytest.mark.parametrize("name, quoted", [
+    ("orders_email_idx", "orders_email_idx"),
+    ("_orders2", "_orders2"),
+    ("Orders", '"Orders"'),
+    ("2fa_idx", '"2fa_idx"'),
+    ("order", '"order"'),
+    ("user", '"user"'),
+    # A column name keyword from PostgreSQL 17 on, quoted for every version.
+    ("json_table", '"json_table"'),
+    ("index", "index"),
+    ('say "hi"', '"say ""hi"""'),
+    ("price$", '"price$"'),
+    ("größe", '"größe"'),
+])
+def test_quote_ident_matches_postgresql(name, quoted):
+    assert quote_ident(name) == quoted
+
+
+def test_generate_command_quotes_schema_and_index_names():
+    assert generate_command("Bloated", "Sales", "order") == 'REINDEX INDEX CONCURRENTLY "Sales"."order";'
+    assert generate_command("Invalid Index", "public", 'idx "a"') == 'DROP INDEX CONCURRENTLY public."idx ""a""";'
+    assert qualified_name("public", "orders") == "public.orders"
+
+
+@pytest.mark.parametrize("definition, concurrent_definition", [
+    ("CREATE INDEX orders_email_idx ON public.orders USING btree (email)",
+     "CREATE INDEX CONCURRENTLY orders_email_idx ON public.orders USING btree (email)"),
+    ("CREATE UNIQUE INDEX orders_pkey ON public.orders USING btree (id)",
+     "CREATE UNIQUE INDEX CONCURRENTLY orders_pkey ON public.orders USING btree (id)"),
+    ('CREATE INDEX "CREATE INDEX x" ON public."CREATE INDEX y" USING btree ("CREATE UNIQUE INDEX z")',
+     'CREATE INDEX CONCURRENTLY "CREATE INDEX x" ON public."CREATE INDEX y" USING btree ("CREATE UNIQUE INDEX z")'),
+])
+def test_add_concurrently_only_rewrites_the_statement_prefix(definition, concurrent_definition):
+    assert add_concurrently(definition) == concurrent_definition